@@ -0,0 +1,59 @@
+"""
+Micro-benchmark: compiled BannedTermMatcher vs. the old per-term substring loop.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_banned_words
+"""
+
+import random
+import string
+import timeit
+
+from src.validators import BannedTermMatcher
+
+TERM_COUNTS = (10, 1_000, 10_000)
+REQUEST = (
+    "A story about a shy dragon named Ember who lives at the edge of a quiet "
+    "forest and wants to make friends with the rabbits, owls and foxes, but "
+    "is worried that her warm breath might scare them away at bedtime. "
+) * 4
+
+
+def _random_terms(count: int, seed: int = 7) -> list[str]:
+    rng = random.Random(seed)
+    terms = set()
+    while len(terms) < count:
+        length = rng.randint(4, 10)
+        terms.add("".join(rng.choice(string.ascii_lowercase) for _ in range(length)))
+    return sorted(terms)
+
+
+def _loop_search(terms: list[str], text: str) -> bool:
+    lowered = text.lower().strip()
+    for word in terms:
+        if word in lowered:
+            return True
+    return False
+
+
+def main() -> None:
+    print(f"{'terms':>8} {'loop us/call':>14} {'matcher us/call':>16} {'speedup':>9} {'compile ms':>11}")
+    for count in TERM_COUNTS:
+        terms = _random_terms(count)
+
+        started = timeit.default_timer()
+        matcher = BannedTermMatcher(terms)
+        compile_ms = (timeit.default_timer() - started) * 1000
+
+        number = max(20, 20_000 // count)
+        loop_us = timeit.timeit(lambda: _loop_search(terms, REQUEST), number=number) / number * 1e6
+        matcher_us = timeit.timeit(lambda: matcher.search(REQUEST), number=number) / number * 1e6
+        print(
+            f"{count:>8} {loop_us:>14.1f} {matcher_us:>16.1f} "
+            f"{loop_us / matcher_us:>8.1f}x {compile_ms:>11.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+OpenAI-compatible stub backend for load tests.
+
+Serves /v1/chat/completions (plain and streamed) with configurable latency,
+failure rate and judge PASS ratio, plus a /jwks.json document so the API can
+verify benchmark tokens without Supabase. Stages are told apart the same way
+the tests do it: by the system prompt.
+
+Run standalone from the repository root:
+
+    python -m benchmarks.fake_llm --port 9100 --latency lognormal:0.4:0.5 \
+        --generate-latency lognormal:2.0:0.4 --failure-rate 0.02 --pass-ratio 0.8
+
+and point the API at it with OPENAI_BASE_URL=http://127.0.0.1:9100/v1.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass, field
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from src.prompts import FUSED_SYSTEM_PROMPT, JUDGE_SYSTEM_PROMPT, STORYTELLER_SYSTEM_PROMPT
+
+STORY_WORDS = (
+    "the little fox wandered through a quiet meadow under silver stars while "
+    "soft winds hummed old songs and fireflies drew slow circles in the air"
+).split()
+STORY_ENDING = "At last everyone smiled, safe and happy together, and drifted into a peaceful sleep."
+
+
+@dataclass(frozen=True)
+class LatencyModel:
+    """
+    Seconds to wait before answering. `kind` is "fixed" (a), "uniform"
+    (between a and b) or "lognormal" (median a, shape b).
+    """
+
+    kind: str = "fixed"
+    a: float = 0.0
+    b: float = 0.0
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        kind, *params = spec.split(":")
+        values = [float(value) for value in params] + [0.0, 0.0]
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        return cls(kind, values[0], values[1])
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "uniform":
+            return rng.uniform(self.a, self.b)
+        if self.kind == "lognormal":
+            return rng.lognormvariate(math.log(self.a), self.b) if self.a > 0 else 0.0
+        return self.a
+
+
+@dataclass
+class FakeLLMConfig:
+    latency: LatencyModel = field(default_factory=LatencyModel)
+    generate_latency: LatencyModel | None = None
+    failure_rate: float = 0.0
+    failure_status: int = 500
+    pass_ratio: float = 1.0
+    story_words: int = 450
+    seed: int | None = None
+
+
+def build_story(word_count: int, rng: random.Random) -> str:
+    body_words = max(1, word_count - len(STORY_ENDING.split()))
+    body = " ".join(rng.choice(STORY_WORDS) for _ in range(body_words))
+    return f"{body.capitalize()}.\n{STORY_ENDING}"
+
+
+def _judge_payload(passed: bool) -> dict:
+    score = 4 if passed else 2
+    return {
+        "scores": {
+            name: {"score": score, "reason": "stub"}
+            for name in ("age_appropriateness", "story_structure", "engagement", "request_alignment")
+        },
+        "verdict": "PASS" if passed else "FAIL",
+        "improvement_feedback": "" if passed else "Make the middle of the story gentler.",
+    }
+
+
+def _classification_payload() -> dict:
+    return {"theme": "friendship", "tone": "calm", "genre": "fantasy"}
+
+
+def _stage(messages: list[dict]) -> str:
+    system_prompt = next((m.get("content") for m in messages if m.get("role") == "system"), None)
+    if system_prompt == STORYTELLER_SYSTEM_PROMPT:
+        return "generate"
+    if system_prompt == JUDGE_SYSTEM_PROMPT:
+        return "judge"
+    if system_prompt == FUSED_SYSTEM_PROMPT:
+        return "fused"
+    return "classify"
+
+
+def _approx_tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def create_app(config: FakeLLMConfig, jwks: dict | None = None) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(config.seed)
+    app.state.calls = {"classify": 0, "generate": 0, "judge": 0, "fused": 0, "failed": 0}
+
+    @app.get("/jwks.json")
+    def get_jwks():
+        return jwks or {"keys": []}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        messages = body.get("messages", [])
+        stage = _stage(messages)
+        model = body.get("model", "fake-model")
+        app.state.calls[stage] += 1
+
+        writes_story = stage in ("generate", "fused")
+        latency = config.generate_latency if writes_story and config.generate_latency else config.latency
+        await asyncio.sleep(latency.sample(rng))
+
+        if rng.random() < config.failure_rate:
+            app.state.calls["failed"] += 1
+            return JSONResponse(
+                status_code=config.failure_status,
+                content={"error": {"message": "Injected failure.", "type": "server_error"}},
+            )
+
+        if stage == "generate":
+            content = build_story(config.story_words, rng)
+        elif stage == "judge":
+            content = json.dumps(_judge_payload(rng.random() < config.pass_ratio))
+        elif stage == "fused":
+            payload = _judge_payload(rng.random() < config.pass_ratio)
+            content = json.dumps({"story": build_story(config.story_words, rng), **payload})
+        else:
+            content = json.dumps(_classification_payload())
+
+        prompt_tokens = sum(_approx_tokens(m.get("content") or "") for m in messages)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": _approx_tokens(content),
+            "total_tokens": prompt_tokens + _approx_tokens(content),
+        }
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": content},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            }
+
+        include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+        def chunk(delta: dict, finish_reason=None, chunk_usage=None) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if chunk_usage else [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            if chunk_usage:
+                payload["usage"] = chunk_usage
+            return f"data: {json.dumps(payload)}\n\n"
+
+        async def events():
+            words = content.split(" ")
+            for index, word in enumerate(words):
+                yield chunk({"content": word if index == 0 else " " + word})
+            yield chunk({}, finish_reason="stop")
+            if include_usage:
+                yield chunk({}, chunk_usage=usage)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def add_backend_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--latency", default="fixed:0.2", help="classify/judge latency, e.g. lognormal:0.4:0.5")
+    parser.add_argument("--generate-latency", default=None, help="storyteller latency; defaults to --latency")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--failure-status", type=int, default=500)
+    parser.add_argument("--pass-ratio", type=float, default=1.0)
+    parser.add_argument("--story-words", type=int, default=450)
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--jwks-file", default=None, help="JSON JWKS document to serve at /jwks.json")
+    add_backend_arguments(parser)
+    return parser.parse_args()
+
+
+def config_from_args(args: argparse.Namespace) -> FakeLLMConfig:
+    return FakeLLMConfig(
+        latency=LatencyModel.parse(args.latency),
+        generate_latency=LatencyModel.parse(args.generate_latency) if args.generate_latency else None,
+        failure_rate=args.failure_rate,
+        failure_status=args.failure_status,
+        pass_ratio=args.pass_ratio,
+        story_words=args.story_words,
+        seed=args.seed,
+    )
+
+
+def main() -> None:
+    args = _parse_args()
+    jwks = None
+    if args.jwks_file:
+        with open(args.jwks_file, encoding="utf-8") as jwks_file:
+            jwks = json.load(jwks_file)
+    uvicorn.run(create_app(config_from_args(args), jwks), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
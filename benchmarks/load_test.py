@@ -0,0 +1,332 @@
+"""
+Load test for the story API against the fake LLM backend.
+
+Starts benchmarks.fake_llm in-process, then for each worker count launches
+`uvicorn src.api:app --workers N` pointed at it and drives /story at each
+concurrency level. Every virtual user gets its own signed token, and every
+request has a distinct prompt, so caches, coalescing and per-user limits do
+not flatter the numbers.
+
+Run from the repository root:
+
+    python -m benchmarks.load_test --workers 1,2 --concurrency 1,8,32,64 \
+        --requests 200 --generate-latency lognormal:2.0:0.4
+
+Results (throughput, p50/p95/p99, error rate and RSS per worker) are printed
+and written as JSON to benchmarks/results/. Pass --baseline with an earlier
+results file to print the change per (workers, concurrency) cell.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import httpx
+import uvicorn
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+from benchmarks.fake_llm import add_backend_arguments, config_from_args, create_app
+
+ISSUER = "https://bench.invalid/auth/v1"
+AUDIENCE = "authenticated"
+KEY_ID = "bench-key"
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TokenMinter:
+    def __init__(self) -> None:
+        self._private_pem = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        public_jwk = jwk.construct(self._private_pem, "RS256").public_key().to_dict()
+        self.jwks = {"keys": [{**public_jwk, "kid": KEY_ID, "alg": "RS256"}]}
+
+    def token(self, subject: str) -> str:
+        claims = {"sub": subject, "aud": AUDIENCE, "iss": ISSUER, "exp": int(time.time()) + 3600}
+        return jwt.encode(claims, self._private_pem, algorithm="RS256", headers={"kid": KEY_ID})
+
+
+class BackgroundServer:
+    """
+    Runs a uvicorn server for an ASGI app on a daemon thread.
+    """
+
+    def __init__(self, app, port: int) -> None:
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    def __enter__(self) -> "BackgroundServer":
+        self.thread.start()
+        while not self.server.started:
+            time.sleep(0.05)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+
+def _api_env(backend_url: str, extra_env: dict[str, str]) -> dict[str, str]:
+    env = dict(os.environ)
+    env.update(
+        {
+            "OPENAI_API_KEY": "bench-key",
+            "OPENAI_BASE_URL": f"{backend_url}/v1",
+            "SUPABASE_JWKS_URL": f"{backend_url}/jwks.json",
+            "SUPABASE_ISSUER": ISSUER,
+            "SUPABASE_AUDIENCE": AUDIENCE,
+            "RATE_LIMIT_MAX_REQUESTS": "1000000",
+            "USER_MAX_CONCURRENT_REQUESTS": "0",
+            "STORY_CACHE_MAX_ENTRIES": "0",
+        }
+    )
+    env.update(extra_env)
+    return env
+
+
+def start_api(workers: int, port: int, env: dict[str, str]) -> subprocess.Popen:
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src.api:app", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"API exited with code {process.returncode} during startup.")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health", timeout=1).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("API did not become healthy within 30s.")
+
+
+def _children(pid: int) -> list[int]:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children", encoding="utf-8") as children:
+            return [int(child) for child in children.read().split()]
+    except OSError:
+        return []
+
+
+def _rss_mb(pid: int) -> float | None:
+    try:
+        with open(f"/proc/{pid}/status", encoding="utf-8") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def process_rss_mb(pid: int) -> dict:
+    """
+    RSS of the uvicorn supervisor and each worker process; None values on
+    platforms without /proc.
+    """
+    workers = [rss for rss in (_rss_mb(child) for child in _children(pid)) if rss is not None]
+    supervisor = _rss_mb(pid)
+    return {
+        "supervisor": round(supervisor, 1) if supervisor is not None else None,
+        "per_worker": [round(rss, 1) for rss in workers],
+        "total": round((supervisor or 0) + sum(workers), 1) if supervisor is not None else None,
+    }
+
+
+def percentile(sorted_values: list[float], pct: float) -> float | None:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return None
+    rank = max(1, min(len(sorted_values), int(-(-pct * len(sorted_values) // 100))))
+    return sorted_values[rank - 1]
+
+
+async def run_level(base_url: str, minter: TokenMinter, concurrency: int, total_requests: int, run_id: str) -> dict:
+    """
+    Sends `total_requests` POST /story requests from `concurrency` virtual
+    users, each waiting for its previous response before sending the next.
+    """
+    latencies: list[float] = []
+    status_codes: dict[str, int] = {}
+    next_index = iter(range(total_requests))
+
+    async def virtual_user(client: httpx.AsyncClient, user_index: int) -> None:
+        headers = {"Authorization": f"Bearer {minter.token(f'bench-{run_id}-{user_index}')}"}
+        for index in next_index:
+            payload = {"user_input": f"A gentle bedtime story about a sleepy owl, take {run_id}-{index}"}
+            started_at = time.perf_counter()
+            try:
+                response = await client.post("/story", json=payload, headers=headers)
+                code = str(response.status_code)
+            except httpx.HTTPError as exc:
+                code = type(exc).__name__
+            latencies.append(time.perf_counter() - started_at)
+            status_codes[code] = status_codes.get(code, 0) + 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+        started_at = time.perf_counter()
+        await asyncio.gather(*(virtual_user(client, user) for user in range(concurrency)))
+        elapsed = time.perf_counter() - started_at
+
+    latencies.sort()
+    errors = sum(count for code, count in status_codes.items() if code != "200")
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "duration_seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 3) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else None,
+            "p50": round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+            "p95": round(percentile(latencies, 95) * 1000, 1) if latencies else None,
+            "p99": round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+            "max": round(latencies[-1] * 1000, 1) if latencies else None,
+        },
+        "status_codes": status_codes,
+    }
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: list[dict], baseline: dict) -> None:
+    previous = {(row["workers"], row["concurrency"]): row for row in baseline.get("results", [])}
+    print(f"\nvs. baseline {baseline.get('git_commit')} ({baseline.get('timestamp')}):")
+    print(f"{'workers':>8} {'conc':>5} {'rps':>14} {'p95 ms':>18} {'error rate':>18}")
+    for row in results:
+        old = previous.get((row["workers"], row["concurrency"]))
+        if old is None:
+            continue
+
+        def change(new_value, old_value):
+            if not old_value or new_value is None:
+                return f"{new_value}"
+            return f"{new_value} ({(new_value - old_value) / old_value:+.0%})"
+
+        print(
+            f"{row['workers']:>8} {row['concurrency']:>5} "
+            f"{change(row['throughput_rps'], old['throughput_rps']):>14} "
+            f"{change(row['latency_ms']['p95'], old['latency_ms']['p95']):>18} "
+            f"{row['error_rate']:>8} (was {old['error_rate']})"
+        )
+
+
+def _int_list(raw: str) -> list[int]:
+    return [int(value) for value in raw.split(",") if value.strip()]
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=_int_list, default=[1], help="uvicorn worker counts, e.g. 1,2,4")
+    parser.add_argument("--concurrency", type=_int_list, default=[1, 8, 32], help="virtual users per level")
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE", help="extra API settings")
+    parser.add_argument("--output", default=RESULTS_DIR, help="directory for the JSON results")
+    parser.add_argument("--baseline", default=None, help="earlier results file to compare against")
+    add_backend_arguments(parser)
+    return parser.parse_args()
+
+
+def main() -> None:
+    args = _parse_args()
+    minter = TokenMinter()
+    backend_port = _free_port()
+    backend_url = f"http://127.0.0.1:{backend_port}"
+    extra_env = dict(item.split("=", 1) for item in args.env)
+    run_id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    results = []
+
+    backend = create_app(config_from_args(args), minter.jwks)
+    with BackgroundServer(backend, backend_port):
+        for workers in args.workers:
+            api_port = _free_port()
+            api = start_api(workers, api_port, _api_env(backend_url, extra_env))
+            try:
+                for concurrency in args.concurrency:
+                    calls_before = dict(backend.state.calls)
+                    row = asyncio.run(
+                        run_level(f"http://127.0.0.1:{api_port}", minter, concurrency, args.requests, f"{run_id}-{workers}")
+                    )
+                    row = {
+                        "workers": workers,
+                        **row,
+                        "rss_mb": process_rss_mb(api.pid),
+                        # LLM calls per stage, including ones the OpenAI client retried.
+                        "backend_calls": {
+                            stage: count - calls_before[stage] for stage, count in backend.state.calls.items()
+                        },
+                    }
+                    results.append(row)
+                    print(
+                        f"workers={workers} concurrency={concurrency} rps={row['throughput_rps']} "
+                        f"p50={row['latency_ms']['p50']}ms p95={row['latency_ms']['p95']}ms "
+                        f"p99={row['latency_ms']['p99']}ms errors={row['error_rate']:.2%} "
+                        f"rss={row['rss_mb']['total']}MB"
+                    )
+            finally:
+                api.terminate()
+                api.wait(timeout=30)
+
+    report = {
+        "timestamp": run_id,
+        "git_commit": _git_commit(),
+        "python": sys.version.split()[0],
+        "backend": {
+            "latency": args.latency,
+            "generate_latency": args.generate_latency,
+            "failure_rate": args.failure_rate,
+            "failure_status": args.failure_status,
+            "pass_ratio": args.pass_ratio,
+            "story_words": args.story_words,
+        },
+        "api_env": extra_env,
+        "requests_per_level": args.requests,
+        "results": results,
+    }
+    os.makedirs(args.output, exist_ok=True)
+    path = os.path.join(args.output, f"{run_id}-{report['git_commit'] or 'unknown'}.json")
+    with open(path, "w", encoding="utf-8") as output:
+        json.dump(report, output, indent=2)
+    print(f"\nWrote {path}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline:
+            compare(results, json.load(baseline))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,105 @@
+import asyncio
+import json
+import math
 import time
 import uuid
-from typing import Dict, Optional, Tuple
+from contextlib import asynccontextmanager
+from typing import Optional
 
 import uvicorn
 from fastapi import FastAPI, Request, Depends
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
 from src.config import settings
+from src.deadlines import DEADLINE_HEADER, Deadline, request_deadline
 from src.logging_utils import get_logger, log_event
-from src.story_engine import run_story_engine
+from src.metrics import (
+    CONTENT_TYPE_LATEST,
+    QUOTA_REJECTIONS,
+    RATE_LIMIT_REJECTIONS,
+    REGISTRY,
+    REQUESTS_IN_FLIGHT,
+    STORY_BATCH_ITEMS,
+    STORY_REQUEST_LATENCY,
+)
+from src.story_engine import (
+    is_error_story,
+    lookup_classification,
+    run_revision_engine_async,
+    run_story_engine_async,
+    stream_story_engine,
+)
 from src.auth import get_current_user
+from src.jobs import (
+    InMemoryJobStore,
+    JobQueueFull,
+    JobWorkerPool,
+    SQLiteJobStore,
+    StoryJob,
+)
+from src.quotas import QuotaExceeded, QuotaLease, UserQuotas
+from src.rate_limit import (
+    InMemoryTokenBucketBackend,
+    RateLimitDecision,
+    RateLimiter,
+    RateLimitRule,
+    RedisTokenBucketBackend,
+    parse_route_rules,
+    retry_after_header,
+)
+from src.sessions import story_sessions
+from src.tracing import start_span
+from src.usage import UsageLedger, user_usage
+from src.utils import close_clients
 
-_rate_limit_state: Dict[str, Tuple[float, int]] = {}
+_rate_limit_backend = (
+    RedisTokenBucketBackend(settings.rate_limit_redis_url)
+    if settings.rate_limit_redis_url
+    else InMemoryTokenBucketBackend(max_keys=settings.rate_limit_max_keys)
+)
+# Per-user limits, applied after authentication.
+_rate_limiter = RateLimiter(
+    backend=_rate_limit_backend,
+    default_rule=RateLimitRule.per_window(
+        settings.rate_limit_max_requests, settings.rate_limit_window_seconds
+    ),
+    route_rules=parse_route_rules(settings.rate_limit_route_rules_raw),
+    exempt_paths=set(settings.rate_limit_exempt_paths),
+)
+# Per-IP limit on every request, checked in the middleware before any token
+# is parsed, so unauthenticated floods are cut off cheaply.
+_ip_rate_limiter = (
+    RateLimiter(
+        backend=_rate_limit_backend,
+        default_rule=RateLimitRule.per_window(
+            settings.rate_limit_ip_max_requests, settings.rate_limit_window_seconds
+        ),
+        exempt_paths=set(settings.rate_limit_ip_exempt_paths),
+    )
+    if settings.rate_limit_ip_max_requests
+    else None
+)
+IP_RATE_LIMIT_BUCKET = "ip"
+_user_quotas = UserQuotas(
+    max_concurrent=settings.user_max_concurrent_requests,
+    request_quota=settings.user_request_quota,
+    token_quota=settings.user_token_quota,
+    window_seconds=settings.user_quota_window_seconds,
+    max_users=settings.usage_max_tracked_users,
+)
 _logger = get_logger()
 
 class StoryRequest(BaseModel):
     user_input: str = Field(..., min_length=1, max_length=settings.max_input_chars)
     feedback: Optional[str] = None
+    candidates: Optional[int] = Field(default=None, ge=1, le=settings.max_speculative_candidates)
+    use_cache: bool = True
+    # Overrides STORY_PIPELINE_MODE for this request; /story/stream always
+    # streams the two-call pipeline.
+    pipeline_mode: Optional[str] = Field(default=None, pattern="^(two_call|fused)$")
 
 class StoryResponse(BaseModel):
     story: str
@@ -26,8 +107,100 @@ class StoryResponse(BaseModel):
     error: Optional[str] = None
     status: str = "success"
     request_id: Optional[str] = None
+    usage: Optional[dict] = None
+    story_id: Optional[str] = None
+
+class RevisionRequest(BaseModel):
+    feedback: str = Field(..., min_length=1, max_length=settings.max_input_chars)
+
+class StoryBatchRequest(BaseModel):
+    items: list[StoryRequest] = Field(..., min_length=1, max_length=settings.story_batch_max_items)
+
+class StoryJobResponse(BaseModel):
+    job_id: str
+    status: str
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[StoryResponse] = None
+    queue_depth: Optional[int] = None
+    request_id: Optional[str] = None
 
-app = FastAPI()
+
+async def _run_story_job(job: StoryJob) -> dict:
+    """
+    Worker-side body of POST /story/jobs: runs the engine for a queued job
+    and returns its StoryResponse payload.
+    """
+    payload = job.payload
+    request_id = payload.get("request_id")
+    usage = UsageLedger()
+    try:
+        with start_span("story.job", request_id=request_id, job_id=job.job_id):
+            story = await run_story_engine_async(
+                payload["user_input"],
+                payload.get("feedback"),
+                request_id=request_id,
+                candidates=payload.get("candidates"),
+                use_cache=payload.get("use_cache", True),
+                usage=usage,
+                mode=payload.get("pipeline_mode"),
+            )
+    finally:
+        _record_user_usage(request_id, job.subject, usage)
+        lease = _job_leases.pop(job.job_id, None)
+        if lease is not None:
+            lease.release()
+
+    if is_error_story(story):
+        response = StoryResponse(
+            story="",
+            error=story or "Story generation failed.",
+            status="error",
+            request_id=request_id,
+            usage=usage.summary(),
+        )
+    else:
+        response = StoryResponse(
+            story=story,
+            feedback=payload.get("feedback"),
+            request_id=request_id,
+            usage=usage.summary(),
+            story_id=_start_story_session(job.subject, payload["user_input"], story),
+        )
+    return response.model_dump()
+
+
+_job_pool = JobWorkerPool(
+    store=(
+        SQLiteJobStore(
+            settings.job_store_sqlite_path,
+            result_ttl_seconds=settings.job_result_ttl_seconds,
+            lease_seconds=settings.job_lease_seconds,
+        )
+        if settings.job_store_sqlite_path
+        else InMemoryJobStore(
+            max_jobs=settings.job_store_max_jobs,
+            result_ttl_seconds=settings.job_result_ttl_seconds,
+        )
+    ),
+    handler=_run_story_job,
+    workers=settings.job_workers,
+    max_queue_size=settings.job_queue_max_size,
+    heartbeat_seconds=settings.job_lease_seconds / 3,
+)
+# Quota leases held by queued and running jobs, released when the job ends.
+_job_leases: dict[str, QuotaLease] = {}
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    _job_pool.start()
+    yield
+    await _job_pool.stop()
+    await close_clients()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -45,21 +218,25 @@ async def request_context(request: Request, call_next):
     request.state.request_id = request_id
 
     client_ip = request.client.host if request.client else "unknown"
-    window_start, count = _rate_limit_state.get(client_ip, (time.time(), 0))
-    now = time.time()
-    if now - window_start > settings.rate_limit_window_seconds:
-        window_start, count = now, 0
-    count += 1
-    _rate_limit_state[client_ip] = (window_start, count)
-    if count > settings.rate_limit_max_requests:
-        response = JSONResponse(
-            status_code=429,
-            content={"status": "error", "error": "Rate limit exceeded.", "request_id": request_id},
-        )
-    else:
-        response = await call_next(request)
+    with start_span(
+        f"HTTP {request.method}",
+        traceparent=request.headers.get("traceparent"),
+        request_id=request_id,
+        **{"http.method": request.method, "url.path": request.url.path},
+    ) as span:
+        decision = await _check_ip_rate_limit(request, client_ip)
+        if decision is not None:
+            response = _rate_limited_response(request, decision)
+        else:
+            response = await call_next(request)
+        route = request.scope.get("route")
+        span.set_attributes(**{"http.route": getattr(route, "path", None), "http.status_code": response.status_code})
+        if response.status_code >= 500:
+            span.record_error(f"HTTP {response.status_code}")
 
     response.headers["X-Request-Id"] = request_id
+    if span.trace_id:
+        response.headers["X-Trace-Id"] = span.trace_id
     duration_ms = int((time.monotonic() - started_at) * 1000)
     log_event(
         _logger,
@@ -73,12 +250,150 @@ async def request_context(request: Request, call_next):
     )
     return response
 
+class RateLimitExceeded(Exception):
+    def __init__(self, decision: RateLimitDecision):
+        self.decision = decision
+
+
+def _rate_limited_response(request: Request, decision: RateLimitDecision) -> JSONResponse:
+    return JSONResponse(
+        status_code=429,
+        content={
+            "status": "error",
+            "error": "Rate limit exceeded.",
+            "request_id": getattr(request.state, "request_id", None),
+        },
+        headers={"Retry-After": retry_after_header(decision)},
+    )
+
+
+@app.exception_handler(RateLimitExceeded)
+async def rate_limit_exceeded_handler(request: Request, exc: RateLimitExceeded):
+    return _rate_limited_response(request, exc.decision)
+
+
+@app.exception_handler(QuotaExceeded)
+async def quota_exceeded_handler(request: Request, exc: QuotaExceeded):
+    return JSONResponse(
+        status_code=429,
+        content={
+            "status": "error",
+            "error": exc.message,
+            "limit": exc.limit,
+            "request_id": getattr(request.state, "request_id", None),
+        },
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after_seconds)))},
+    )
+
+
+def _client_subject(request: Request, current_user: dict) -> str:
+    """
+    Key for per-caller limits: the user's `sub`, or the client IP when the
+    token has none.
+    """
+    user_id = current_user.get("sub")
+    client_ip = request.client.host if request.client else "unknown"
+    return f"user:{user_id}" if user_id else f"ip:{client_ip}"
+
+
+def _acquire_user_quota(http_request: Request, current_user: dict, count_request: bool = True):
+    """
+    Takes one of the caller's generation slots before any LLM work starts.
+    Raises QuotaExceeded (429) when a per-user limit is hit.
+    """
+    subject = _client_subject(http_request, current_user)
+    try:
+        return _user_quotas.acquire(subject, count_request=count_request)
+    except QuotaExceeded as exc:
+        log_event(
+            _logger,
+            "user_quota_exceeded",
+            request_id=getattr(http_request.state, "request_id", None),
+            user_id=current_user.get("sub"),
+            limit=exc.limit,
+            retry_after_seconds=round(exc.retry_after_seconds, 3),
+        )
+        QUOTA_REJECTIONS.inc(limit=exc.limit)
+        raise
+
+
+async def _check_ip_rate_limit(request: Request, client_ip: str) -> RateLimitDecision | None:
+    """
+    Pre-auth limit: one bucket per client IP shared by all routes, so
+    requests with missing or forged tokens are limited before any JWT work.
+    Returns the decision only when the request is rejected.
+    """
+    if _ip_rate_limiter is None:
+        return None
+    decision = await _ip_rate_limiter.check_async(f"ip:{client_ip}", request.url.path, bucket=IP_RATE_LIMIT_BUCKET)
+    if decision is None or decision.allowed:
+        return None
+    log_event(
+        _logger,
+        "rate_limit_exceeded",
+        request_id=getattr(request.state, "request_id", None),
+        client_ip=client_ip,
+        path=request.url.path,
+        scope="ip",
+        retry_after_seconds=round(decision.retry_after_seconds, 3),
+    )
+    # Labelled by bucket rather than URL so scanners cannot blow up the label set.
+    RATE_LIMIT_REJECTIONS.inc(path=IP_RATE_LIMIT_BUCKET)
+    return decision
+
+
+def enforce_rate_limit(request: Request, current_user: dict = Depends(get_current_user)) -> dict:
+    """
+    Authenticates the caller, then applies the route's token-bucket rule
+    keyed by the user's `sub` (or client IP when the token has none), on top
+    of the per-IP limit already checked by the middleware.
+    """
+    user_id = current_user.get("sub")
+    subject = _client_subject(request, current_user)
+    route = request.scope.get("route")
+    path = getattr(route, "path", request.url.path)
+
+    decision = _rate_limiter.check(subject, path)
+    if decision is not None and not decision.allowed:
+        log_event(
+            _logger,
+            "rate_limit_exceeded",
+            request_id=getattr(request.state, "request_id", None),
+            user_id=user_id,
+            path=path,
+            retry_after_seconds=round(decision.retry_after_seconds, 3),
+        )
+        RATE_LIMIT_REJECTIONS.inc(path=path)
+        raise RateLimitExceeded(decision)
+    return current_user
+
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
 
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type=CONTENT_TYPE_LATEST)
+
+
 @app.post("/story")
-def generate_story(request: StoryRequest, http_request: Request, current_user: dict = Depends(get_current_user)):
+async def generate_story(request: StoryRequest, http_request: Request, current_user: dict = Depends(enforce_rate_limit)):
+    started_at = time.monotonic()
+    status = "error"
+    lease = _acquire_user_quota(http_request, current_user)
+    with REQUESTS_IN_FLIGHT.track_in_progress(route="/story"):
+        try:
+            response = await _generate_story(request, http_request, current_user)
+            status = "error" if isinstance(response, JSONResponse) else "success"
+            return response
+        finally:
+            lease.release()
+            STORY_REQUEST_LATENCY.observe(time.monotonic() - started_at, route="/story", status=status)
+
+
+async def _generate_story(request: StoryRequest, http_request: Request, current_user: dict):
     try:
         request_id = getattr(http_request.state, "request_id", None)
         user_id = current_user.get("sub")
@@ -97,29 +412,37 @@ def generate_story(request: StoryRequest, http_request: Request, current_user: d
             user_id=user_id,
             status="started",
         )
-        story = run_story_engine(
-            request.user_input,
-            request.feedback,
-            request_id=request_id,
-        )
-        lower_story = story.lower() if isinstance(story, str) else ""
-        if (
-            not story
-            or lower_story.startswith("sorry,")
-            or "not appropriate" in lower_story
-            or "cannot be empty" in lower_story
-        ):
+        usage = UsageLedger()
+        try:
+            story = await run_story_engine_async(
+                request.user_input,
+                request.feedback,
+                request_id=request_id,
+                candidates=request.candidates,
+                use_cache=request.use_cache,
+                usage=usage,
+                mode=request.pipeline_mode,
+                deadline=request_deadline(http_request.headers.get(DEADLINE_HEADER)),
+            )
+        finally:
+            _record_user_usage(request_id, _client_subject(http_request, current_user), usage)
+        if is_error_story(story):
             response = StoryResponse(
                 story="",
                 error=story or "Story generation failed.",
                 status="error",
                 request_id=request_id,
+                usage=usage.summary(),
             )
             return JSONResponse(status_code=400, content=response.model_dump())
         return StoryResponse(
             story=story,
             feedback=request.feedback,
             request_id=request_id,
+            usage=usage.summary(),
+            story_id=_start_story_session(
+                _client_subject(http_request, current_user), request.user_input, story
+            ),
         )
     except Exception as e:
         request_id = getattr(http_request.state, "request_id", None)
@@ -138,5 +461,406 @@ def generate_story(request: StoryRequest, http_request: Request, current_user: d
         )
         return JSONResponse(status_code=500, content=response.model_dump())
 
+
+def _start_story_session(subject: str, user_input: str, story: str) -> str | None:
+    """
+    Keeps a finished story server-side for revisions and returns its id, or
+    None when sessions are disabled.
+    """
+    if not story_sessions.enabled:
+        return None
+    return story_sessions.create(subject, user_input, story, lookup_classification(user_input)).story_id
+
+
+def _record_user_usage(request_id: str | None, subject: str, usage: UsageLedger) -> None:
+    """
+    Adds the request's usage to the caller's running totals and token quota,
+    and logs both.
+    """
+    user_totals = user_usage.record(subject, usage)
+    _user_quotas.record_tokens(subject, usage.total.total_tokens)
+    log_event(
+        _logger,
+        "story_usage",
+        request_id=request_id,
+        subject=subject,
+        prompt_tokens=usage.total.prompt_tokens,
+        completion_tokens=usage.total.completion_tokens,
+        total_tokens=usage.total.total_tokens,
+        cost_usd=round(usage.total.cost_usd, 6),
+        user_total_tokens=user_totals.total_tokens,
+        user_cost_usd=round(user_totals.cost_usd, 6),
+    )
+
+
+@app.post("/story/jobs", status_code=202)
+async def submit_story_job(request: StoryRequest, http_request: Request, current_user: dict = Depends(enforce_rate_limit)):
+    request_id = getattr(http_request.state, "request_id", None)
+    if not request.user_input.strip():
+        response = StoryResponse(
+            story="",
+            error="Story request cannot be empty.",
+            status="error",
+            request_id=request_id,
+        )
+        return JSONResponse(status_code=400, content=response.model_dump())
+
+    lease = _acquire_user_quota(http_request, current_user)
+    job = StoryJob(
+        job_id=uuid.uuid4().hex,
+        subject=_client_subject(http_request, current_user),
+        payload={**request.model_dump(), "request_id": request_id},
+    )
+    _job_leases[job.job_id] = lease
+    try:
+        queue_depth = _job_pool.submit(job)
+    except JobQueueFull as exc:
+        _job_leases.pop(job.job_id, None)
+        lease.release()
+        log_event(
+            _logger,
+            "story_job_rejected",
+            request_id=request_id,
+            user_id=current_user.get("sub"),
+            queue_depth=exc.depth,
+            max_queue_size=exc.max_depth,
+        )
+        return JSONResponse(
+            status_code=503,
+            content={
+                "status": "error",
+                "error": "Story job queue is full. Please retry shortly.",
+                "queue_depth": exc.depth,
+                "max_queue_size": exc.max_depth,
+                "request_id": request_id,
+            },
+        )
+
+    log_event(
+        _logger,
+        "story_job_submitted",
+        request_id=request_id,
+        user_id=current_user.get("sub"),
+        job_id=job.job_id,
+        queue_depth=queue_depth,
+    )
+    return StoryJobResponse(**job.public_view(), queue_depth=queue_depth, request_id=request_id)
+
+
+@app.get("/story/jobs/{job_id}")
+async def get_story_job(job_id: str, http_request: Request, current_user: dict = Depends(enforce_rate_limit)):
+    job = _job_pool.store.get(job_id)
+    # Other users' jobs are reported as missing rather than forbidden.
+    if job is None or job.subject != _client_subject(http_request, current_user):
+        return JSONResponse(
+            status_code=404,
+            content={
+                "status": "error",
+                "error": "Job not found.",
+                "request_id": getattr(http_request.state, "request_id", None),
+            },
+        )
+    return StoryJobResponse(**job.public_view(), queue_depth=_job_pool.depth)
+
+
+@app.post("/story/{story_id}/revisions")
+async def revise_story(story_id: str, request: RevisionRequest, http_request: Request, current_user: dict = Depends(enforce_rate_limit)):
+    """
+    Revises a story returned earlier (by id) using the feedback, instead of
+    generating a new story from the original request.
+    """
+    route = "/story/{story_id}/revisions"
+    request_id = getattr(http_request.state, "request_id", None)
+    deadline = request_deadline(http_request.headers.get(DEADLINE_HEADER))
+    subject = _client_subject(http_request, current_user)
+    session = story_sessions.get(story_id, subject)
+    if session is None:
+        response = StoryResponse(
+            story="",
+            error="Story not found or expired. Generate a new story instead.",
+            status="error",
+            request_id=request_id,
+        )
+        return JSONResponse(status_code=404, content=response.model_dump())
+
+    started_at = time.monotonic()
+    status = "error"
+    lease = _acquire_user_quota(http_request, current_user)
+    with REQUESTS_IN_FLIGHT.track_in_progress(route=route):
+        usage = UsageLedger()
+        try:
+            log_event(
+                _logger,
+                "story_revision_request",
+                request_id=request_id,
+                user_id=current_user.get("sub"),
+                story_id=story_id,
+                revision=session.revisions + 1,
+            )
+            story = await run_revision_engine_async(
+                session.story,
+                request.feedback,
+                session.user_input,
+                classification=session.classification,
+                request_id=request_id,
+                usage=usage,
+                deadline=deadline,
+            )
+            if is_error_story(story):
+                response = StoryResponse(
+                    story="",
+                    error=story or "Story revision failed.",
+                    status="error",
+                    request_id=request_id,
+                    usage=usage.summary(),
+                    story_id=story_id,
+                )
+                return JSONResponse(status_code=400, content=response.model_dump())
+
+            story_sessions.revise(session, story)
+            status = "success"
+            return StoryResponse(
+                story=story,
+                feedback=request.feedback,
+                request_id=request_id,
+                usage=usage.summary(),
+                story_id=story_id,
+            )
+        except Exception as e:
+            log_event(
+                _logger,
+                "story_generation_error",
+                request_id=request_id,
+                user_id=current_user.get("sub"),
+                error=str(e),
+                story_id=story_id,
+            )
+            response = StoryResponse(
+                story="",
+                error="Internal server error.",
+                status="error",
+                request_id=request_id,
+            )
+            return JSONResponse(status_code=500, content=response.model_dump())
+        finally:
+            lease.release()
+            _record_user_usage(request_id, subject, usage)
+            STORY_REQUEST_LATENCY.observe(time.monotonic() - started_at, route=route, status=status)
+
+
+def _format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=True)}\n\n"
+
+
+@app.post("/story/stream")
+async def stream_story(request: StoryRequest, http_request: Request, current_user: dict = Depends(enforce_rate_limit)):
+    request_id = getattr(http_request.state, "request_id", None)
+    user_id = current_user.get("sub")
+    subject = _client_subject(http_request, current_user)
+    lease = _acquire_user_quota(http_request, current_user)
+    deadline = request_deadline(http_request.headers.get(DEADLINE_HEADER))
+    log_event(
+        _logger,
+        "story_generation_request",
+        request_id=request_id,
+        user_id=user_id,
+        status="started",
+        stream=True,
+    )
+
+    async def event_source():
+        started_at = time.monotonic()
+        status = "error"
+        usage = UsageLedger()
+        parts = []
+        REQUESTS_IN_FLIGHT.inc(route="/story/stream")
+        try:
+            async for event, data in stream_story_engine(
+                request.user_input,
+                request.feedback,
+                request_id=request_id,
+                use_cache=request.use_cache,
+                usage=usage,
+                deadline=deadline,
+            ):
+                if event == "token":
+                    parts.append(data["text"])
+                elif event == "restart":
+                    parts = []
+                elif event == "final":
+                    status = data.get("status", "error")
+                    if status == "success":
+                        data["story_id"] = _start_story_session(subject, request.user_input, "".join(parts).strip())
+                yield _format_sse(event, data)
+        except Exception as e:
+            log_event(
+                _logger,
+                "story_generation_error",
+                request_id=request_id,
+                user_id=user_id,
+                error=str(e),
+                stream=True,
+            )
+            yield _format_sse(
+                "final",
+                {"status": "error", "error": "Internal server error.", "request_id": request_id},
+            )
+        finally:
+            lease.release()
+            _record_user_usage(request_id, subject, usage)
+            REQUESTS_IN_FLIGHT.dec(route="/story/stream")
+            STORY_REQUEST_LATENCY.observe(time.monotonic() - started_at, route="/story/stream", status=status)
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Frees the slot even if the client disconnects before streaming starts.
+        background=BackgroundTask(lease.release),
+    )
+
+
+async def _run_batch_item(index: int, item: StoryRequest, http_request: Request, current_user: dict, deadline: Deadline | None) -> dict:
+    """
+    Generates the story for one batch item and returns its NDJSON result.
+    Every failure, including a per-user quota, is reported in the result
+    instead of raised, so it does not affect the other items. `deadline` is
+    the whole batch's, so items queued behind the semaphore get less time.
+    """
+    batch_request_id = getattr(http_request.state, "request_id", None)
+    request_id = f"{batch_request_id}-{index}" if batch_request_id else None
+    subject = _client_subject(http_request, current_user)
+    if not item.user_input.strip():
+        response = StoryResponse(
+            story="",
+            error="Story request cannot be empty.",
+            status="error",
+            request_id=request_id,
+        )
+        return {"index": index, **response.model_dump()}
+    try:
+        _user_quotas.admit(subject)
+    except QuotaExceeded as exc:
+        QUOTA_REJECTIONS.inc(limit=exc.limit)
+        response = StoryResponse(story="", error=exc.message, status="error", request_id=request_id)
+        return {"index": index, **response.model_dump(), "limit": exc.limit}
+
+    usage = UsageLedger()
+    try:
+        with start_span("story.batch_item", request_id=request_id, index=index):
+            story = await run_story_engine_async(
+                item.user_input,
+                item.feedback,
+                request_id=request_id,
+                candidates=item.candidates,
+                use_cache=item.use_cache,
+                usage=usage,
+                mode=item.pipeline_mode,
+                deadline=deadline,
+            )
+        if is_error_story(story):
+            response = StoryResponse(
+                story="",
+                error=story or "Story generation failed.",
+                status="error",
+                request_id=request_id,
+                usage=usage.summary(),
+            )
+        else:
+            response = StoryResponse(
+                story=story,
+                feedback=item.feedback,
+                request_id=request_id,
+                usage=usage.summary(),
+                story_id=_start_story_session(subject, item.user_input, story),
+            )
+    except Exception as e:
+        log_event(
+            _logger,
+            "story_generation_error",
+            request_id=request_id,
+            user_id=current_user.get("sub"),
+            error=str(e),
+            batch_index=index,
+        )
+        response = StoryResponse(
+            story="",
+            error="Internal server error.",
+            status="error",
+            request_id=request_id,
+        )
+    finally:
+        _record_user_usage(request_id, subject, usage)
+    return {"index": index, **response.model_dump()}
+
+
+@app.post("/stories/batch")
+async def generate_story_batch(request: StoryBatchRequest, http_request: Request, current_user: dict = Depends(enforce_rate_limit)):
+    """
+    Generates a story for every item, up to STORY_BATCH_CONCURRENCY at a
+    time, and streams each result as an NDJSON line as soon as it is done.
+    Lines arrive in completion order and carry the item's `index`. The
+    batch holds one of the caller's concurrency slots; each item counts
+    against the request and token quotas on its own. All items share one
+    deadline, started when the batch arrives.
+    """
+    route = "/stories/batch"
+    deadline = request_deadline(http_request.headers.get(DEADLINE_HEADER))
+    request_id = getattr(http_request.state, "request_id", None)
+    user_id = current_user.get("sub")
+    lease = _acquire_user_quota(http_request, current_user, count_request=False)
+    log_event(
+        _logger,
+        "story_batch_request",
+        request_id=request_id,
+        user_id=user_id,
+        status="started",
+        items=len(request.items),
+        concurrency=settings.story_batch_concurrency,
+    )
+
+    async def results():
+        started_at = time.monotonic()
+        completed = succeeded = 0
+        semaphore = asyncio.Semaphore(settings.story_batch_concurrency)
+
+        async def run_item(index: int, item: StoryRequest) -> dict:
+            async with semaphore:
+                return await _run_batch_item(index, item, http_request, current_user, deadline)
+
+        tasks = [asyncio.create_task(run_item(index, item)) for index, item in enumerate(request.items)]
+        REQUESTS_IN_FLIGHT.inc(route=route)
+        try:
+            for next_result in asyncio.as_completed(tasks):
+                result = await next_result
+                STORY_BATCH_ITEMS.inc(status=result["status"])
+                completed += 1
+                succeeded += result["status"] == "success"
+                yield json.dumps(result, ensure_ascii=True) + "\n"
+        finally:
+            # A client that disconnects mid-batch stops the remaining items.
+            for task in tasks:
+                task.cancel()
+            lease.release()
+            REQUESTS_IN_FLIGHT.dec(route=route)
+            status = "success" if succeeded == len(tasks) else "error"
+            STORY_REQUEST_LATENCY.observe(time.monotonic() - started_at, route=route, status=status)
+            log_event(
+                _logger,
+                "story_batch_end",
+                request_id=request_id,
+                user_id=user_id,
+                items=len(tasks),
+                completed=completed,
+                succeeded=succeeded,
+            )
+
+    return StreamingResponse(
+        results(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(lease.release),
+    )
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -1,6 +1,7 @@
 import streamlit as st
 from dotenv import load_dotenv
-from src.story_engine import run_story_engine
+from src.story_engine import is_error_story, run_revision_engine, run_story_engine
+from src.validators import validate_user_input
 
 load_dotenv(".env.local")
 
@@ -30,8 +31,11 @@ if st.button("Generate Story"):
 
 # ---- Display Story ----
 if st.session_state.story:
-    st.subheader("📖 Your Bedtime Story")
-    st.write(st.session_state.story)
+    if is_error_story(st.session_state.story):
+        st.warning(st.session_state.story)
+    else:
+        st.subheader("📖 Your Bedtime Story")
+        st.write(st.session_state.story)
 
     st.divider()
     st.subheader("Would you like to change something?")
@@ -53,6 +57,18 @@ if st.session_state.story:
             feedback = st.text_input("What would you like to change?")
 
     if feedback:
-        with st.spinner("Updating the story..."):
-            st.session_state.story = run_story_engine(user_input, feedback=feedback)
-            st.experimental_rerun()
+        is_valid, error_message = validate_user_input(feedback)
+        if not is_valid:
+            st.warning(error_message)
+        else:
+            with st.spinner("Updating the story..."):
+                # Edit the current story; only regenerate if there is none yet.
+                if is_error_story(st.session_state.story):
+                    result = run_story_engine(user_input, feedback=feedback)
+                else:
+                    result = run_revision_engine(st.session_state.story, feedback, user_input)
+            if is_error_story(result):
+                st.warning(result)
+            else:
+                st.session_state.story = result
+                st.experimental_rerun()
@@ -1,4 +1,6 @@
+import hashlib
 import json
+import threading
 import time
 import urllib.error
 import urllib.request
@@ -6,23 +8,22 @@ from typing import Any
 
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jose import JWTError, jwt
+from jose import JWTError, jwk, jwt
+from jose.exceptions import JWKError
+from src.cache import TTLCache
 from src.config import settings
+from src.logging_utils import get_logger, log_event
+from src.tracing import current_span, start_span
 
 security = HTTPBearer(auto_error=False)
 
-_jwks_cache: dict[str, Any] | None = None
-_jwks_cache_ts = 0.0
+_logger = get_logger()
 
+# Algorithm to use for a JWK that does not declare its own "alg".
+_DEFAULT_ALGORITHMS = {"RSA": "RS256", "EC": "ES256"}
 
-def _fetch_jwks() -> dict[str, Any]:
-    global _jwks_cache
-    global _jwks_cache_ts
-
-    now = time.time()
-    if _jwks_cache and (now - _jwks_cache_ts) < settings.supabase_jwks_cache_ttl_seconds:
-        return _jwks_cache
 
+def _fetch_jwks() -> dict[str, Any]:
     if not settings.supabase_jwks_url:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -31,19 +32,191 @@ def _fetch_jwks() -> dict[str, Any]:
 
     try:
         with urllib.request.urlopen(settings.supabase_jwks_url, timeout=5) as response:
-            payload = json.loads(response.read().decode("utf-8"))
+            return json.loads(response.read().decode("utf-8"))
     except (urllib.error.URLError, TimeoutError, json.JSONDecodeError):
         raise HTTPException(
             status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
             detail="Unable to verify authentication at this time.",
         )
 
-    _jwks_cache = payload
-    _jwks_cache_ts = now
-    return payload
+
+def _construct_keys(jwks: dict[str, Any]) -> dict[str, tuple[str, Any]]:
+    """
+    Builds key objects once per JWKS fetch, indexed by kid.
+    Keys that cannot be constructed are skipped.
+    """
+    keys = {}
+    for key_data in jwks.get("keys", []):
+        kid = key_data.get("kid")
+        algorithm = key_data.get("alg") or _DEFAULT_ALGORITHMS.get(key_data.get("kty"))
+        if not kid or not algorithm:
+            continue
+        try:
+            keys[kid] = (algorithm, jwk.construct(key_data, algorithm))
+        except (JWKError, ValueError, TypeError):
+            log_event(_logger, "jwks_key_skipped", kid=kid, algorithm=algorithm)
+    return keys
+
+
+class JwksKeyStore:
+    """
+    Kid-indexed cache of constructed signing keys.
+
+    - Keys are refreshed in a background thread once they are within
+      `refresh_ahead_seconds` of the TTL, so requests never wait on the
+      JWKS endpoint while keys are warm.
+    - Refreshes are single-flight: concurrent callers wait for the one
+      in-progress fetch instead of stampeding the endpoint.
+    - Refreshes are attempted at most once per
+      `min_refresh_interval_seconds`, whether they are due to the TTL or
+      to an unknown kid (key rotation), and whether the last one failed
+      or not, so a JWKS outage does not turn every request into a fetch.
+    - If a refresh fails, the previous keys keep being served, but only
+      until they are `max_stale_seconds` old. After that verification
+      fails closed, so keys the IdP has rotated out are not trusted
+      indefinitely.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float,
+        refresh_ahead_seconds: float,
+        min_refresh_interval_seconds: float,
+        max_stale_seconds: float = 3600,
+        clock=time.monotonic,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.refresh_ahead_seconds = refresh_ahead_seconds
+        self.min_refresh_interval_seconds = min_refresh_interval_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self._clock = clock
+        self._keys: dict[str, tuple[str, Any]] = {}
+        self._fetched_at: float | None = None
+        self._last_attempt_at: float | None = None
+        self._generation = 0
+        self._refresh_lock = threading.Lock()
+        self._background_refresh: threading.Thread | None = None
+
+    def _refresh(self, seen_generation: int) -> None:
+        with self._refresh_lock:
+            if self._generation != seen_generation:
+                # Another caller refreshed while we were waiting for the lock.
+                return
+
+            self._last_attempt_at = self._clock()
+            try:
+                keys = _construct_keys(_fetch_jwks())
+            except HTTPException as exc:
+                log_event(
+                    _logger,
+                    "jwks_refresh",
+                    status="fail",
+                    error=exc.detail,
+                    serving_stale=bool(self._keys),
+                )
+                if not self._keys:
+                    raise
+                return
+
+            self._keys = keys
+            self._fetched_at = self._clock()
+            self._generation += 1
+            log_event(_logger, "jwks_refresh", status="success", key_count=len(keys))
+
+    def _refresh_in_background(self) -> None:
+        if self._background_refresh is not None and self._background_refresh.is_alive():
+            return
+        self._background_refresh = threading.Thread(
+            target=self._refresh_quietly,
+            args=(self._generation,),
+            name="jwks-refresh",
+            daemon=True,
+        )
+        self._background_refresh.start()
+
+    def _refresh_quietly(self, seen_generation: int) -> None:
+        try:
+            self._refresh(seen_generation)
+        except HTTPException:
+            pass
+
+    def _refresh_allowed(self) -> bool:
+        return (
+            self._last_attempt_at is None
+            or self._clock() - self._last_attempt_at >= self.min_refresh_interval_seconds
+        )
+
+    def get_key(self, kid: str) -> tuple[str, Any] | None:
+        """
+        Returns (algorithm, key) for the kid, or None if it is unknown
+        even after a refresh. Raises HTTPException (503) when no keys could
+        be fetched or the cached ones are older than `max_stale_seconds`.
+        """
+        if self._fetched_at is None:
+            if self._last_attempt_at is not None and not self._refresh_allowed():
+                raise HTTPException(
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="Unable to verify authentication at this time.",
+                )
+            self._refresh(self._generation)
+        else:
+            age = self._clock() - self._fetched_at
+            if age >= self.max_stale_seconds:
+                if self._refresh_allowed():
+                    self._refresh(self._generation)
+                if self._clock() - self._fetched_at >= self.max_stale_seconds:
+                    log_event(_logger, "jwks_keys_too_stale", age_seconds=int(age))
+                    raise HTTPException(
+                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail="Unable to verify authentication at this time.",
+                    )
+            elif age >= self.ttl_seconds - self.refresh_ahead_seconds and self._refresh_allowed():
+                self._refresh_in_background()
+
+        key = self._keys.get(kid)
+        if key is not None:
+            return key
+
+        if self._refresh_allowed():
+            self._refresh(self._generation)
+        return self._keys.get(kid)
+
+
+_jwks_store = JwksKeyStore(
+    ttl_seconds=settings.supabase_jwks_cache_ttl_seconds,
+    refresh_ahead_seconds=settings.supabase_jwks_refresh_ahead_seconds,
+    min_refresh_interval_seconds=settings.supabase_jwks_min_refresh_interval_seconds,
+    max_stale_seconds=settings.supabase_jwks_max_stale_seconds,
+)
+
+# Claims of tokens that already passed signature verification, keyed by a
+# hash of the token and kept until the token's own expiry.
+_verified_token_cache = TTLCache(
+    max_entries=settings.auth_token_cache_max_entries,
+    ttl_seconds=settings.supabase_jwks_cache_ttl_seconds,
+)
+
+
+def _token_cache_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _cache_verified_claims(token_key: str, claims: dict[str, Any]) -> None:
+    expires_at = claims.get("exp")
+    if not isinstance(expires_at, (int, float)):
+        return
+    ttl_seconds = expires_at - time.time()
+    if ttl_seconds > 0:
+        _verified_token_cache.set(token_key, dict(claims), ttl_seconds=ttl_seconds)
 
 
 def _verify_supabase_jwt(token: str) -> dict[str, Any]:
+    token_key = _token_cache_key(token)
+    cached_claims = _verified_token_cache.get(token_key)
+    current_span().set_attribute("cache_hit", cached_claims is not None)
+    if cached_claims is not None:
+        return dict(cached_claims)
+
     try:
         unverified_header = jwt.get_unverified_header(token)
     except JWTError:
@@ -60,18 +233,17 @@ def _verify_supabase_jwt(token: str) -> dict[str, Any]:
             detail="Invalid or expired token.",
         )
 
-    jwks = _fetch_jwks()
-    matching_key = next((key for key in jwks.get("keys", []) if key.get("kid") == kid), None)
-    if not matching_key:
+    matching_key = _jwks_store.get_key(kid)
+    if not matching_key or matching_key[0] != alg:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token.",
         )
 
     try:
-        return jwt.decode(
+        claims = jwt.decode(
             token,
-            matching_key,
+            matching_key[1],
             algorithms=[alg],
             audience=settings.supabase_audience,
             issuer=settings.supabase_issuer,
@@ -82,6 +254,9 @@ def _verify_supabase_jwt(token: str) -> dict[str, Any]:
             detail="Invalid or expired token.",
         )
 
+    _cache_verified_claims(token_key, claims)
+    return claims
+
 
 def get_current_user(
     credentials: HTTPAuthorizationCredentials | None = Depends(security),
@@ -91,4 +266,5 @@ def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Unauthorized.",
         )
-    return _verify_supabase_jwt(credentials.credentials)
+    with start_span("auth.verify_jwt"):
+        return _verify_supabase_jwt(credentials.credentials)
@@ -0,0 +1,219 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable
+
+
+class TTLCache:
+    """
+    Bounded, thread-safe LRU cache whose entries expire after a TTL.
+
+    A max_entries of 0 disables the cache: every get is a miss and set is a
+    no-op, so callers never need to special-case it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: float | None = None) -> None:
+        if self.max_entries <= 0:
+            return
+
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (self._clock() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+            self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SQLiteCache:
+    """
+    Persistent key/value cache stored in a SQLite file so entries survive
+    restarts. Values are stored as JSON; expiry uses wall-clock time.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl_seconds: float,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache_entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def get_with_ttl(self, key: str) -> tuple[Any, float] | None:
+        """
+        Returns (value, remaining_ttl_seconds), or None on a miss.
+        """
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None or row[1] <= now:
+                if row is not None:
+                    self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0]), row[1] - now
+
+    def get(self, key: str) -> Any | None:
+        entry = self.get_with_ttl(key)
+        return entry[0] if entry else None
+
+    def set(self, key: str, value: Any, ttl_seconds: float | None = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), self._clock() + ttl),
+            )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM cache_entries WHERE expires_at <= ?", (self._clock(),)
+            )
+            return cursor.rowcount
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries")
+            self.hits = 0
+            self.misses = 0
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class TieredCache:
+    """
+    Hot in-memory LRU tier in front of an optional persistent SQLite tier.
+    Persistent hits are promoted into memory for their remaining lifetime.
+    """
+
+    def __init__(self, memory: TTLCache, persistent: SQLiteCache | None = None) -> None:
+        self.memory = memory
+        self.persistent = persistent
+
+    def get(self, key: str) -> Any | None:
+        value = self.memory.get(key)
+        if value is not None or self.persistent is None:
+            return value
+
+        entry = self.persistent.get_with_ttl(key)
+        if entry is None:
+            return None
+        value, remaining_ttl = entry
+        self.memory.set(key, value, ttl_seconds=remaining_ttl)
+        return value
+
+    def set(self, key: str, value: Any, ttl_seconds: float | None = None) -> None:
+        self.memory.set(key, value, ttl_seconds=ttl_seconds)
+        if self.persistent is not None:
+            self.persistent.set(key, value, ttl_seconds=ttl_seconds)
+
+    def delete(self, key: str) -> None:
+        self.memory.delete(key)
+        if self.persistent is not None:
+            self.persistent.delete(key)
+
+    def clear(self) -> None:
+        self.memory.clear()
+        if self.persistent is not None:
+            self.persistent.clear()
+
+    def stats(self) -> dict[str, int]:
+        stats = {f"memory_{name}": value for name, value in self.memory.stats().items()}
+        if self.persistent is not None:
+            stats["persistent_hits"] = self.persistent.hits
+            stats["persistent_misses"] = self.persistent.misses
+        return stats
+
+
+def normalize_text(text: str | None) -> str:
+    """
+    Case- and whitespace-insensitive form of user text for cache keys.
+    """
+    return " ".join((text or "").lower().split())
@@ -12,13 +12,105 @@ class Settings(BaseSettings):
     # Core API settings
     cors_origins_raw: str = Field(default="http://localhost:3000", alias="CORS_ORIGINS")
     max_input_chars: int = Field(default=1000, alias="MAX_INPUT_CHARS")
+    banned_words_path: str = Field(default="", alias="BANNED_WORDS_PATH")
     rate_limit_window_seconds: int = Field(default=60, alias="RATE_LIMIT_WINDOW_SECONDS")
     rate_limit_max_requests: int = Field(default=30, alias="RATE_LIMIT_MAX_REQUESTS")
+    rate_limit_max_keys: int = Field(default=10000, alias="RATE_LIMIT_MAX_KEYS")
+    rate_limit_route_rules_raw: str = Field(default="", alias="RATE_LIMIT_ROUTE_RULES")
+    rate_limit_exempt_paths_raw: str = Field(default="/health,/metrics", alias="RATE_LIMIT_EXEMPT_PATHS")
+    rate_limit_redis_url: str = Field(default="", alias="RATE_LIMIT_REDIS_URL")
+    rate_limit_ip_max_requests: int = Field(default=120, ge=0, alias="RATE_LIMIT_IP_MAX_REQUESTS")
+    rate_limit_ip_exempt_paths_raw: str = Field(default="/health", alias="RATE_LIMIT_IP_EXEMPT_PATHS")
+
+    # Logging settings
+    log_async: bool = Field(default=False, alias="LOG_ASYNC")
+    log_queue_max_size: int = Field(default=10000, alias="LOG_QUEUE_MAX_SIZE")
+    log_batch_size: int = Field(default=256, alias="LOG_BATCH_SIZE")
+    log_sample_rates_raw: str = Field(default="", alias="LOG_SAMPLE_RATES")
+
+    # Tracing settings
+    trace_export_path: str = Field(default="", alias="TRACE_EXPORT_PATH")
+    trace_otlp_endpoint: str = Field(default="", alias="TRACE_OTLP_ENDPOINT")
+    trace_sample_rate: float = Field(default=1.0, ge=0, le=1, alias="TRACE_SAMPLE_RATE")
+    trace_service_name: str = Field(default="bedtime-story-api", alias="TRACE_SERVICE_NAME")
+    trace_queue_max_size: int = Field(default=10000, ge=1, alias="TRACE_QUEUE_MAX_SIZE")
 
     # OpenAI settings
     openai_api_key: str | None = Field(default=None, alias="OPENAI_API_KEY")
     openai_model: str = Field(default="gpt-3.5-turbo", alias="OPENAI_MODEL")
+    openai_base_url: str | None = Field(default=None, alias="OPENAI_BASE_URL")
     openai_timeout_seconds: float = Field(default=30.0, alias="OPENAI_TIMEOUT_SECONDS")
+    openai_max_connections: int = Field(default=200, alias="OPENAI_MAX_CONNECTIONS")
+    openai_max_keepalive_connections: int = Field(
+        default=50, alias="OPENAI_MAX_KEEPALIVE_CONNECTIONS"
+    )
+
+    # Per-stage LLM profiles ("model=...,max_tokens=...,temperature=...,timeout=...,stop=a|b")
+    stage_profile_classify_raw: str = Field(default="", alias="STAGE_PROFILE_CLASSIFY")
+    stage_profile_generate_raw: str = Field(default="", alias="STAGE_PROFILE_GENERATE")
+    stage_profile_judge_raw: str = Field(default="", alias="STAGE_PROFILE_JUDGE")
+    stage_profile_revise_raw: str = Field(default="", alias="STAGE_PROFILE_REVISE")
+    stage_profile_fused_raw: str = Field(default="", alias="STAGE_PROFILE_FUSED")
+    stage_max_tokens_autotune: bool = Field(default=False, alias="STAGE_MAX_TOKENS_AUTOTUNE")
+    stage_max_tokens_headroom: float = Field(default=1.5, ge=1, alias="STAGE_MAX_TOKENS_HEADROOM")
+
+    # LLM retry and circuit breaker settings
+    llm_max_retries: int = Field(default=2, ge=0, alias="LLM_MAX_RETRIES")
+    llm_retry_base_delay_seconds: float = Field(default=0.5, ge=0, alias="LLM_RETRY_BASE_DELAY_SECONDS")
+    llm_retry_max_delay_seconds: float = Field(default=8.0, ge=0, alias="LLM_RETRY_MAX_DELAY_SECONDS")
+    llm_circuit_failure_threshold: int = Field(default=5, ge=0, alias="LLM_CIRCUIT_FAILURE_THRESHOLD")
+    llm_circuit_recovery_seconds: float = Field(default=30.0, gt=0, alias="LLM_CIRCUIT_RECOVERY_SECONDS")
+
+    # LLM hedging and fallback settings
+    llm_fallback_models_raw: str = Field(default="", alias="LLM_FALLBACK_MODELS")
+    llm_hedge_enabled: bool = Field(default=False, alias="LLM_HEDGE_ENABLED")
+    llm_hedge_model: str = Field(default="", alias="LLM_HEDGE_MODEL")
+    llm_hedge_quantile: float = Field(default=0.95, gt=0, lt=1, alias="LLM_HEDGE_QUANTILE")
+    llm_hedge_min_delay_seconds: float = Field(default=0.5, ge=0, alias="LLM_HEDGE_MIN_DELAY_SECONDS")
+    llm_hedge_max_rate: float = Field(default=0.05, ge=0, le=1, alias="LLM_HEDGE_MAX_RATE")
+    llm_hedge_min_samples: int = Field(default=20, ge=1, alias="LLM_HEDGE_MIN_SAMPLES")
+
+    # Story engine settings
+    story_pipeline_mode: str = Field(default="two_call", pattern="^(two_call|fused)$", alias="STORY_PIPELINE_MODE")
+    speculative_candidates: int = Field(default=1, ge=1, alias="SPECULATIVE_CANDIDATES")
+    max_speculative_candidates: int = Field(default=4, ge=1, alias="MAX_SPECULATIVE_CANDIDATES")
+    classification_cache_max_entries: int = Field(
+        default=1024, ge=0, alias="CLASSIFICATION_CACHE_MAX_ENTRIES"
+    )
+    classification_cache_ttl_seconds: float = Field(
+        default=3600.0, alias="CLASSIFICATION_CACHE_TTL_SECONDS"
+    )
+    story_cache_max_entries: int = Field(default=512, ge=0, alias="STORY_CACHE_MAX_ENTRIES")
+    story_cache_ttl_seconds: float = Field(default=86400.0, alias="STORY_CACHE_TTL_SECONDS")
+    story_cache_sqlite_path: str = Field(default="", alias="STORY_CACHE_SQLITE_PATH")
+    story_coalescing_enabled: bool = Field(default=True, alias="STORY_COALESCING_ENABLED")
+    story_session_max_entries: int = Field(default=10000, ge=0, alias="STORY_SESSION_MAX_ENTRIES")
+    story_session_ttl_seconds: float = Field(default=3600.0, gt=0, alias="STORY_SESSION_TTL_SECONDS")
+    story_deadline_seconds: float = Field(default=0.0, ge=0, alias="STORY_DEADLINE_SECONDS")
+    story_deadline_min_stage_seconds: float = Field(default=2.0, ge=0, alias="STORY_DEADLINE_MIN_STAGE_SECONDS")
+
+    # Usage accounting settings
+    token_prices_raw: str = Field(default="", alias="TOKEN_PRICES")
+    max_tokens_per_request: int = Field(default=0, ge=0, alias="MAX_TOKENS_PER_REQUEST")
+    usage_max_tracked_users: int = Field(default=10000, ge=1, alias="USAGE_MAX_TRACKED_USERS")
+
+    # Async job settings
+    job_workers: int = Field(default=4, ge=1, alias="JOB_WORKERS")
+    job_queue_max_size: int = Field(default=100, ge=1, alias="JOB_QUEUE_MAX_SIZE")
+    job_store_max_jobs: int = Field(default=10000, ge=1, alias="JOB_STORE_MAX_JOBS")
+    job_result_ttl_seconds: float = Field(default=3600.0, gt=0, alias="JOB_RESULT_TTL_SECONDS")
+    job_store_sqlite_path: str = Field(default="", alias="JOB_STORE_SQLITE_PATH")
+    job_lease_seconds: float = Field(default=60.0, gt=0, alias="JOB_LEASE_SECONDS")
+
+    # Batch story settings
+    story_batch_max_items: int = Field(default=500, ge=1, alias="STORY_BATCH_MAX_ITEMS")
+    story_batch_concurrency: int = Field(default=8, ge=1, alias="STORY_BATCH_CONCURRENCY")
+
+    # Per-user limits (0 disables a limit)
+    user_max_concurrent_requests: int = Field(default=2, ge=0, alias="USER_MAX_CONCURRENT_REQUESTS")
+    user_request_quota: int = Field(default=0, ge=0, alias="USER_REQUEST_QUOTA")
+    user_token_quota: int = Field(default=0, ge=0, alias="USER_TOKEN_QUOTA")
+    user_quota_window_seconds: float = Field(default=86400.0, gt=0, alias="USER_QUOTA_WINDOW_SECONDS")
 
     # Supabase JWT verification settings
     supabase_url: str = Field(default="", alias="SUPABASE_URL")
@@ -31,6 +123,18 @@ class Settings(BaseSettings):
     supabase_jwks_cache_ttl_seconds: int = Field(
         default=600, alias="SUPABASE_JWKS_CACHE_TTL_SECONDS"
     )
+    supabase_jwks_refresh_ahead_seconds: int = Field(
+        default=60, alias="SUPABASE_JWKS_REFRESH_AHEAD_SECONDS"
+    )
+    supabase_jwks_min_refresh_interval_seconds: int = Field(
+        default=30, alias="SUPABASE_JWKS_MIN_REFRESH_INTERVAL_SECONDS"
+    )
+    supabase_jwks_max_stale_seconds: int = Field(
+        default=3600, alias="SUPABASE_JWKS_MAX_STALE_SECONDS"
+    )
+    auth_token_cache_max_entries: int = Field(
+        default=10000, ge=0, alias="AUTH_TOKEN_CACHE_MAX_ENTRIES"
+    )
 
     @model_validator(mode="after")
     def derive_supabase_defaults(self) -> "Settings":
@@ -45,6 +149,14 @@ class Settings(BaseSettings):
     def cors_origins(self) -> list[str]:
         return [origin.strip() for origin in self.cors_origins_raw.split(",") if origin.strip()]
 
+    @property
+    def rate_limit_exempt_paths(self) -> list[str]:
+        return [path.strip() for path in self.rate_limit_exempt_paths_raw.split(",") if path.strip()]
+
+    @property
+    def rate_limit_ip_exempt_paths(self) -> list[str]:
+        return [path.strip() for path in self.rate_limit_ip_exempt_paths_raw.split(",") if path.strip()]
+
     @property
     def supabase_allowed_algorithms(self) -> list[str]:
         return [
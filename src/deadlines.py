@@ -0,0 +1,114 @@
+"""
+End-to-end request deadlines.
+
+A Deadline is created when a story request arrives, from STORY_DEADLINE_SECONDS
+or the client's X-Deadline-Seconds header (whichever is shorter), and is
+passed down through the engine to every call_model_async like the usage
+ledger. It bounds the request in three ways:
+
+- Each LLM call's timeout shrinks to the time left. Early stages keep back
+  the expected duration of the stages after them, so a slow classification
+  cannot use up the time needed for the story itself.
+- Retries and new attempts are only started when the expected duration of
+  the work fits in the remaining time, and the judge is skipped when it
+  would not finish in time.
+- When time runs out, the engine returns its best story that passed the
+  local checks instead of failing.
+
+Expected stage durations are the median latencies call_model_async has
+observed, or STORY_DEADLINE_MIN_STAGE_SECONDS until enough calls have been
+seen.
+"""
+
+import time
+from typing import Callable
+
+from src.config import settings
+from src.hedging import hedge_policy
+
+DEADLINE_HEADER = "X-Deadline-Seconds"
+
+# Stages that still have to run after each stage of a two-call or
+# revision attempt.
+_DOWNSTREAM_STAGES = {
+    "classify": ("generate", "judge"),
+    "generate": ("judge",),
+    "revise": ("judge",),
+}
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised instead of starting an LLM call when the request has no time left.
+    """
+
+
+def expected_stage_seconds(stage: str) -> float:
+    observed = hedge_policy.tracker.quantile(stage, 0.5)
+    return observed if observed is not None else settings.story_deadline_min_stage_seconds
+
+
+class Deadline:
+    def __init__(
+        self,
+        budget_seconds: float,
+        clock: Callable[[], float] = time.monotonic,
+        estimate: Callable[[str], float] = expected_stage_seconds,
+    ) -> None:
+        self.budget_seconds = budget_seconds
+        self._clock = clock
+        self._estimate = estimate
+        self.expires_at = clock() + budget_seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self._clock())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def allows(self, *stages: str) -> bool:
+        """
+        True when the expected duration of `stages` fits in the time left.
+        """
+        return self.remaining() >= sum(self._estimate(stage) for stage in stages)
+
+    def timeout_for(self, stage: str, timeout_seconds: float) -> float:
+        """
+        Shrinks a call's timeout to the time left, keeping back what the
+        stage's downstream stages are expected to need when that still
+        leaves the stage one expected duration of its own. Raises
+        DeadlineExceeded when no time is left.
+        """
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Deadline of {self.budget_seconds:g}s exceeded before {stage} call")
+        reserve = sum(self._estimate(downstream) for downstream in _DOWNSTREAM_STAGES.get(stage, ()))
+        if remaining - reserve >= self._estimate(stage):
+            remaining -= reserve
+        return min(timeout_seconds, remaining)
+
+
+def parse_deadline_header(value: str | None) -> float | None:
+    """
+    Seconds from an X-Deadline-Seconds header, or None when the header is
+    missing or not a positive number.
+    """
+    try:
+        seconds = float(value) if value else None
+    except ValueError:
+        return None
+    return seconds if seconds is not None and seconds > 0 else None
+
+
+def request_deadline(header_value: str | None = None) -> Deadline | None:
+    """
+    The deadline for a new request: STORY_DEADLINE_SECONDS, shortened by
+    the client's header. None when neither sets one.
+    """
+    budgets = [
+        seconds
+        for seconds in (settings.story_deadline_seconds, parse_deadline_header(header_value))
+        if seconds and seconds > 0
+    ]
+    return Deadline(min(budgets)) if budgets else None
@@ -0,0 +1,112 @@
+"""
+Hedged LLM calls.
+
+When a call has not returned by the stage's observed latency quantile
+(LLM_HEDGE_QUANTILE, p95 by default), call_model_async fires one duplicate
+request, to LLM_HEDGE_MODEL or the same model, takes whichever answers
+first and cancels the other. Only a few requests are slower than their
+stage's p95, so hedging them costs a few percent more calls and cuts the
+straggler tail. A HedgeBudget caps hedges at LLM_HEDGE_MAX_RATE of calls so
+a slow upstream is not hit with twice the load just when it is struggling.
+"""
+
+import math
+import threading
+from collections import deque
+
+from src.config import settings
+
+
+class LatencyTracker:
+    """
+    Recent successful call latencies per stage, for the hedge delay.
+    """
+
+    def __init__(self, window: int = 500, min_samples: int = 20) -> None:
+        self.window = window
+        self.min_samples = min_samples
+        self._samples: dict[str, deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            self._samples.setdefault(stage, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, stage: str, q: float) -> float | None:
+        """
+        Returns the q-quantile of the stage's recent latencies, or None
+        until `min_samples` calls have been observed.
+        """
+        with self._lock:
+            samples = self._samples.get(stage)
+            if not samples or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._samples.clear()
+
+
+class HedgeBudget:
+    """
+    Token bucket that allows at most `max_rate` hedges per call: every call
+    deposits `max_rate` tokens (up to `burst`) and every hedge spends one.
+    """
+
+    def __init__(self, max_rate: float = 0.05, burst: float = 10.0) -> None:
+        self.max_rate = max_rate
+        self.burst = burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def record_call(self) -> None:
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.max_rate)
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class HedgePolicy:
+    def __init__(
+        self,
+        enabled: bool = False,
+        quantile: float = 0.95,
+        min_delay_seconds: float = 0.5,
+        tracker: LatencyTracker | None = None,
+        budget: HedgeBudget | None = None,
+    ) -> None:
+        self.enabled = enabled
+        self.quantile = quantile
+        self.min_delay_seconds = min_delay_seconds
+        self.tracker = tracker or LatencyTracker()
+        self.budget = budget or HedgeBudget()
+
+    def delay(self, stage: str, timeout_seconds: float) -> float | None:
+        """
+        Seconds to wait before hedging a call, or None when the call should
+        not be hedged (disabled, too few samples yet, or the delay would
+        reach the call's own timeout).
+        """
+        if not self.enabled:
+            return None
+        observed = self.tracker.quantile(stage, self.quantile)
+        if observed is None:
+            return None
+        delay = max(observed, self.min_delay_seconds)
+        return delay if delay < timeout_seconds else None
+
+
+hedge_policy = HedgePolicy(
+    enabled=settings.llm_hedge_enabled,
+    quantile=settings.llm_hedge_quantile,
+    min_delay_seconds=settings.llm_hedge_min_delay_seconds,
+    tracker=LatencyTracker(min_samples=settings.llm_hedge_min_samples),
+    budget=HedgeBudget(max_rate=settings.llm_hedge_max_rate),
+)
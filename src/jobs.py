@@ -0,0 +1,400 @@
+"""
+Asynchronous story jobs.
+
+POST /story/jobs stores a queued job and returns its id at once. A fixed
+pool of worker tasks takes jobs off a bounded queue and runs the engine;
+GET /story/jobs/{id} reads the job back from the store. When the queue is
+full, submit raises JobQueueFull instead of accepting more work, so load
+turns into explicit backpressure rather than a growing backlog.
+"""
+
+import asyncio
+import contextvars
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Protocol
+
+from src.logging_utils import get_logger, log_event
+from src.metrics import JOB_QUEUE_DEPTH, STORY_JOBS
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+INTERRUPTED_ERROR = "Job was interrupted by a server restart."
+
+
+@dataclass
+class StoryJob:
+    job_id: str
+    subject: str
+    payload: dict[str, Any]
+    status: str = JOB_QUEUED
+    created_at: float = field(default_factory=time.time)
+    started_at: float | None = None
+    finished_at: float | None = None
+    result: dict[str, Any] | None = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (JOB_SUCCEEDED, JOB_FAILED)
+
+    def public_view(self) -> dict[str, Any]:
+        """
+        Job fields returned to the client; the owner and request payload
+        stay server-side.
+        """
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+        }
+
+
+class JobStore(Protocol):
+    def save(self, job: StoryJob) -> None:
+        ...
+
+    def get(self, job_id: str) -> StoryJob | None:
+        ...
+
+    def heartbeat(self) -> None:
+        ...
+
+
+class InMemoryJobStore:
+    """
+    Per-process job store capped at `max_jobs`. Finished jobs are kept for
+    `result_ttl_seconds`; when the cap is hit the oldest jobs are dropped.
+    """
+
+    def __init__(
+        self,
+        max_jobs: int = 10000,
+        result_ttl_seconds: float = 3600,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.max_jobs = max_jobs
+        self.result_ttl_seconds = result_ttl_seconds
+        self._clock = clock
+        self._jobs: "OrderedDict[str, StoryJob]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def save(self, job: StoryJob) -> None:
+        with self._lock:
+            self._jobs[job.job_id] = job
+            while len(self._jobs) > self.max_jobs:
+                self._jobs.popitem(last=False)
+
+    def get(self, job_id: str) -> StoryJob | None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            if job.finished and job.finished_at + self.result_ttl_seconds <= self._clock():
+                del self._jobs[job_id]
+                return None
+            return job
+
+    def heartbeat(self) -> None:
+        """
+        Nothing to renew: jobs die with the process that holds them.
+        """
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+
+class SQLiteJobStore:
+    """
+    Job store in a SQLite file, so results survive restarts and can be
+    polled from any worker process sharing the file.
+
+    Each unfinished job is owned by the store that saved it (`owner_id`,
+    unique per process unless given) and holds a lease of `lease_seconds`
+    that the owner's heartbeat keeps renewing. Jobs whose lease ran out, or
+    that belong to this owner from before a restart, were abandoned by a
+    process that stopped and are marked failed, on open and on every
+    heartbeat. Jobs other live processes are running are left alone.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        result_ttl_seconds: float = 3600,
+        clock: Callable[[], float] = time.time,
+        owner_id: str | None = None,
+        lease_seconds: float = 60,
+    ) -> None:
+        self.path = path
+        self.result_ttl_seconds = result_ttl_seconds
+        self._clock = clock
+        self.owner_id = owner_id or uuid.uuid4().hex
+        self.lease_seconds = lease_seconds
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS story_jobs ("
+            "job_id TEXT PRIMARY KEY, subject TEXT NOT NULL, status TEXT NOT NULL, "
+            "payload TEXT NOT NULL, result TEXT, created_at REAL NOT NULL, "
+            "started_at REAL, finished_at REAL, owner TEXT, lease_expires_at REAL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(story_jobs)")}
+        for column, column_type in (("owner", "TEXT"), ("lease_expires_at", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE story_jobs ADD COLUMN {column} {column_type}")
+        self.fail_abandoned(restarted=True)
+
+    def fail_abandoned(self, restarted: bool = False) -> int:
+        """
+        Marks unfinished jobs failed when their lease has expired and, on
+        open (`restarted`), those this owner id held before a restart.
+        Returns how many.
+        """
+        now = self._clock()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE story_jobs SET status = ?, result = ?, finished_at = ?, owner = NULL, lease_expires_at = NULL "
+                "WHERE status IN (?, ?) AND (owner IS NULL OR owner = ? OR lease_expires_at IS NULL OR lease_expires_at <= ?)",
+                (
+                    JOB_FAILED,
+                    json.dumps({"status": "error", "story": "", "error": INTERRUPTED_ERROR}),
+                    now,
+                    JOB_QUEUED,
+                    JOB_RUNNING,
+                    self.owner_id if restarted else None,
+                    now,
+                ),
+            )
+            return cursor.rowcount
+
+    def renew_leases(self) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE story_jobs SET lease_expires_at = ? WHERE owner = ? AND status IN (?, ?)",
+                (self._clock() + self.lease_seconds, self.owner_id, JOB_QUEUED, JOB_RUNNING),
+            )
+
+    def heartbeat(self) -> None:
+        """
+        Renews this process's leases, then fails jobs other processes
+        abandoned. The pool calls it well within `lease_seconds`.
+        """
+        self.renew_leases()
+        self.fail_abandoned()
+
+    def save(self, job: StoryJob) -> None:
+        owner, lease_expires_at = (None, None) if job.finished else (self.owner_id, self._clock() + self.lease_seconds)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO story_jobs "
+                "(job_id, subject, status, payload, result, created_at, started_at, finished_at, owner, lease_expires_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.job_id,
+                    job.subject,
+                    job.status,
+                    json.dumps(job.payload),
+                    json.dumps(job.result) if job.result is not None else None,
+                    job.created_at,
+                    job.started_at,
+                    job.finished_at,
+                    owner,
+                    lease_expires_at,
+                ),
+            )
+
+    def get(self, job_id: str) -> StoryJob | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, subject, status, payload, result, created_at, started_at, finished_at "
+                "FROM story_jobs WHERE job_id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = StoryJob(
+            job_id=row[0],
+            subject=row[1],
+            status=row[2],
+            payload=json.loads(row[3]),
+            result=json.loads(row[4]) if row[4] is not None else None,
+            created_at=row[5],
+            started_at=row[6],
+            finished_at=row[7],
+        )
+        if job.finished and job.finished_at + self.result_ttl_seconds <= self._clock():
+            self.delete(job_id)
+            return None
+        return job
+
+    def delete(self, job_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM story_jobs WHERE job_id = ?", (job_id,))
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._conn.execute(
+                "DELETE FROM story_jobs WHERE status IN (?, ?) AND finished_at <= ?",
+                (JOB_SUCCEEDED, JOB_FAILED, self._clock() - self.result_ttl_seconds),
+            )
+            return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class JobQueueFull(Exception):
+    def __init__(self, depth: int, max_depth: int) -> None:
+        super().__init__(f"Job queue is full ({depth}/{max_depth}).")
+        self.depth = depth
+        self.max_depth = max_depth
+
+
+class JobWorkerPool:
+    """
+    `workers` asyncio tasks draining a queue of at most `max_queue_size`
+    jobs. `handler` runs one job and returns its result payload, whose
+    "status" ("success" or "error") decides the job's final status.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        handler: Callable[[StoryJob], Awaitable[dict[str, Any]]],
+        workers: int = 4,
+        max_queue_size: int = 100,
+        logger=None,
+        heartbeat_seconds: float = 20.0,
+    ) -> None:
+        self.store = store
+        self.handler = handler
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self._logger = logger or get_logger()
+        self._queue: "asyncio.Queue[StoryJob] | None" = None
+        self._tasks: list[asyncio.Task] = []
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def start(self) -> None:
+        """
+        Starts the workers on the running event loop. Safe to call again;
+        if the loop has changed (e.g. a new test client), the pool is
+        rebuilt on the new one.
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        # Workers get a fresh context so jobs are not traced as children of
+        # whichever request happened to start the pool.
+        self._tasks = [
+            loop.create_task(self._work(), name=f"story-job-worker-{index}", context=contextvars.Context())
+            for index in range(self.workers)
+        ]
+        self._tasks.append(
+            loop.create_task(self._heartbeat(), name="story-job-heartbeat", context=contextvars.Context())
+        )
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._queue = None
+        self._loop = None
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def submit(self, job: StoryJob) -> int:
+        """
+        Stores and enqueues a job, returning the queue depth behind it.
+        Raises JobQueueFull without storing the job when there is no room.
+        """
+        self.start()
+        if self._queue.full():
+            raise JobQueueFull(self._queue.qsize(), self.max_queue_size)
+        self.store.save(job)
+        self._queue.put_nowait(job)
+        JOB_QUEUE_DEPTH.set(self._queue.qsize())
+        return self._queue.qsize()
+
+    async def _heartbeat(self) -> None:
+        while True:
+            await asyncio.sleep(self.heartbeat_seconds)
+            try:
+                self.store.heartbeat()
+            except Exception as e:
+                log_event(self._logger, "story_job_heartbeat_error", error=str(e))
+
+    async def _work(self) -> None:
+        while True:
+            job = await self._queue.get()
+            JOB_QUEUE_DEPTH.set(self._queue.qsize())
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: StoryJob) -> None:
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        self.store.save(job)
+        log_event(
+            self._logger,
+            "story_job",
+            request_id=job.payload.get("request_id"),
+            job_id=job.job_id,
+            status=JOB_RUNNING,
+            queued_ms=int((job.started_at - job.created_at) * 1000),
+        )
+
+        try:
+            job.result = await self.handler(job)
+            job.status = JOB_SUCCEEDED if job.result.get("status") == "success" else JOB_FAILED
+        except asyncio.CancelledError:
+            job.result = {"status": "error", "story": "", "error": INTERRUPTED_ERROR}
+            job.status = JOB_FAILED
+            raise
+        except Exception as e:
+            job.result = {"status": "error", "story": "", "error": "Internal server error."}
+            job.status = JOB_FAILED
+            log_event(
+                self._logger,
+                "story_job_error",
+                request_id=job.payload.get("request_id"),
+                job_id=job.job_id,
+                error=str(e),
+            )
+        finally:
+            job.finished_at = time.time()
+            self.store.save(job)
+            STORY_JOBS.inc(status=job.status)
+            log_event(
+                self._logger,
+                "story_job",
+                request_id=job.payload.get("request_id"),
+                job_id=job.job_id,
+                status=job.status,
+                latency_ms=int((job.finished_at - job.started_at) * 1000),
+            )
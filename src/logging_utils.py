@@ -1,16 +1,37 @@
+import atexit
 import json
 import logging
+import queue
+import random
 import sys
+import threading
 from datetime import datetime, timezone
-from typing import Any, Dict
+from typing import Any, Callable, Dict, TextIO
+
+from src.config import settings
+from src.metrics import LOG_EVENTS_SAMPLED_OUT, LOG_RECORDS_DROPPED
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
 
 DEFAULT_LOGGER_NAME = "story_pipeline"
 
 
+def _dumps(payload: Dict[str, Any]) -> str:
+    if orjson is not None:
+        try:
+            return orjson.dumps(payload).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(payload, ensure_ascii=True, default=str)
+
+
 class JsonFormatter(logging.Formatter):
     def format(self, record: logging.LogRecord) -> str:
         payload: Dict[str, Any] = {
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
             "level": record.levelname,
             "logger": record.name,
             "message": record.getMessage(),
@@ -20,7 +41,140 @@ class JsonFormatter(logging.Formatter):
         if isinstance(extra_fields, dict):
             payload.update(extra_fields)
 
-        return json.dumps(payload, ensure_ascii=True)
+        return _dumps(payload)
+
+
+class EventSampler:
+    """
+    Keeps only a fraction of the records for selected event types, e.g.
+    {"llm_call_start": 0.1}. Events without a rate are always kept.
+    """
+
+    def __init__(self, sample_rates: Dict[str, float], rng: Callable[[], float] = random.random) -> None:
+        self.sample_rates = sample_rates
+        self._rng = rng
+        self.sampled_out = 0
+
+    def keep(self, event: str) -> bool:
+        rate = self.sample_rates.get(event)
+        if rate is None or self._rng() < rate:
+            return True
+        self.sampled_out += 1
+        LOG_EVENTS_SAMPLED_OUT.inc(event=event)
+        return False
+
+
+_STOP = object()
+
+
+class BatchingQueueHandler(logging.Handler):
+    """
+    Hands records to a bounded queue and returns immediately. A writer
+    thread formats them and writes whole batches to the stream, so JSON
+    encoding and stdout I/O never run on the request path. When the queue
+    is full the record is dropped and counted instead of blocking.
+    """
+
+    def __init__(
+        self,
+        stream: TextIO | None = None,
+        max_queue_size: int = 10000,
+        batch_size: int = 256,
+    ) -> None:
+        super().__init__()
+        self.stream = stream or sys.stdout
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue_size)
+        self.batch_size = batch_size
+        self.dropped = 0
+        self._thread: threading.Thread | None = None
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._drain, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            LOG_RECORDS_DROPPED.inc()
+
+    def _write_batch(self, records: list) -> None:
+        lines = []
+        for record in records:
+            try:
+                lines.append(self.format(record))
+            except Exception:
+                self.handleError(record)
+        if lines:
+            self.stream.write("\n".join(lines) + "\n")
+            self.stream.flush()
+
+    def _drain(self) -> None:
+        while True:
+            record = self.queue.get()
+            if record is _STOP:
+                return
+
+            batch = [record]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    record = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stop = True
+                    break
+                batch.append(record)
+
+            self._write_batch(batch)
+            if stop:
+                return
+
+    def close(self) -> None:
+        if self._thread is not None:
+            try:
+                self.queue.put(_STOP, timeout=1)
+            except queue.Full:
+                pass
+            self._thread.join(timeout=5)
+            self._thread = None
+        super().close()
+
+
+def parse_sample_rates(raw: str) -> Dict[str, float]:
+    """
+    Parses "event=rate" pairs separated by commas, e.g. "llm_call_start=0.1".
+    """
+    rates = {}
+    for item in raw.split(","):
+        if not item.strip():
+            continue
+        event, _, rate = item.partition("=")
+        rates[event.strip()] = float(rate)
+    return rates
+
+
+_event_sampler = EventSampler(parse_sample_rates(settings.log_sample_rates_raw))
+_async_handler: BatchingQueueHandler | None = None
+
+
+def _build_handler() -> logging.Handler:
+    global _async_handler
+
+    if not settings.log_async:
+        return logging.StreamHandler(sys.stdout)
+
+    if _async_handler is None:
+        _async_handler = BatchingQueueHandler(
+            max_queue_size=settings.log_queue_max_size,
+            batch_size=settings.log_batch_size,
+        )
+        _async_handler.start()
+        atexit.register(_async_handler.close)
+    return _async_handler
 
 
 def get_logger(name: str = DEFAULT_LOGGER_NAME, level: int = logging.INFO) -> logging.Logger:
@@ -28,7 +182,7 @@ def get_logger(name: str = DEFAULT_LOGGER_NAME, level: int = logging.INFO) -> lo
     logger.setLevel(level)
 
     if not logger.handlers:
-        handler = logging.StreamHandler(sys.stdout)
+        handler = _build_handler()
         handler.setFormatter(JsonFormatter())
         logger.addHandler(handler)
         logger.propagate = False
@@ -37,6 +191,9 @@ def get_logger(name: str = DEFAULT_LOGGER_NAME, level: int = logging.INFO) -> lo
 
 
 def log_event(logger: logging.Logger, event: str, **fields: Any) -> None:
+    # Sample before building the record so dropped events cost almost nothing.
+    if not _event_sampler.keep(event):
+        return
     cleaned_fields: Dict[str, Any] = {key: value for key, value in fields.items() if value is not None}
     cleaned_fields["event"] = event
     logger.info(event, extra={"extra_fields": cleaned_fields})
@@ -1,5 +1,6 @@
 import dotenv
-from src.story_engine import run_story_engine
+from src.story_engine import is_error_story, run_revision_engine, run_story_engine
+from src.validators import validate_user_input
 
 dotenv.load_dotenv(".env.local")
 
@@ -48,9 +49,22 @@ def main():
             print("Invalid choice. Please try again.")
             continue
 
-        story = run_story_engine(user_input, feedback=feedback)
+        is_valid, error_message = validate_user_input(feedback)
+        if not is_valid:
+            print(error_message)
+            continue
+
+        # Edit the current story; only regenerate if there is none yet.
+        if is_error_story(response):
+            result = run_story_engine(user_input, feedback=feedback)
+        else:
+            result = run_revision_engine(response, feedback, user_input)
+        if is_error_story(result):
+            print(result)
+            continue
+        response = result
         print("\n--- UPDATED BEDTIME STORY ---\n")
-        print(story)
+        print(response)
 
 
 if __name__ == "__main__":
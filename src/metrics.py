@@ -0,0 +1,372 @@
+"""
+In-process metrics for the story pipeline, exposed in the Prometheus text
+format by the /metrics endpoint.
+
+Each metric keeps its samples in a dict keyed by label values and guarded by
+a lock, so recording a sample is a dict update and a bisect; all formatting
+happens at scrape time.
+"""
+
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterable, Iterator
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers fast cache hits up to multi-attempt generations.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: list["_Metric"] = []
+
+    def register(self, metric: "_Metric") -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class _Metric:
+    metric_type = "untyped"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        registry: MetricsRegistry | None = REGISTRY,
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def _key(self, labels: dict[str, str]) -> tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.metric_type}",
+        ]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> list[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """
+    Monotonic counter with optional labels.
+    """
+
+    metric_type = "counter"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        registry: MetricsRegistry | None = REGISTRY,
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    """
+    Value that can go up and down, e.g. requests in flight.
+    """
+
+    metric_type = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track_in_progress(self, **labels: str) -> Iterator[None]:
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    """
+    Cumulative histogram with fixed bucket bounds.
+    """
+
+    metric_type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = LATENCY_BUCKETS,
+        registry: MetricsRegistry | None = REGISTRY,
+    ) -> None:
+        super().__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (+Inf last), sum, count]
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(time.monotonic() - started_at, **labels)
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(self._key(labels))
+        return state[2] if state else 0
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def _samples(self) -> list[str]:
+        with self._lock:
+            items = sorted((key, [list(state[0]), state[1], state[2]]) for key, state in self._values.items())
+
+        lines = []
+        bucket_labelnames = self.labelnames + ("le",)
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                labels = _format_labels(bucket_labelnames, key + (_format_value(bound),))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+LLM_CALL_LATENCY = Histogram(
+    "story_llm_call_duration_seconds",
+    "Latency of LLM calls by model and pipeline stage.",
+    ["model", "stage"],
+)
+LLM_CALL_ERRORS = Counter(
+    "story_llm_call_errors_total",
+    "LLM calls that raised, by model and pipeline stage.",
+    ["model", "stage"],
+)
+STORY_REQUEST_LATENCY = Histogram(
+    "story_request_duration_seconds",
+    "End-to-end latency of story requests.",
+    ["route", "status"],
+)
+STORY_ATTEMPTS = Histogram(
+    "story_generation_attempts",
+    "Generation attempts used per story request.",
+    buckets=(1, 2, 3, 4, 5, 6, 8, 10),
+)
+JUDGE_VERDICTS = Counter(
+    "story_judge_verdicts_total",
+    "Judge verdicts returned by the LLM judge.",
+    ["verdict"],
+)
+VALIDATION_FAILURES = Counter(
+    "story_validation_failures_total",
+    "Validation failures by stage (input, pre_judge, final) and reason.",
+    ["stage", "reason"],
+)
+JUDGE_CALLS_AVOIDED = Counter(
+    "story_judge_calls_avoided_total",
+    "Judge LLM calls skipped because a local pre-judge check failed.",
+    ["rule"],
+)
+REQUESTS_IN_FLIGHT = Gauge(
+    "story_requests_in_flight",
+    "Story requests currently being processed.",
+    ["route"],
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "story_rate_limit_rejections_total",
+    "Requests rejected by the rate limiter.",
+    ["path"],
+)
+QUOTA_REJECTIONS = Counter(
+    "story_quota_rejections_total",
+    "Story requests rejected by per-user limits, by limit (concurrency, requests, tokens).",
+    ["limit"],
+)
+STORY_REQUESTS_COALESCED = Counter(
+    "story_requests_coalesced_total",
+    "Story requests served by joining an identical in-flight generation.",
+)
+JOB_QUEUE_DEPTH = Gauge(
+    "story_job_queue_depth",
+    "Story jobs waiting for a worker.",
+)
+STORY_JOBS = Counter(
+    "story_jobs_total",
+    "Finished story jobs by final status.",
+    ["status"],
+)
+LOG_RECORDS_DROPPED = Counter(
+    "story_log_records_dropped_total",
+    "Log records dropped because the async log queue was full.",
+)
+LOG_EVENTS_SAMPLED_OUT = Counter(
+    "story_log_events_sampled_out_total",
+    "Log events skipped by LOG_SAMPLE_RATES, by event.",
+    ["event"],
+)
+STORY_BATCH_ITEMS = Counter(
+    "story_batch_items_total",
+    "Items of POST /stories/batch requests by final status.",
+    ["status"],
+)
+LLM_TOKENS = Counter(
+    "story_llm_tokens_total",
+    "Tokens reported by LLM responses, by model, stage and kind (prompt, completion, cached_prompt).",
+    ["model", "stage", "kind"],
+)
+STORY_REVISIONS = Counter(
+    "story_revisions_total",
+    "Revision-mode requests by outcome (success, fail, invalid_input, error).",
+    ["status"],
+)
+STORY_ATTEMPT_RESULTS = Counter(
+    "story_attempt_results_total",
+    "Generation attempts by pipeline mode (two_call, fused) and result (pass, fail, error).",
+    ["mode", "result"],
+)
+STORY_ATTEMPT_LATENCY = Histogram(
+    "story_attempt_latency_seconds",
+    "Latency of one generation attempt (or speculative candidate) by pipeline mode.",
+    ["mode"],
+)
+LLM_OUTPUT_TOKEN_CAP = Gauge(
+    "story_llm_output_token_cap",
+    "Output-token cap last sent to the LLM by stage (tuned when STAGE_MAX_TOKENS_AUTOTUNE is on).",
+    ["stage"],
+)
+LLM_TRUNCATIONS = Counter(
+    "story_llm_truncations_total",
+    "LLM responses cut off by the output-token cap (finish_reason=length), by model and stage.",
+    ["model", "stage"],
+)
+PROMPT_CHARS = Histogram(
+    "story_prompt_chars",
+    "Size in characters of rendered prompts (system plus user message), by template.",
+    ["template"],
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000, 32000),
+)
+PROMPT_STATIC_CHARS = Gauge(
+    "story_prompt_static_chars",
+    "Size in characters of each template's static system prompt, the part providers can cache.",
+    ["template"],
+)
+PROMPT_TEMPLATE_INFO = Gauge(
+    "story_prompt_template_info",
+    "Always 1; labels give the content hash (version) of each registered prompt template.",
+    ["template", "version"],
+)
+LLM_HEDGES = Counter(
+    "story_llm_hedges_total",
+    "Hedged LLM calls by stage and outcome (hedge_won, primary_won, both_failed, budget_exhausted).",
+    ["stage", "outcome"],
+)
+LLM_FALLBACKS = Counter(
+    "story_llm_fallbacks_total",
+    "LLM calls retried on a backup model after the previous model failed, by stage and target model.",
+    ["stage", "model"],
+)
+LLM_RETRIES = Counter(
+    "story_llm_retries_total",
+    "LLM calls retried after a retryable error, by stage, model and error type.",
+    ["stage", "model", "error"],
+)
+LLM_CIRCUIT_STATE = Gauge(
+    "story_llm_circuit_state",
+    "Circuit breaker state per model: 0 closed, 1 half-open, 2 open.",
+    ["model"],
+)
+LLM_CIRCUIT_REJECTIONS = Counter(
+    "story_llm_circuit_rejections_total",
+    "LLM calls refused without contacting the upstream because the model's circuit was open.",
+    ["stage", "model"],
+)
+STORY_DEADLINE_OUTCOMES = Counter(
+    "story_deadline_outcomes_total",
+    "Story requests that ran out of deadline, by outcome (best_effort: a locally valid story was returned, exceeded: none was).",
+    ["outcome"],
+)
+STORY_JUDGE_SKIPPED = Counter(
+    "story_judge_skipped_total",
+    "Judge calls skipped because too little of the request deadline was left.",
+)
@@ -0,0 +1,164 @@
+"""
+Per-stage LLM call profiles.
+
+Each pipeline stage (classify, generate, judge, revise, fused) gets its own
+model, output-token cap, temperature, timeout and stop sequences, so cheap
+stages can run on smaller models with small caps while storytelling keeps
+enough temperature for retries to differ. Profiles start from the defaults
+below and are overridden per stage with STAGE_PROFILE_<STAGE>, e.g.
+
+    STAGE_PROFILE_CLASSIFY="model=gpt-4o-mini,max_tokens=64,temperature=0,timeout=10"
+    STAGE_PROFILE_GENERATE="temperature=0.9,stop=THE END|###"
+
+Stop sequences and fallback models are separated by "|"; a stage without
+its own fallback list uses LLM_FALLBACK_MODELS. With STAGE_MAX_TOKENS_AUTOTUNE
+the cap actually sent is tuned down from the profile's max_tokens to the
+observed output sizes (see OutputTokenTuner).
+"""
+
+import math
+import threading
+from collections import deque
+from dataclasses import dataclass, replace
+
+from src.config import settings
+from src.metrics import LLM_OUTPUT_TOKEN_CAP
+
+
+@dataclass(frozen=True)
+class StageProfile:
+    model: str
+    max_tokens: int
+    temperature: float
+    timeout_seconds: float
+    stop: tuple[str, ...] = ()
+    fallback_models: tuple[str, ...] = ()
+
+
+def _split_models(raw: str) -> tuple[str, ...]:
+    return tuple(model.strip() for model in raw.replace("|", ",").split(",") if model.strip())
+
+
+def _default_profile(max_tokens: int, temperature: float) -> StageProfile:
+    return StageProfile(
+        model=settings.openai_model,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        timeout_seconds=settings.openai_timeout_seconds,
+        fallback_models=_split_models(settings.llm_fallback_models_raw),
+    )
+
+
+# Caps leave room above what each stage needs: a JSON classification is
+# ~50 tokens, a judge verdict a few hundred, a 400-600 word story ~800.
+DEFAULT_STAGE_PROFILES = {
+    "classify": _default_profile(max_tokens=150, temperature=0.0),
+    "generate": _default_profile(max_tokens=1500, temperature=0.8),
+    "judge": _default_profile(max_tokens=600, temperature=0.0),
+    "revise": _default_profile(max_tokens=1500, temperature=0.5),
+    "fused": _default_profile(max_tokens=2200, temperature=0.7),
+}
+# Calls without a known stage keep the historical defaults.
+FALLBACK_PROFILE = _default_profile(max_tokens=3000, temperature=0.1)
+
+
+def parse_stage_profile(raw: str, base: StageProfile) -> StageProfile:
+    """
+    Applies "key=value" overrides separated by commas to `base`. Keys are
+    model, max_tokens, temperature, timeout, stop and fallback (the last two
+    "|"-separated).
+    """
+    overrides = {}
+    for item in raw.split(","):
+        if not item.strip():
+            continue
+        key, _, value = item.partition("=")
+        key, value = key.strip(), value.strip()
+        if key == "model":
+            overrides["model"] = value
+        elif key == "max_tokens":
+            overrides["max_tokens"] = int(value)
+        elif key == "temperature":
+            overrides["temperature"] = float(value)
+        elif key in ("timeout", "timeout_seconds"):
+            overrides["timeout_seconds"] = float(value)
+        elif key == "stop":
+            overrides["stop"] = tuple(stop for stop in value.split("|") if stop)
+        elif key == "fallback":
+            overrides["fallback_models"] = _split_models(value)
+        else:
+            raise ValueError(f"Unknown stage profile key: {key}")
+    return replace(base, **overrides)
+
+
+def load_stage_profiles() -> dict[str, StageProfile]:
+    raw_profiles = {
+        "classify": settings.stage_profile_classify_raw,
+        "generate": settings.stage_profile_generate_raw,
+        "judge": settings.stage_profile_judge_raw,
+        "revise": settings.stage_profile_revise_raw,
+        "fused": settings.stage_profile_fused_raw,
+    }
+    return {
+        stage: parse_stage_profile(raw_profiles[stage], default)
+        for stage, default in DEFAULT_STAGE_PROFILES.items()
+    }
+
+
+stage_profiles = load_stage_profiles()
+
+
+def get_stage_profile(stage: str) -> StageProfile:
+    return stage_profiles.get(stage, FALLBACK_PROFILE)
+
+
+class OutputTokenTuner:
+    """
+    Tunes a stage's output-token cap to what it actually produces: the cap
+    is `headroom` times the largest of the last `window` completion sizes,
+    kept between `floor` and the profile's max_tokens. Until `min_samples`
+    outputs are seen the profile cap is used. A truncated response
+    (finish_reason "length") clears the stage's samples, so the cap goes
+    straight back to the profile maximum.
+    """
+
+    def __init__(
+        self,
+        window: int = 200,
+        min_samples: int = 20,
+        headroom: float = 1.5,
+        floor: int = 32,
+    ) -> None:
+        self.window = window
+        self.min_samples = min_samples
+        self.headroom = headroom
+        self.floor = floor
+        self._samples: dict[str, deque[int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, completion_tokens: int, truncated: bool = False) -> None:
+        with self._lock:
+            samples = self._samples.setdefault(stage, deque(maxlen=self.window))
+            if truncated:
+                samples.clear()
+            elif completion_tokens > 0:
+                samples.append(completion_tokens)
+
+    def cap(self, stage: str, max_tokens: int) -> int:
+        with self._lock:
+            samples = self._samples.get(stage)
+            if not samples or len(samples) < self.min_samples:
+                cap = max_tokens
+            else:
+                cap = min(max_tokens, max(self.floor, math.ceil(max(samples) * self.headroom)))
+        LLM_OUTPUT_TOKEN_CAP.set(cap, stage=stage)
+        return cap
+
+
+output_token_tuner = OutputTokenTuner(headroom=settings.stage_max_tokens_headroom)
+
+
+def resolve_max_tokens(stage: str, profile: StageProfile) -> int:
+    if not settings.stage_max_tokens_autotune:
+        return profile.max_tokens
+    return output_token_tuner.cap(stage, profile.max_tokens)
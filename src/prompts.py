@@ -1,7 +1,87 @@
 """
 PROMPTS FOR THE AI AGENT DEPLOYMENT ENGINEER TAKEHOME
+
+Every prompt is a PromptTemplate registered in PROMPT_TEMPLATES. The static
+instructions (guardrails, rubric, output schema) live in the system prompt,
+which is identical on every call, and only the request, story and feedback
+go into the user message after it. Providers that cache prompt prefixes can
+then reuse the whole system prompt across requests. Templates are compiled
+once at import and each carries a content hash, `version`, that changes
+whenever its wording does.
 """
 
+import hashlib
+from string import Formatter
+
+from src.metrics import PROMPT_CHARS, PROMPT_STATIC_CHARS, PROMPT_TEMPLATE_INFO
+
+
+def prompt_fingerprint(*parts: str | None) -> str:
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update((part or "").encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()[:12]
+
+
+def _compile(text: str) -> tuple[tuple[str, str | None], ...]:
+    """
+    Splits a "{field}" template into (literal, field) pairs once, so
+    rendering is a join instead of re-parsing the template on every call.
+    """
+    return tuple((literal, field) for literal, field, _, _ in Formatter().parse(text))
+
+
+class PromptTemplate:
+    """
+    A system prompt plus a user-message template with optional sections.
+    `render` fills the user template, appends the named sections in order
+    and records the prompt's size under the template's name.
+    """
+
+    def __init__(self, name: str, system: str | None, user: str, **sections: str) -> None:
+        self.name = name
+        self.system = system
+        self.version = prompt_fingerprint(
+            name, system, user, *(f"{key}={text}" for key, text in sorted(sections.items()))
+        )
+        self._user = _compile(user)
+        self._sections = {key: _compile(text) for key, text in sections.items()}
+        PROMPT_STATIC_CHARS.set(len(system or ""), template=name)
+        PROMPT_TEMPLATE_INFO.set(1, template=name, version=self.version)
+
+    def render(self, *section_names: str, **fields: str) -> str:
+        parts = [self._user] + [self._sections[section] for section in section_names]
+        prompt = "".join(
+            literal + (str(fields[field]) if field is not None else "")
+            for compiled in parts
+            for literal, field in compiled
+        )
+        PROMPT_CHARS.observe(len(self.system or "") + len(prompt), template=self.name)
+        return prompt
+
+
+PROMPT_TEMPLATES: dict[str, PromptTemplate] = {}
+
+
+def register_template(template: PromptTemplate) -> PromptTemplate:
+    PROMPT_TEMPLATES[template.name] = template
+    return template
+
+
+def get_template(name: str) -> PromptTemplate:
+    return PROMPT_TEMPLATES[name]
+
+
+def _classification_fields(classification: dict[str, str]) -> dict[str, str]:
+    return {
+        key: classification.get(key, "not specified")
+        for key in ("theme", "tone", "genre")
+    }
+
+
+# STORYTELLER PROMPT
+
 STORYTELLER_SYSTEM_PROMPT = """
 You are a gentle and creative bedtime storyteller for children.
 
@@ -19,7 +99,62 @@ You must NEVER include:
 - Adult themes
 - Death or serious injury
 - Mean-spirited behavior without a positive resolution
+
+STORY REQUIREMENTS (MUST FOLLOW ALL):
+- Target age: 5–10 years old
+- Length: 400–600 words
+- Tone: calming, kind, and reassuring
+- Language: simple sentences and age-appropriate vocabulary
+
+STORY STRUCTURE:
+1. A friendly beginning that introduces the main character(s)
+2. A gentle problem or challenge (not scary)
+3. A thoughtful resolution where the problem is solved
+4. A happy ending
+5. A clear moral or lesson suitable for children
+
+End the story on a comforting and positive note.
+"""
+
+_STORY_REQUEST = """Write a bedtime story based on the following request:
+"{user_request}"
+"""
+_STORY_CONTEXT = """
+Story context:
+- Theme: {theme}
+- Tone: {tone}
+- Genre: {genre}
 """
+_STORY_FEEDBACK = """
+Please improve the story using the following feedback:
+"{feedback}"
+"""
+
+STORYTELLER_TEMPLATE = register_template(PromptTemplate(
+    "generate",
+    STORYTELLER_SYSTEM_PROMPT,
+    _STORY_REQUEST,
+    classification=_STORY_CONTEXT,
+    feedback=_STORY_FEEDBACK,
+))
+
+
+def _render_story_request(
+    template: PromptTemplate,
+    user_request: str,
+    classification: dict[str, str] | None,
+    feedback: str | None,
+) -> str:
+    sections = []
+    fields = {"user_request": user_request}
+    if classification:
+        sections.append("classification")
+        fields.update(_classification_fields(classification))
+    if feedback:
+        sections.append("feedback")
+        fields["feedback"] = feedback
+    return template.render(*sections, **fields)
+
 
 def build_storyteller_prompt(
     user_request: str,
@@ -29,152 +164,214 @@ def build_storyteller_prompt(
     """
     Building the storyteller prompt.
     """
+    return _render_story_request(STORYTELLER_TEMPLATE, user_request, classification, feedback)
+
+
+# REVISION PROMPT
+# Shares the storyteller's system prompt; the editing rules come before the
+# story so they stay part of the common prefix.
+
+REVISION_TEMPLATE = register_template(PromptTemplate(
+    "revise",
+    STORYTELLER_SYSTEM_PROMPT,
+    """EDITING RULES:
+- Change only what the feedback asks for; keep the characters, plot and wording otherwise
+- Keep it safe, calm and suitable for children aged 5–10
+- Keep it between 400 and 600 words, with a happy, comforting ending
+- Return ONLY the full revised story, with no notes or commentary
+""",
+    classification="""
+Keep the story's theme ({theme}) and tone ({tone}).
+""",
+    story="""
+Revise the bedtime story below using the following feedback:
+"{feedback}"
+
+STORY:
+\"\"\"
+{story}
+\"\"\"
+""",
+))
+
+
+def build_revision_prompt(
+    story: str,
+    feedback: str,
+    classification: dict[str, str] | None = None
+) -> str:
+    """
+    Building the edit prompt for revising an existing story.
+    """
+    if classification:
+        return REVISION_TEMPLATE.render(
+            "classification", "story", story=story, feedback=feedback, **_classification_fields(classification)
+        )
+    return REVISION_TEMPLATE.render("story", story=story, feedback=feedback)
 
-    base_prompt = f"""
-    Write a bedtime story based on the following request:
 
-    "{user_request}"
-    """
+# JUDGE PROMPT
 
-    if classification:
-        base_prompt += f"""
-
-        Story context:
-        - Theme: {classification.get("theme", "not specified")}
-        - Tone: {classification.get("tone", "not specified")}
-        - Genre: {classification.get("genre", "not specified")}
-        """
-    
-    if feedback:
-        base_prompt += f"""
+_JUDGE_RUBRIC = """
+Score EACH dimension from 1 to 5 and briefly explain the reason.
+
+SCORING GUIDE:
+1 = Very poor
+2 = Poor
+3 = Acceptable
+4 = Good
+5 = Excellent
+
+EVALUATION DIMENSIONS:
+
+1. AGE_APPROPRIATENESS
+- No scary, violent, or disturbing content
+- Simple, age-appropriate vocabulary
+- Themes suitable for children aged 5–10
+
+2. STORY_STRUCTURE
+- Clear beginning, middle, and end
+- Gentle problem or challenge
+- Clear and satisfying resolution
+
+3. ENGAGEMENT
+- Interesting and likable characters
+- Fun to read aloud
+- Keeps a child’s attention
+
+4. REQUEST_ALIGNMENT
+- Matches what the user asked for
+- Includes requested characters, setting, or theme
+- Does not ignore key elements of the request
+
+OVERALL VERDICT RULE:
+- PASS if ALL dimension scores are 3 or higher
+- FAIL if ANY dimension score is below 3
+"""
 
-        Please improve the story using the following feedback:
-        "{feedback}"
-        """
+_JUDGE_SCORES_SCHEMA = """"scores": {
+    "age_appropriateness": {"score": "<integer 1-5>", "reason": "<short explanation>"},
+    "story_structure": {"score": "<integer 1-5>", "reason": "<short explanation>"},
+    "engagement": {"score": "<integer 1-5>", "reason": "<short explanation>"},
+    "request_alignment": {"score": "<integer 1-5>", "reason": "<short explanation>"}
+},
+"verdict": "PASS or FAIL",
+"improvement_feedback": "<specific suggestions only if verdict is FAIL, otherwise empty string>"
+}
+"""
 
-    # Prompt Level Guardrails
-    base_prompt += """
-        STORY REQUIREMENTS (MUST FOLLOW ALL):
+JUDGE_SYSTEM_PROMPT = """
+You are a careful and fair evaluator of bedtime stories written for children aged 5 to 10.
 
-        - Target age: 5–10 years old
-        - Length: 400–600 words
-        - Tone: calming, kind, and reassuring
-        - Language: simple sentences and age-appropriate vocabulary
+You care deeply about child safety, clarity, emotional warmth,
+and whether the story follows the user's request.
+""" + _JUDGE_RUBRIC + """
+OUTPUT FORMAT RULES (VERY IMPORTANT):
+- Return ONLY valid JSON
+- Do NOT include markdown
+- Do NOT include any text outside JSON
+
+JSON SCHEMA:
+{
+""" + _JUDGE_SCORES_SCHEMA
+
+JUDGE_TEMPLATE = register_template(PromptTemplate(
+    "judge",
+    JUDGE_SYSTEM_PROMPT,
+    "Evaluate the following bedtime story for a child aged 5–10.\n",
+    request="""
+The user asked for:
+"{user_request}"
+""",
+    story="""
+STORY:
+\"\"\"
+{story}
+\"\"\"
+""",
+))
 
-        STORY STRUCTURE:
-        1. A friendly beginning that introduces the main character(s)
-        2. A gentle problem or challenge (not scary)
-        3. A thoughtful resolution where the problem is solved
-        4. A happy ending
-        5. A clear moral or lesson suitable for children
 
-        End the story on a comforting and positive note.
-        """
+def build_judge_prompt(story: str, user_request: str | None = None) -> str:
+    if user_request:
+        return JUDGE_TEMPLATE.render("request", "story", story=story, user_request=user_request)
+    return JUDGE_TEMPLATE.render("story", story=story)
+
+
+# FUSED GENERATE-AND-JUDGE PROMPT
+# One call that writes the story and scores it against the judge's rubric,
+# saving the second round trip (and resending the story) per attempt. The
+# user message is the storyteller's; the rubric and schema are static.
+
+FUSED_SYSTEM_PROMPT = STORYTELLER_SYSTEM_PROMPT + """
+After writing, you review your own story as a careful and fair evaluator
+would, scoring it honestly against the rubric below.
+""" + _JUDGE_RUBRIC + """
+OUTPUT FORMAT RULES (VERY IMPORTANT):
+- Return ONLY valid JSON
+- Do NOT include markdown or any text outside JSON
+- Put the complete story in "story", with paragraphs separated by \\n
+
+JSON SCHEMA:
+{
+"story": "<the full story>",
+""" + _JUDGE_SCORES_SCHEMA
+
+FUSED_TEMPLATE = register_template(PromptTemplate(
+    "fused",
+    FUSED_SYSTEM_PROMPT,
+    _STORY_REQUEST,
+    classification=_STORY_CONTEXT,
+    feedback=_STORY_FEEDBACK,
+))
+
+
+def build_fused_prompt(
+    user_request: str,
+    classification: dict[str, str] | None = None,
+    feedback: str | None = None
+) -> str:
+    """
+    Building the storyteller prompt plus a self-evaluation in JSON.
+    """
+    return _render_story_request(FUSED_TEMPLATE, user_request, classification, feedback)
 
-    return base_prompt
 
+# CLASSIFICATION PROMPT
 
-# JUDGE PROMPT
+CLASSIFIER_SYSTEM_PROMPT = """
+Analyze bedtime story requests and extract high-level attributes.
 
-JUDGE_SYSTEM_PROMPT = """
-You are a careful and fair evaluator of bedtime stories written for children aged 5 to 10.
+Return ONLY valid JSON with the following keys:
+- theme (e.g., friendship, courage, kindness)
+- tone (e.g., calm, playful, adventurous)
+- genre (e.g., animals, fantasy, robots, everyday life)
 
-You care deeply about child safety, clarity, emotional warmth,
-and whether the story follows the user's request.
+JSON only. No extra text.
 """
 
-def build_judge_prompt(story: str, user_request: str | None = None) -> str:
-    return f"""
-        Evaluate the following bedtime story for a child aged 5–10.
-
-        STORY:
-        \"\"\"
-        {story}
-        \"\"\"
-
-        Your task is to evaluate the story across the dimensions listed below.
-        Score EACH dimension from 1 to 5 and briefly explain the reason.
-
-        SCORING GUIDE:
-        1 = Very poor
-        2 = Poor
-        3 = Acceptable
-        4 = Good
-        5 = Excellent
-
-        EVALUATION DIMENSIONS:
-
-        1. AGE_APPROPRIATENESS
-        - No scary, violent, or disturbing content
-        - Simple, age-appropriate vocabulary
-        - Themes suitable for children aged 5–10
-
-        2. STORY_STRUCTURE
-        - Clear beginning, middle, and end
-        - Gentle problem or challenge
-        - Clear and satisfying resolution
-
-        3. ENGAGEMENT
-        - Interesting and likable characters
-        - Fun to read aloud
-        - Keeps a child’s attention
-
-        4. REQUEST_ALIGNMENT
-        - Matches what the user asked for
-        - Includes requested characters, setting, or theme
-        - Does not ignore key elements of the request
-
-        OVERALL VERDICT RULE:
-        - PASS if ALL dimension scores are 3 or higher
-        - FAIL if ANY dimension score is below 3
-
-        OUTPUT FORMAT RULES (VERY IMPORTANT):
-        - Return ONLY valid JSON
-        - Do NOT include markdown
-        - Do NOT include any text outside JSON
-
-        JSON SCHEMA:
-        {{
-        "scores": {{
-            "age_appropriateness": {{
-            "score": "<integer 1-5>",
-            "reason": "<short explanation>"
-            }},
-            "story_structure": {{
-            "score": "<integer 1-5>",
-            "reason": "<short explanation>"
-            }},
-            "engagement": {{
-            "score": "<integer 1-5>",
-            "reason": "<short explanation>"
-            }},
-            "request_alignment": {{
-            "score": "<integer 1-5>",
-            "reason": "<short explanation>"
-            }}
-        }},
-        "verdict": "PASS or FAIL",
-        "improvement_feedback": "<specific suggestions only if verdict is FAIL, otherwise empty string>"
-        }}
-        """
+CLASSIFICATION_TEMPLATE = register_template(PromptTemplate(
+    "classify",
+    CLASSIFIER_SYSTEM_PROMPT,
+    'REQUEST:\n"{user_request}"\n',
+))
+
 
 def build_classification_prompt(user_request: str) -> str:
     """
     Light-weight classification of the user's request.
     Used to tailor storytelling style.
     """
+    return CLASSIFICATION_TEMPLATE.render(user_request=user_request)
 
-    return f"""
-        Analyze the following bedtime story request and extract high-level attributes.
-
-        REQUEST:
-        "{user_request}"
-
-        Return ONLY valid JSON with the following keys:
-        - theme (e.g., friendship, courage, kindness)
-        - tone (e.g., calm, playful, adventurous)
-        - genre (e.g., animals, fantasy, robots, everyday life)
 
-        JSON only. No extra text.
-        """
+# PROMPT VERSIONS
+# Used in cache keys so that editing a prompt automatically invalidates
+# anything produced with the old wording.
 
+CLASSIFICATION_PROMPT_VERSION = CLASSIFICATION_TEMPLATE.version
+STORYTELLER_PROMPT_VERSION = STORYTELLER_TEMPLATE.version
+JUDGE_PROMPT_VERSION = JUDGE_TEMPLATE.version
+STORY_PIPELINE_VERSION = prompt_fingerprint(
+    *(f"{name}={template.version}" for name, template in sorted(PROMPT_TEMPLATES.items()))
+)
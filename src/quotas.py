@@ -0,0 +1,205 @@
+"""
+Per-user concurrency limits and rolling request/token quotas.
+
+The rate limiter smooths request bursts; these limits bound how much LLM
+work one user can hold or spend. A user may have at most `max_concurrent`
+generations in flight and, within any rolling `window_seconds`, start at
+most `request_quota` of them and spend at most `token_quota` tokens. A limit
+of 0 disables it, and a disabled quota keeps no per-request history.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable
+
+
+class QuotaExceeded(Exception):
+    def __init__(self, limit: str, message: str, retry_after_seconds: float, max_value: int) -> None:
+        super().__init__(message)
+        self.limit = limit
+        self.message = message
+        self.retry_after_seconds = retry_after_seconds
+        self.max_value = max_value
+
+
+class _UserState:
+    __slots__ = ("in_flight", "requests", "tokens", "token_total", "last_seen")
+
+    def __init__(self) -> None:
+        self.in_flight = 0
+        self.last_seen = 0.0
+        self.requests: "deque[float]" = deque()
+        self.tokens: "deque[tuple[float, int]]" = deque()
+        self.token_total = 0
+
+
+class QuotaLease:
+    """
+    Holds one of the user's concurrency slots until released. Releasing
+    twice is a no-op, so it can be wired to more than one cleanup path.
+    """
+
+    def __init__(self, quotas: "UserQuotas", user_id: str) -> None:
+        self._quotas = quotas
+        self.user_id = user_id
+        self._released = False
+
+    def release(self) -> None:
+        if not self._released:
+            self._released = True
+            self._quotas._release(self.user_id)
+
+
+class UserQuotas:
+    def __init__(
+        self,
+        max_concurrent: int = 0,
+        request_quota: int = 0,
+        token_quota: int = 0,
+        window_seconds: float = 86400,
+        concurrency_retry_after_seconds: float = 1,
+        max_users: int = 10000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_concurrent = max_concurrent
+        self.request_quota = request_quota
+        self.token_quota = token_quota
+        self.window_seconds = window_seconds
+        self.concurrency_retry_after_seconds = concurrency_retry_after_seconds
+        self.max_users = max_users
+        self._clock = clock
+        self._users: "OrderedDict[str, _UserState]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _state(self, user_id: str, now: float) -> _UserState:
+        state = self._users.get(user_id)
+        if state is None:
+            if len(self._users) >= self.max_users:
+                self._evict(now)
+            state = self._users[user_id] = _UserState()
+        state.last_seen = now
+        self._users.move_to_end(user_id)
+        return state
+
+    def _evict(self, now: float) -> None:
+        """
+        Drops least recently seen users whose windows have fully expired.
+        Every request and token is recorded at a last_seen time, so a user
+        not seen for window_seconds has nothing left to count; dropping one
+        seen more recently would hand them a fresh quota. Users with
+        generations in flight are kept too, so max_users is a soft bound.
+        """
+        cutoff = now - self.window_seconds
+        for idle_user, idle_state in list(self._users.items()):
+            if len(self._users) < self.max_users or idle_state.last_seen > cutoff:
+                break
+            if idle_state.in_flight == 0:
+                del self._users[idle_user]
+
+    def _prune(self, state: _UserState, now: float) -> None:
+        cutoff = now - self.window_seconds
+        while state.requests and state.requests[0] <= cutoff:
+            state.requests.popleft()
+        while state.tokens and state.tokens[0][0] <= cutoff:
+            state.token_total -= state.tokens.popleft()[1]
+
+    def _token_retry_after(self, state: _UserState, now: float) -> float:
+        # Wait until enough old spend leaves the window to get under quota.
+        remaining = state.token_total
+        for recorded_at, tokens in state.tokens:
+            remaining -= tokens
+            if remaining < self.token_quota:
+                return recorded_at + self.window_seconds - now
+        return self.window_seconds
+
+    def acquire(self, user_id: str, count_request: bool = True) -> QuotaLease:
+        """
+        Takes a concurrency slot and counts a request against the user's
+        quota, or raises QuotaExceeded naming the limit that was hit. With
+        count_request=False only the slot is taken (and the token quota
+        checked); the requests are counted one by one with `admit`.
+        """
+        now = self._clock()
+        with self._lock:
+            state = self._state(user_id, now)
+            self._prune(state, now)
+
+            if self.max_concurrent and state.in_flight >= self.max_concurrent:
+                raise QuotaExceeded(
+                    "concurrency",
+                    f"Too many story requests in progress (limit {self.max_concurrent}).",
+                    self.concurrency_retry_after_seconds,
+                    self.max_concurrent,
+                )
+            self._check_quotas(state, now, count_request)
+            state.in_flight += 1
+            if count_request and self.request_quota:
+                state.requests.append(now)
+        return QuotaLease(self, user_id)
+
+    def admit(self, user_id: str) -> None:
+        """
+        Counts one more request against the request and token quotas
+        without taking a concurrency slot, for work done under a slot that
+        is already held (the items of a batch).
+        """
+        now = self._clock()
+        with self._lock:
+            state = self._state(user_id, now)
+            self._prune(state, now)
+            self._check_quotas(state, now, count_request=True)
+            if self.request_quota:
+                state.requests.append(now)
+
+    def _check_quotas(self, state: _UserState, now: float, count_request: bool) -> None:
+        if count_request and self.request_quota and len(state.requests) >= self.request_quota:
+            raise QuotaExceeded(
+                "requests",
+                f"Story request quota exhausted ({self.request_quota} per {int(self.window_seconds)}s).",
+                state.requests[0] + self.window_seconds - now,
+                self.request_quota,
+            )
+        if self.token_quota and state.token_total >= self.token_quota:
+            raise QuotaExceeded(
+                "tokens",
+                f"Token quota exhausted ({self.token_quota} per {int(self.window_seconds)}s).",
+                self._token_retry_after(state, now),
+                self.token_quota,
+            )
+
+    def _release(self, user_id: str) -> None:
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is not None and state.in_flight > 0:
+                state.in_flight -= 1
+
+    def record_tokens(self, user_id: str, tokens: int) -> None:
+        if tokens <= 0 or not self.token_quota:
+            return
+        now = self._clock()
+        with self._lock:
+            state = self._state(user_id, now)
+            self._prune(state, now)
+            state.tokens.append((now, tokens))
+            state.token_total += tokens
+
+    def usage(self, user_id: str) -> dict[str, int]:
+        now = self._clock()
+        with self._lock:
+            state = self._users.get(user_id)
+            if state is None:
+                return {"in_flight": 0, "requests": 0, "tokens": 0}
+            self._prune(state, now)
+            return {
+                "in_flight": state.in_flight,
+                "requests": len(state.requests),
+                "tokens": state.token_total,
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._users.clear()
+
+    def __len__(self) -> int:
+        return len(self._users)
@@ -0,0 +1,231 @@
+"""
+Token-bucket rate limiting with pluggable storage backends.
+
+Each (route, subject) pair gets a bucket that refills continuously, so a
+check is O(1) and needs no background sweeping. The in-memory backend keeps
+at most `max_keys` buckets and evicts the least recently used one; the Redis
+backend shares buckets across workers and replicas.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Protocol
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    capacity: int
+    refill_per_second: float
+
+    @classmethod
+    def per_window(cls, max_requests: int, window_seconds: float) -> "RateLimitRule":
+        return cls(capacity=max_requests, refill_per_second=max_requests / window_seconds)
+
+
+@dataclass(frozen=True)
+class RateLimitDecision:
+    allowed: bool
+    remaining: int
+    retry_after_seconds: float = 0.0
+
+
+class RateLimitBackend(Protocol):
+    # True when consume() waits on the network and must be kept off the
+    # event loop (see RateLimiter.check_async).
+    blocking: bool
+
+    def consume(self, key: str, rule: RateLimitRule, cost: int = 1) -> RateLimitDecision:
+        ...
+
+    def reset(self) -> None:
+        ...
+
+
+def _retry_after(tokens: float, cost: int, rule: RateLimitRule) -> float:
+    return max(0.0, (cost - tokens) / rule.refill_per_second)
+
+
+class InMemoryTokenBucketBackend:
+    """
+    Per-process buckets in an LRU-ordered dict capped at `max_keys`.
+
+    An evicted bucket behaves like a new, full one; the least recently used
+    buckets are the ones most likely to have refilled already.
+    """
+
+    blocking = False
+
+    def __init__(self, max_keys: int = 10000, clock: Callable[[], float] = time.monotonic) -> None:
+        self.max_keys = max_keys
+        self._clock = clock
+        self._buckets: "OrderedDict[str, tuple[float, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def consume(self, key: str, rule: RateLimitRule, cost: int = 1) -> RateLimitDecision:
+        now = self._clock()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (float(rule.capacity), now))
+            tokens = min(float(rule.capacity), tokens + (now - updated_at) * rule.refill_per_second)
+
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+                self.evictions += 1
+
+        if allowed:
+            return RateLimitDecision(allowed=True, remaining=int(tokens))
+        return RateLimitDecision(
+            allowed=False,
+            remaining=0,
+            retry_after_seconds=_retry_after(tokens, cost, rule),
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+            self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class RedisTokenBucketBackend:
+    """
+    Buckets stored in Redis (or any server speaking the Redis protocol) so
+    every worker and replica enforces the same limit. The refill-and-take
+    step runs as one Lua script using the server clock, and idle buckets
+    expire on their own once they would have refilled.
+
+    `client` is a redis.Redis-compatible client to use instead of one
+    created from `url`.
+    """
+
+    blocking = True
+
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local refill = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local clock = redis.call('TIME')
+    local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or capacity
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - ts) * refill)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+    redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / refill * 1000))
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url: str | None = None, key_prefix: str = "ratelimit:", client=None) -> None:
+        if client is None:
+            if redis is None:
+                raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the redis package is not installed.")
+            client = redis.Redis.from_url(url)
+        self.key_prefix = key_prefix
+        self._client = client
+        self._script = self._client.register_script(self.SCRIPT)
+
+    def consume(self, key: str, rule: RateLimitRule, cost: int = 1) -> RateLimitDecision:
+        allowed, tokens = self._script(
+            keys=[self.key_prefix + key],
+            args=[rule.capacity, rule.refill_per_second, cost],
+        )
+        tokens = float(tokens)
+        if allowed:
+            return RateLimitDecision(allowed=True, remaining=int(tokens))
+        return RateLimitDecision(
+            allowed=False,
+            remaining=0,
+            retry_after_seconds=_retry_after(tokens, cost, rule),
+        )
+
+    def reset(self) -> None:
+        for key in self._client.scan_iter(match=self.key_prefix + "*"):
+            self._client.delete(key)
+
+
+def parse_route_rules(raw: str) -> dict[str, RateLimitRule]:
+    """
+    Parses "PATH=MAX/WINDOW_SECONDS" pairs separated by commas, e.g.
+    "/story/stream=10/60,/stories/batch=2/60".
+    """
+    rules = {}
+    for item in raw.split(","):
+        if not item.strip():
+            continue
+        path, _, limit = item.partition("=")
+        max_requests, _, window_seconds = limit.partition("/")
+        rules[path.strip()] = RateLimitRule.per_window(int(max_requests), float(window_seconds))
+    return rules
+
+
+class RateLimiter:
+    """
+    Applies per-route rules on top of a backend. Routes without their own
+    rule use `default_rule`; exempt routes are never limited.
+    """
+
+    def __init__(
+        self,
+        backend: RateLimitBackend,
+        default_rule: RateLimitRule,
+        route_rules: dict[str, RateLimitRule] | None = None,
+        exempt_paths: set[str] | None = None,
+    ) -> None:
+        self.backend = backend
+        self.default_rule = default_rule
+        self.route_rules = route_rules or {}
+        self.exempt_paths = exempt_paths or set()
+
+    def rule_for(self, path: str) -> RateLimitRule | None:
+        if path in self.exempt_paths:
+            return None
+        return self.route_rules.get(path, self.default_rule)
+
+    def check(self, subject: str, path: str, cost: int = 1, bucket: str | None = None) -> RateLimitDecision | None:
+        """
+        Returns None for exempt routes, otherwise the backend's decision.
+        Each route has its own bucket per subject unless `bucket` names one
+        shared across routes.
+        """
+        rule = self.rule_for(path)
+        if rule is None:
+            return None
+        return self.backend.consume(f"{bucket or path}:{subject}", rule, cost)
+
+    async def check_async(self, subject: str, path: str, cost: int = 1, bucket: str | None = None) -> RateLimitDecision | None:
+        """
+        check() for code on the event loop: a blocking backend's round trip
+        runs in a worker thread instead of stalling every other request.
+        """
+        if self.backend.blocking and self.rule_for(path) is not None:
+            return await asyncio.to_thread(self.check, subject, path, cost, bucket)
+        return self.check(subject, path, cost, bucket)
+
+    def reset(self) -> None:
+        self.backend.reset()
+
+
+def retry_after_header(decision: RateLimitDecision) -> str:
+    return str(max(1, math.ceil(decision.retry_after_seconds)))
@@ -0,0 +1,276 @@
+"""
+Retry and circuit-breaker policy for LLM calls.
+
+call_model_async retries errors that are worth retrying (timeouts, connection
+errors, 408/409/429 and 5xx responses) with jittered exponential backoff,
+waiting at least as long as the upstream's Retry-After. A per-model
+CircuitBreaker counts consecutive retryable failures; once it opens, calls
+to that model fail immediately with CircuitOpenError (and move on to a
+fallback model, if any) until a single trial call after the recovery period
+succeeds. During an upstream brownout requests then fail in milliseconds
+instead of each one waiting out its timeout.
+
+The OpenAI clients are created with max_retries=0 so this is the only
+retry layer.
+"""
+
+import asyncio
+import email.utils
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+import httpx
+import openai
+
+from src.config import settings
+from src.deadlines import Deadline
+from src.metrics import LLM_CIRCUIT_STATE, LLM_RETRIES
+
+RETRYABLE_STATUS_CODES = frozenset({408, 409, 429})
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+_STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a model whose circuit breaker is open.
+    """
+
+    def __init__(self, model: str, retry_after_seconds: float) -> None:
+        super().__init__(f"Circuit open for model {model}; retry in {retry_after_seconds:.1f}s")
+        self.model = model
+        self.retry_after_seconds = retry_after_seconds
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    True for transient failures: timeouts, dropped connections, rate limits
+    and server errors. Bad requests, auth errors and parse errors are not
+    retried, and neither is an open circuit.
+    """
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUS_CODES or error.status_code >= 500
+    return isinstance(error, (httpx.TimeoutException, httpx.NetworkError, TimeoutError, ConnectionError))
+
+
+def retry_after_seconds(error: BaseException) -> float | None:
+    """
+    Seconds the upstream asked us to wait, from the retry-after-ms or
+    Retry-After header (delta-seconds or an HTTP date) of its response.
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms"):
+            return max(0.0, float(headers["retry-after-ms"]) / 1000)
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            retry_at = email.utils.parsedate_to_datetime(value)
+            return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    def __init__(
+        self,
+        max_retries: int = 2,
+        base_delay_seconds: float = 0.5,
+        max_delay_seconds: float = 8.0,
+        rng: Callable[[], float] = random.random,
+    ) -> None:
+        self.max_retries = max_retries
+        self.base_delay_seconds = base_delay_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self._rng = rng
+
+    def delay(self, retry: int, error: BaseException) -> float | None:
+        """
+        Seconds to wait before retry number `retry` (0-based) after `error`,
+        or None when the call should not be retried. The backoff is "full
+        jitter", a random delay up to base * 2**retry, raised to Retry-After
+        when the upstream sent one. A Retry-After beyond max_delay_seconds
+        is not worth waiting for within a request, so it ends the retries.
+        """
+        if retry >= self.max_retries or not is_retryable(error):
+            return None
+        ceiling = min(self.max_delay_seconds, self.base_delay_seconds * (2 ** retry))
+        delay = self._rng() * ceiling
+        requested = retry_after_seconds(error)
+        if requested is not None:
+            if requested > self.max_delay_seconds:
+                return None
+            delay = max(delay, requested)
+        return delay
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker for one model. `failure_threshold`
+    retryable failures in a row open it for `recovery_seconds`; after that
+    one trial call is let through (half-open) and its outcome closes or
+    re-opens the circuit. A threshold of 0 disables the breaker.
+
+    before_call() returns a token for the trial call (None for any other
+    call) that record_failure() takes back, so only the trial's own failure
+    ends the trial; a cancelled hedge or a call that started before the
+    circuit opened and fails late does not.
+    """
+
+    def __init__(
+        self,
+        model: str,
+        failure_threshold: int = 5,
+        recovery_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.model = model
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._clock = clock
+        self._state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial: object | None = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def before_call(self) -> object | None:
+        """
+        Raises CircuitOpenError if the call must not be made. Returns the
+        trial token when this call is the half-open trial, else None.
+        """
+        if self.failure_threshold <= 0:
+            return None
+        with self._lock:
+            if self._state == STATE_CLOSED:
+                return None
+            remaining = self._opened_at + self.recovery_seconds - self._clock()
+            if self._state == STATE_OPEN and remaining <= 0:
+                self._set_state(STATE_HALF_OPEN)
+            if self._state == STATE_HALF_OPEN and self._trial is None:
+                self._trial = object()
+                return self._trial
+        raise CircuitOpenError(self.model, max(0.0, remaining))
+
+    def record_success(self) -> None:
+        """
+        Any success closes the circuit, which also ends a pending trial.
+        """
+        with self._lock:
+            self._failures = 0
+            self._trial = None
+            if self._state != STATE_CLOSED:
+                self._set_state(STATE_CLOSED)
+
+    def record_failure(self, error: BaseException, trial: object | None = None) -> None:
+        """
+        Counts a failed call. Errors that say nothing about the upstream's
+        health (bad requests, cancelled hedges) only end a trial call. While
+        half-open only the trial's failure re-opens the circuit.
+        """
+        with self._lock:
+            is_trial = trial is not None and trial is self._trial
+            if is_trial:
+                self._trial = None
+            if not is_retryable(error):
+                return
+            self._failures += 1
+            if is_trial or (
+                self._state != STATE_HALF_OPEN
+                and self.failure_threshold > 0
+                and self._failures >= self.failure_threshold
+            ):
+                self._opened_at = self._clock()
+                self._set_state(STATE_OPEN)
+
+    def _set_state(self, state: str) -> None:
+        self._state = state
+        LLM_CIRCUIT_STATE.set(_STATE_VALUES[state], model=self.model)
+
+
+class CircuitBreakerRegistry:
+    def __init__(
+        self,
+        failure_threshold: int = 5,
+        recovery_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._clock = clock
+        self._breakers: dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(model)
+            if breaker is None:
+                breaker = self._breakers[model] = CircuitBreaker(
+                    model, self.failure_threshold, self.recovery_seconds, self._clock
+                )
+            return breaker
+
+    def clear(self) -> None:
+        with self._lock:
+            self._breakers.clear()
+
+
+def record_retry(stage: str, model: str, error: BaseException) -> None:
+    LLM_RETRIES.inc(stage=stage, model=model, error=type(error).__name__)
+
+
+async def call_with_retries_async(
+    call: Callable[[], Awaitable[Any]],
+    retry_policy: RetryPolicy,
+    stage: str,
+    model: str,
+    on_retry=None,
+    deadline: Deadline | None = None,
+) -> Any:
+    """
+    Awaits `call()` until it succeeds or `retry_policy` gives up, sleeping
+    between tries. `on_retry(retry, delay, error)` runs before each sleep.
+    No retry is started whose backoff alone would outlast `deadline`.
+    """
+    retry = 0
+    while True:
+        try:
+            return await call()
+        except Exception as e:
+            delay = retry_policy.delay(retry, e)
+            if delay is None or (deadline is not None and delay >= deadline.remaining()):
+                raise
+            record_retry(stage, model, e)
+            if on_retry is not None:
+                on_retry(retry + 1, delay, e)
+            await asyncio.sleep(delay)
+            retry += 1
+
+
+retry_policy = RetryPolicy(
+    max_retries=settings.llm_max_retries,
+    base_delay_seconds=settings.llm_retry_base_delay_seconds,
+    max_delay_seconds=settings.llm_retry_max_delay_seconds,
+)
+circuit_breakers = CircuitBreakerRegistry(
+    failure_threshold=settings.llm_circuit_failure_threshold,
+    recovery_seconds=settings.llm_circuit_recovery_seconds,
+)
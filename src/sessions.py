@@ -0,0 +1,83 @@
+"""
+Server-side story sessions for revision mode.
+
+Every story returned by /story is kept here under a random story id along
+with the request and classification that produced it. A revision names the
+id, so only the stored story and the new feedback need to go to the model.
+Sessions live in a bounded LRU with a TTL that is refreshed by each
+revision; an expired or evicted id simply means "generate a new story".
+"""
+
+import secrets
+import time
+from dataclasses import dataclass, field, replace
+from typing import Callable
+
+from src.cache import TTLCache
+from src.config import settings
+
+
+@dataclass(frozen=True)
+class StorySession:
+    story_id: str
+    subject: str
+    user_input: str
+    story: str
+    classification: dict | None = None
+    revisions: int = 0
+    created_at: float = field(default_factory=time.time)
+
+
+class StorySessionStore:
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl_seconds: float = 3600,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._sessions = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds, clock=clock)
+
+    @property
+    def enabled(self) -> bool:
+        return self._sessions.max_entries > 0
+
+    def create(self, subject: str, user_input: str, story: str, classification: dict | None = None) -> StorySession:
+        session = StorySession(
+            story_id=secrets.token_urlsafe(16),
+            subject=subject,
+            user_input=user_input,
+            story=story,
+            classification=dict(classification) if classification else None,
+        )
+        self._sessions.set(session.story_id, session)
+        return session
+
+    def get(self, story_id: str, subject: str) -> StorySession | None:
+        """
+        Returns the session only to the subject that created it.
+        """
+        session = self._sessions.get(story_id)
+        if session is None or session.subject != subject:
+            return None
+        return session
+
+    def revise(self, session: StorySession, story: str) -> StorySession:
+        """
+        Replaces the session's story with its revision. The id is kept, so
+        clients can keep revising the same story.
+        """
+        revised = replace(session, story=story, revisions=session.revisions + 1)
+        self._sessions.set(session.story_id, revised)
+        return revised
+
+    def clear(self) -> None:
+        self._sessions.clear()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+story_sessions = StorySessionStore(
+    max_entries=settings.story_session_max_entries,
+    ttl_seconds=settings.story_session_ttl_seconds,
+)
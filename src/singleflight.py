@@ -0,0 +1,58 @@
+"""
+In-flight deduplication of identical async calls.
+
+Concurrent callers that ask for the same key share one running task and
+all receive its result or exception. Each caller waits on the task through
+asyncio.shield, so one caller going away does not cancel the work for the
+others; the task is cancelled only when its last waiter leaves.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    def __init__(self) -> None:
+        self._flights: dict[Hashable, _Flight] = {}
+        self.started = 0
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._flights)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> tuple[Any, bool]:
+        """
+        Awaits `fn()` for the first caller of `key` and attaches later
+        callers to it while it runs. Returns (result, shared), where shared
+        is True for callers that joined an existing flight.
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _task: self._forget(key, flight))
+            self.started += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+                self._forget(key, flight)
+
+    def _forget(self, key: Hashable, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
@@ -1,26 +1,321 @@
+import asyncio
+import hashlib
 import json
+import math
 import time
 import uuid
 
+from src.cache import SQLiteCache, TieredCache, TTLCache, normalize_text
+from src.config import settings
+from src.deadlines import Deadline, DeadlineExceeded
 from src.logging_utils import get_logger, log_event
+from src.metrics import (
+    JUDGE_CALLS_AVOIDED,
+    JUDGE_VERDICTS,
+    STORY_ATTEMPT_LATENCY,
+    STORY_ATTEMPT_RESULTS,
+    STORY_ATTEMPTS,
+    STORY_DEADLINE_OUTCOMES,
+    STORY_JUDGE_SKIPPED,
+    STORY_REQUESTS_COALESCED,
+    STORY_REVISIONS,
+    VALIDATION_FAILURES,
+)
 from src.prompts import *
-from src.utils import call_model
+from src.resilience import CircuitOpenError
+from src.singleflight import SingleFlight
+from src.tracing import current_span, start_span, traced
+from src.usage import UsageLedger
+from src.profiles import get_stage_profile
+from src.utils import call_model_async, scoped_async_client, stream_model_async
 from src.validators import *
 
 MAX_RETRIES = 2
 
-def classify_request(user_input, logger=None, request_id: str | None = None) -> dict | None:
+# Classifications only depend on the request text, so revisions and repeated
+# prompts can reuse them instead of paying for another LLM round trip.
+classification_cache = TTLCache(
+    max_entries=settings.classification_cache_max_entries,
+    ttl_seconds=settings.classification_cache_ttl_seconds,
+)
+
+# Finished stories, keyed by request + feedback + model + prompt versions.
+# Only stories that passed validate_final_story are ever stored.
+story_cache = TieredCache(
+    TTLCache(
+        max_entries=settings.story_cache_max_entries,
+        ttl_seconds=settings.story_cache_ttl_seconds,
+    ),
+    SQLiteCache(settings.story_cache_sqlite_path, ttl_seconds=settings.story_cache_ttl_seconds)
+    if settings.story_cache_sqlite_path
+    else None,
+)
+
+# Identical (user_input, feedback) requests that arrive while one is already
+# generating wait for that generation instead of starting their own.
+story_flights = SingleFlight()
+# Width of the deadline windows within which requests may be coalesced.
+COALESCE_DEADLINE_BUCKET_SECONDS = 5.0
+
+FAILURE_MESSAGE = (
+    "Sorry, I couldn’t create a suitable bedtime story this time. "
+    "Please try rephrasing your request."
+)
+
+
+def is_error_story(story) -> bool:
+    """
+    The engines return user-facing error messages (FAILURE_MESSAGE or an
+    input validation error) in place of a story.
+    """
+    return not story or story in (FAILURE_MESSAGE, EMPTY_INPUT_ERROR, INAPPROPRIATE_INPUT_ERROR)
+
+# Pipeline modes. two_call generates the story and then judges it in a
+# second call; fused asks for the story and its rubric scores in one call.
+PIPELINE_TWO_CALL = "two_call"
+PIPELINE_FUSED = "fused"
+
+# LLM errors that end the request rather than the attempt: every model's
+# circuit is open, or the deadline has passed. Any other error has already
+# been through call_model_async's retries and fallbacks and costs one attempt.
+REQUEST_ENDING_ERRORS = (CircuitOpenError, DeadlineExceeded)
+
+
+def _classification_cache_key(user_input: str, model: str | None = None) -> tuple[str, str, str]:
+    model = model or get_stage_profile("classify").model
+    return normalize_text(user_input), model, CLASSIFICATION_PROMPT_VERSION
+
+
+def _cached_classification(user_input, logger, request_id: str | None) -> dict | None:
+    cached = classification_cache.get(_classification_cache_key(user_input))
+    if cached is not None:
+        log_event(
+            logger,
+            "classify_request",
+            request_id=request_id,
+            status="cache_hit",
+            latency_ms=0,
+        )
+        return dict(cached)
+    return None
+
+
+def _store_classification(user_input, parsed) -> None:
+    if isinstance(parsed, dict):
+        classification_cache.set(_classification_cache_key(user_input), dict(parsed))
+
+
+@traced("validate.pre_judge")
+def _pre_judge_gate(story: str, logger, request_id: str | None, attempt: int, judge_call_avoided: bool = True) -> str | None:
+    """
+    Runs the local pre-judge rules. Returns storyteller feedback when the
+    story is rejected, in which case the judge call is skipped. Fused
+    attempts have no judge call to skip and pass judge_call_avoided=False.
+    """
+    passed, rule, feedback = run_pre_judge_checks(story)
+    if passed:
+        return None
+
+    current_span().set_attribute("rule", rule)
+    if judge_call_avoided:
+        JUDGE_CALLS_AVOIDED.inc(rule=rule)
+    VALIDATION_FAILURES.inc(stage="pre_judge", reason=rule)
+    log_event(
+        logger,
+        "pre_judge_check",
+        request_id=request_id,
+        status="fail",
+        rule=rule,
+        feedback=feedback,
+        attempt=attempt,
+        judge_call_avoided=judge_call_avoided,
+    )
+    return feedback
+
+
+def _record_validation_failure(stage: str, error_message: str) -> None:
+    reason = VALIDATION_FAILURE_REASONS.get(error_message)
+    if reason:
+        VALIDATION_FAILURES.inc(stage=stage, reason=reason)
+
+
+def story_cache_key(user_input: str, feedback: str | None = None, mode: str | None = None) -> str:
+    """
+    Key of a validated story: the normalized request and feedback, the
+    effective pipeline mode, the models that write and judge the story in
+    that mode, and the prompt versions.
+    """
+    mode = mode or settings.story_pipeline_mode
+    stages = ("fused",) if mode == PIPELINE_FUSED else ("generate", "judge")
+    models = [get_stage_profile(stage).model for stage in stages]
+    payload = json.dumps(
+        [normalize_text(user_input), normalize_text(feedback), mode, models, STORY_PIPELINE_VERSION]
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _cached_story(cache_key: str | None, logger, request_id: str | None) -> str | None:
+    if cache_key is None:
+        return None
+    story = story_cache.get(cache_key)
+    current_span().set_attribute("cache_hit", bool(story))
+    log_event(
+        logger,
+        "story_cache",
+        request_id=request_id,
+        status="hit" if story else "miss",
+    )
+    return story
+
+
+def _token_ceiling_reached(usage: UsageLedger, logger, request_id: str | None, attempt: int) -> bool:
+    """
+    True once the request has spent more than its token ceiling, in which
+    case no further attempts are started.
+    """
+    if not usage.exceeded:
+        return False
+    log_event(
+        logger,
+        "token_ceiling_exceeded",
+        request_id=request_id,
+        total_tokens=usage.total.total_tokens,
+        max_tokens_per_request=usage.max_total_tokens,
+        skipped_attempt=attempt,
+    )
+    return True
+
+
+def _parse_fused_response(response: str) -> tuple[str | None, dict | None]:
+    """
+    Splits a fused response into (story, judge_result). Raises
+    json.JSONDecodeError for non-JSON output; the judge result is None when
+    the self-evaluation is missing.
+    """
+    parsed = json.loads(response)
+    story = parsed.get("story") if isinstance(parsed, dict) else None
+    if not isinstance(story, str) or not story.strip():
+        return None, None
+    if parsed.get("verdict") is None:
+        return story.strip(), None
+    judge_result = {
+        "scores": parsed.get("scores", {}),
+        "verdict": parsed.get("verdict"),
+        "improvement_feedback": parsed.get("improvement_feedback", ""),
+    }
+    return story.strip(), judge_result
+
+
+def _log_fused_result(logger, request_id: str | None, started_at: float, story, judge_result) -> None:
+    log_event(
+        logger,
+        "generate_and_judge_story",
+        request_id=request_id,
+        status="success" if story else "fail",
+        error=None if story else "missing_story",
+        latency_ms=int((time.monotonic() - started_at) * 1000),
+        word_count=len(story.split()) if story else 0,
+        verdict=judge_result.get("verdict") if judge_result else None,
+    )
+    if judge_result:
+        current_span().set_attribute("verdict", str(judge_result.get("verdict")))
+
+
+def _record_attempt(mode: str, started_at: float, error_message: str) -> None:
+    """
+    Per-attempt outcome and latency by pipeline mode, to compare the pass
+    rate and speed of fused and two-call attempts.
+    """
+    if not error_message:
+        result = "pass"
+    elif error_message == "judge_skipped":
+        result = "judge_skipped"
+    elif error_message in ("generation_failed", "judge_failed"):
+        result = "error"
+    else:
+        result = "fail"
+    STORY_ATTEMPT_RESULTS.inc(mode=mode, result=result)
+    STORY_ATTEMPT_LATENCY.observe(time.monotonic() - started_at, mode=mode)
+
+
+def _judge_skipped_for_deadline(deadline: Deadline | None, logger, request_id: str | None, attempt: int) -> bool:
+    """
+    True when the judge is not expected to finish before the deadline. The
+    story has passed the local checks by then and is returned unjudged.
+    """
+    if deadline is None or deadline.allows("judge"):
+        return False
+    STORY_JUDGE_SKIPPED.inc()
+    log_event(
+        logger,
+        "judge_story",
+        request_id=request_id,
+        status="skipped",
+        reason="deadline",
+        attempt=attempt,
+        remaining_ms=int(deadline.remaining() * 1000),
+    )
+    return True
+
+
+def _attempt_fits_deadline(deadline: Deadline | None, mode: str, attempt: int) -> bool:
+    """
+    The first attempt runs whenever any time is left; later attempts only
+    when a whole attempt is expected to finish before the deadline.
+    """
+    if deadline is None:
+        return True
+    if attempt == 1:
+        return not deadline.expired
+    return deadline.allows(*(("fused",) if mode == PIPELINE_FUSED else ("generate", "judge")))
+
+
+def _deadline_reached(best_story: str | None, logger, request_id: str | None, attempts: int, usage: UsageLedger, deadline: Deadline) -> str:
+    """
+    Ends a request that ran out of time with its best story that passed the
+    local checks, or the failure message when there is none.
     """
+    STORY_DEADLINE_OUTCOMES.inc(outcome="best_effort" if best_story else "exceeded")
+    STORY_ATTEMPTS.observe(attempts)
+    log_event(
+        logger,
+        "run_story_engine_end",
+        request_id=request_id,
+        status="success" if best_story else "fail",
+        attempts=attempts,
+        deadline_reached=True,
+        deadline_seconds=deadline.budget_seconds,
+        best_effort=bool(best_story),
+        usage=usage.summary(),
+    )
+    return best_story or FAILURE_MESSAGE
+
 
+@traced("story.classify")
+async def classify_request_async(user_input, logger=None, request_id: str | None = None, usage: UsageLedger | None = None, deadline: Deadline | None = None) -> dict | None:
+    """
     Classifies the user's request into a theme, tone, and genre.
     """
 
     prompt = build_classification_prompt(user_input)
     logger = logger or get_logger()
+    cached = _cached_classification(user_input, logger, request_id)
+    if cached is not None:
+        return cached
+
     started_at = time.monotonic()
     try:
-        response = call_model(user_prompt=prompt, logger=logger, request_id=request_id)
+        response = await call_model_async(
+            user_prompt=prompt,
+            system_prompt=CLASSIFIER_SYSTEM_PROMPT,
+            logger=logger,
+            request_id=request_id,
+            stage="classify",
+            usage=usage,
+            deadline=deadline,
+        )
         parsed = json.loads(response)
+        _store_classification(user_input, parsed)
         log_event(
             logger,
             "classify_request",
@@ -30,19 +325,22 @@ def classify_request(user_input, logger=None, request_id: str | None = None) ->
         )
         return parsed
 
-    except json.JSONDecodeError:
+    except Exception as e:
+        error = "invalid_json" if isinstance(e, json.JSONDecodeError) else str(e)
+        current_span().record_error(error)
         log_event(
             logger,
             "classify_request",
             request_id=request_id,
             status="fail",
-            error="invalid_json",
+            error=error,
             latency_ms=int((time.monotonic() - started_at) * 1000),
         )
         return None
-    
 
-def generate_story(user_input, classification, feedback=None, logger=None, request_id: str | None = None) -> str:
+
+@traced("story.generate")
+async def generate_story_async(user_input, classification, feedback=None, logger=None, request_id: str | None = None, usage: UsageLedger | None = None, deadline: Deadline | None = None) -> str:
     """
     Generates a bedtime story based on the user's request.
     """
@@ -50,13 +348,16 @@ def generate_story(user_input, classification, feedback=None, logger=None, reque
     prompt = build_storyteller_prompt(user_input, classification, feedback)
     logger = logger or get_logger()
     started_at = time.monotonic()
-    
+
     try:
-        story = call_model(
+        story = await call_model_async(
             user_prompt=prompt,
             system_prompt=STORYTELLER_SYSTEM_PROMPT,
             logger=logger,
             request_id=request_id,
+            stage="generate",
+            usage=usage,
+            deadline=deadline,
         )
         cleaned_story = story.strip()
         log_event(
@@ -70,6 +371,7 @@ def generate_story(user_input, classification, feedback=None, logger=None, reque
         return cleaned_story
 
     except Exception as e:
+        current_span().record_error(e)
         log_event(
             logger,
             "generate_story",
@@ -78,10 +380,63 @@ def generate_story(user_input, classification, feedback=None, logger=None, reque
             error=str(e),
             latency_ms=int((time.monotonic() - started_at) * 1000),
         )
+        if isinstance(e, REQUEST_ENDING_ERRORS):
+            raise
         return None
-    
 
-def judge_story(story, user_input, logger=None, request_id: str | None = None) -> dict:
+
+@traced("story.generate")
+async def generate_story_stream(user_input, classification, feedback=None, logger=None, request_id: str | None = None, usage: UsageLedger | None = None, deadline: Deadline | None = None):
+    """
+    Streaming variant of generate_story. Yields story text deltas as the
+    storyteller produces them; errors are logged and re-raised so the caller
+    can decide whether to restart.
+    """
+
+    prompt = build_storyteller_prompt(user_input, classification, feedback)
+    logger = logger or get_logger()
+    started_at = time.monotonic()
+    parts = []
+
+    try:
+        async for delta in stream_model_async(
+            user_prompt=prompt,
+            system_prompt=STORYTELLER_SYSTEM_PROMPT,
+            logger=logger,
+            request_id=request_id,
+            stage="generate",
+            usage=usage,
+            deadline=deadline,
+        ):
+            parts.append(delta)
+            yield delta
+
+        log_event(
+            logger,
+            "generate_story",
+            request_id=request_id,
+            status="success",
+            latency_ms=int((time.monotonic() - started_at) * 1000),
+            word_count=len("".join(parts).split()),
+            stream=True,
+        )
+
+    except Exception as e:
+        current_span().record_error(e)
+        log_event(
+            logger,
+            "generate_story",
+            request_id=request_id,
+            status="fail",
+            error=str(e),
+            latency_ms=int((time.monotonic() - started_at) * 1000),
+            stream=True,
+        )
+        raise
+
+
+@traced("story.judge")
+async def judge_story_async(story, user_input, logger=None, request_id: str | None = None, usage: UsageLedger | None = None, deadline: Deadline | None = None) -> dict:
     """
     Judges the story based on the user's request.
     """
@@ -90,13 +445,18 @@ def judge_story(story, user_input, logger=None, request_id: str | None = None) -
     started_at = time.monotonic()
 
     try:
-        response = call_model(
+        response = await call_model_async(
             user_prompt=prompt,
             system_prompt=JUDGE_SYSTEM_PROMPT,
             logger=logger,
             request_id=request_id,
+            stage="judge",
+            usage=usage,
+            deadline=deadline,
         )
         parsed = json.loads(response)
+        JUDGE_VERDICTS.inc(verdict=str(parsed.get("verdict")))
+        current_span().set_attribute("verdict", str(parsed.get("verdict")))
         log_event(
             logger,
             "judge_story",
@@ -107,36 +467,303 @@ def judge_story(story, user_input, logger=None, request_id: str | None = None) -
         )
         return parsed
 
-    except json.JSONDecodeError:
+    except Exception as e:
+        if isinstance(e, json.JSONDecodeError):
+            JUDGE_VERDICTS.inc(verdict="invalid_json")
+        error = "invalid_json" if isinstance(e, json.JSONDecodeError) else str(e)
+        current_span().record_error(error)
         log_event(
             logger,
             "judge_story",
             request_id=request_id,
             status="fail",
-            error="invalid_json",
+            error=error,
             latency_ms=int((time.monotonic() - started_at) * 1000),
         )
+        if isinstance(e, REQUEST_ENDING_ERRORS):
+            raise
         return None
-    
 
-def run_story_engine(user_input, feedback=None, max_retries=3, logger=None, request_id: str | None = None) -> str:
+
+@traced("story.generate_and_judge")
+async def generate_and_judge_story_async(user_input, classification, feedback=None, logger=None, request_id: str | None = None, usage: UsageLedger | None = None, deadline: Deadline | None = None) -> tuple[str | None, dict | None]:
+    """
+    Generates a story and its self-evaluation in one call. Returns
+    (story, judge_result); either is None when missing from the response.
+    """
+
+    prompt = build_fused_prompt(user_input, classification, feedback)
+    logger = logger or get_logger()
+    started_at = time.monotonic()
+
+    try:
+        response = await call_model_async(
+            user_prompt=prompt,
+            system_prompt=FUSED_SYSTEM_PROMPT,
+            logger=logger,
+            request_id=request_id,
+            stage="fused",
+            usage=usage,
+            deadline=deadline,
+        )
+        story, judge_result = _parse_fused_response(response)
+        _log_fused_result(logger, request_id, started_at, story, judge_result)
+        return story, judge_result
+
+    except Exception as e:
+        current_span().record_error(e)
+        log_event(
+            logger,
+            "generate_and_judge_story",
+            request_id=request_id,
+            status="fail",
+            error="invalid_json" if isinstance(e, json.JSONDecodeError) else str(e),
+            latency_ms=int((time.monotonic() - started_at) * 1000),
+        )
+        if isinstance(e, REQUEST_ENDING_ERRORS):
+            raise
+        return None, None
+
+
+async def _generate_and_judge_async(user_input, classification, feedback=None, logger=None, request_id: str | None = None, attempt: int = 1, usage: UsageLedger | None = None, mode: str = PIPELINE_TWO_CALL, deadline: Deadline | None = None):
+    """
+    One generate -> pre-judge -> judge -> validate pass, or in fused mode a
+    single generate-and-judge call followed by the same local checks.
+
+    Returns (story, judge_result, error_message). story or judge_result is
+    None when that stage failed; error_message is "" when the story passed.
+    A story rejected by the pre-judge gate gets a synthesized FAIL verdict
+    carrying the local feedback.
+    """
+    started_at = time.monotonic()
+    try:
+        result = await _generate_and_judge_once_async(user_input, classification, feedback, logger, request_id, attempt, usage, mode, deadline)
+    except Exception:
+        _record_attempt(mode, started_at, "generation_failed")
+        raise
+    _record_attempt(mode, started_at, result[2])
+    return result
+
+
+async def _generate_and_judge_once_async(user_input, classification, feedback, logger, request_id: str | None, attempt: int, usage: UsageLedger | None, mode: str, deadline: Deadline | None = None):
+    fused = mode == PIPELINE_FUSED
+    if fused:
+        story, judge_result = await generate_and_judge_story_async(
+            user_input, classification, feedback, logger=logger, request_id=request_id, usage=usage, deadline=deadline
+        )
+    else:
+        story = await generate_story_async(
+            user_input, classification, feedback, logger=logger, request_id=request_id, usage=usage, deadline=deadline
+        )
+        judge_result = None
+    if not story:
+        return None, None, "generation_failed"
+
+    pre_judge_feedback = _pre_judge_gate(story, logger, request_id, attempt, judge_call_avoided=not fused)
+    if pre_judge_feedback:
+        return story, {"verdict": "FAIL", "improvement_feedback": pre_judge_feedback}, "pre_judge_check_failed"
+
+    if not fused and _judge_skipped_for_deadline(deadline, logger, request_id, attempt):
+        return story, None, "judge_skipped"
+    if not fused:
+        judge_result = await judge_story_async(story, user_input, logger=logger, request_id=request_id, usage=usage, deadline=deadline)
+    if not judge_result:
+        return story, None, "judge_failed"
+
+    is_valid, error_message = validate_final_story(story, judge_result)
+    return story, judge_result, "" if is_valid else error_message
+
+
+async def _run_speculative_attempt(user_input, classification, feedback, candidates: int, logger=None, request_id: str | None = None, attempt: int = 1, usage: UsageLedger | None = None, mode: str = PIPELINE_TWO_CALL, deadline: Deadline | None = None):
+    """
+    Runs `candidates` generate -> judge passes concurrently and returns the
+    first one that passes validate_final_story, cancelling the others.
+
+    When no candidate passes, the first judged failure is returned so its
+    improvement feedback can drive the next attempt. When every candidate
+    raises (see REQUEST_ENDING_ERRORS), the last error is raised.
+    """
+    started_at = time.monotonic()
+    tasks = [
+        asyncio.create_task(
+            _generate_and_judge_async(
+                user_input,
+                classification,
+                feedback,
+                logger=logger,
+                request_id=request_id,
+                attempt=attempt,
+                usage=usage,
+                mode=mode,
+                deadline=deadline,
+            )
+        )
+        for _ in range(candidates)
+    ]
+    fallback = (None, None, "generation_failed")
+    finished = 0
+    last_error = None
+
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                result = await next_done
+            except Exception as e:
+                last_error = e
+                log_event(
+                    logger,
+                    "speculative_candidate",
+                    request_id=request_id,
+                    status="fail",
+                    error=str(e),
+                )
+                continue
+            finally:
+                finished += 1
+
+            story, judge_result, error_message = result
+            if story and judge_result and not error_message:
+                log_event(
+                    logger,
+                    "speculative_attempt",
+                    request_id=request_id,
+                    status="success",
+                    candidates=candidates,
+                    finished=finished,
+                    cancelled=candidates - finished,
+                    latency_ms=int((time.monotonic() - started_at) * 1000),
+                )
+                return result
+
+            # Prefer a judged failure over an unjudged one for its feedback.
+            if fallback[1] is None and (judge_result or fallback[0] is None):
+                fallback = result
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Wait for the losers to unwind so none outlives this attempt.
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    log_event(
+        logger,
+        "speculative_attempt",
+        request_id=request_id,
+        status="fail",
+        candidates=candidates,
+        latency_ms=int((time.monotonic() - started_at) * 1000),
+    )
+    # Every candidate raised: no model is taking calls or time is up.
+    if fallback[0] is None and last_error is not None:
+        raise last_error
+    return fallback
+
+
+def _flight_key(user_input, feedback, mode: str | None, candidates: int | None, deadline: Deadline | None) -> tuple:
+    """
+    Requests only share a run when it is the run they would have made
+    themselves: same story key (which covers the pipeline mode), same
+    number of speculative candidates, and deadlines that end within the
+    same COALESCE_DEADLINE_BUCKET_SECONDS window, so no caller gets a
+    result cut short by someone else's tighter deadline.
+    """
+    candidates = max(1, min(candidates or settings.speculative_candidates, settings.max_speculative_candidates))
+    deadline_bucket = None if deadline is None else math.floor(deadline.expires_at / COALESCE_DEADLINE_BUCKET_SECONDS)
+    return story_cache_key(user_input, feedback, mode), candidates, deadline_bucket
+
+
+@traced("story.engine")
+async def run_story_engine_async(
+    user_input,
+    feedback=None,
+    max_retries=3,
+    logger=None,
+    request_id: str | None = None,
+    candidates: int | None = None,
+    use_cache: bool = True,
+    usage: UsageLedger | None = None,
+    mode: str | None = None,
+    deadline: Deadline | None = None,
+) -> str:
     """
     Runs the story engine.
+
+    Token usage of every LLM call is recorded in `usage` (a fresh ledger if
+    none is passed); once it exceeds MAX_TOKENS_PER_REQUEST no further
+    attempts are made. `mode` (default STORY_PIPELINE_MODE) picks two-call
+    or fused attempts. With a `deadline` (see src/deadlines.py), LLM
+    timeouts shrink to the time left, attempts and the judge are skipped
+    when they would not finish in time, and the latest story that passed
+    the local checks is returned once time runs out.
+
+    When `candidates` (or SPECULATIVE_CANDIDATES) is greater than one, each
+    attempt races that many generate -> judge passes (or fused calls, see
+    `mode`) and keeps the first story that passes validation.
+
+    Concurrent calls with the same (user_input, feedback) and compatible
+    options (see _flight_key) share a single run and its result; the LLM
+    usage, spent once, is charged to the first caller.
+    Passing use_cache=False always starts a fresh run.
     """
 
+    def run():
+        return _run_story_engine_async(
+            user_input,
+            feedback,
+            max_retries=max_retries,
+            logger=logger,
+            request_id=request_id,
+            candidates=candidates,
+            use_cache=use_cache,
+            usage=usage,
+            mode=mode,
+            deadline=deadline,
+        )
+
+    if not (use_cache and settings.story_coalescing_enabled):
+        return await run()
+
+    story, shared = await story_flights.do(_flight_key(user_input, feedback, mode, candidates, deadline), run)
+    current_span().set_attribute("coalesced", shared)
+    if shared:
+        STORY_REQUESTS_COALESCED.inc()
+        log_event(
+            logger or get_logger(),
+            "story_coalesced",
+            request_id=request_id,
+        )
+    return story
+
+
+async def _run_story_engine_async(
+    user_input,
+    feedback=None,
+    max_retries=3,
+    logger=None,
+    request_id: str | None = None,
+    candidates: int | None = None,
+    use_cache: bool = True,
+    usage: UsageLedger | None = None,
+    mode: str | None = None,
+    deadline: Deadline | None = None,
+) -> str:
+
+    usage = usage if usage is not None else UsageLedger()
+    mode = mode or settings.story_pipeline_mode
     try:
         logger = logger or get_logger()
         request_id = request_id or uuid.uuid4().hex
+        current_span().set_attribute("request_id", request_id)
+        candidates = max(1, min(candidates or settings.speculative_candidates, settings.max_speculative_candidates))
         log_event(
             logger,
             "run_story_engine_start",
             request_id=request_id,
             max_retries=max_retries,
+            candidates=candidates,
+            mode=mode,
         )
-        # Validate User Input
         is_valid, error_message = validate_user_input(user_input)
         if not is_valid:
-            # Log Error
             log_event(
                 logger,
                 "validate_input",
@@ -144,112 +771,729 @@ def run_story_engine(user_input, feedback=None, max_retries=3, logger=None, requ
                 status="fail",
                 error=error_message,
             )
+            _record_validation_failure("input", error_message)
             return error_message
-        
-        # Classify Request
+
         log_event(
             logger,
             "validate_input",
             request_id=request_id,
             status="success",
         )
-        classification = classify_request(user_input, logger=logger, request_id=request_id)
-        
-        story = None
-        judge_result = None
 
-        for attempt in range(max_retries+1):
+        cache_key = story_cache_key(user_input, feedback, mode) if use_cache else None
+        cached_story = _cached_story(cache_key, logger, request_id)
+        if cached_story:
             log_event(
                 logger,
-                "generation_attempt",
+                "run_story_engine_end",
                 request_id=request_id,
-                attempt=attempt + 1,
-                max_attempts=max_retries + 1,
+                status="success",
+                cached=True,
             )
-        
-            # Generate Story
-            story = generate_story(
-                user_input,
-                classification,
-                feedback,
-                logger=logger,
-                request_id=request_id,
-            )
-            
-            if not story:
-                log_event(
-                    logger,
-                    "generate_story",
-                    request_id=request_id,
-                    status="retry",
-                    attempt=attempt + 1,
-                )
-                continue
-       
-           
-            judge_result = judge_story(story, user_input, logger=logger, request_id=request_id)
-            if not judge_result:
-                # Log Error and Continue
+            return cached_story
+
+        classification = await classify_request_async(user_input, logger=logger, request_id=request_id, usage=usage, deadline=deadline)
+        attempts_run = max_retries + 1
+        best_story = None
+
+        for attempt in range(max_retries + 1):
+            with start_span("story.attempt", attempt=attempt + 1, mode=mode):
+                if _token_ceiling_reached(usage, logger, request_id, attempt + 1):
+                    attempts_run = attempt
+                    break
+                if not _attempt_fits_deadline(deadline, mode, attempt + 1):
+                    return _deadline_reached(best_story, logger, request_id, attempt, usage, deadline)
+
                 log_event(
                     logger,
-                    "judge_story",
+                    "generation_attempt",
                     request_id=request_id,
-                    status="retry",
                     attempt=attempt + 1,
+                    max_attempts=max_retries + 1,
+                    candidates=candidates,
+                    mode=mode,
                 )
-                continue
-            
-        
-        
-            is_valid, error_message = validate_final_story(story, judge_result)
-            if is_valid:
+
+                try:
+                    if candidates > 1:
+                        story, judge_result, error_message = await _run_speculative_attempt(
+                            user_input,
+                            classification,
+                            feedback,
+                            candidates,
+                            logger=logger,
+                            request_id=request_id,
+                            attempt=attempt + 1,
+                            usage=usage,
+                            mode=mode,
+                            deadline=deadline,
+                        )
+                    else:
+                        story, judge_result, error_message = await _generate_and_judge_async(
+                            user_input,
+                            classification,
+                            feedback,
+                            logger=logger,
+                            request_id=request_id,
+                            attempt=attempt + 1,
+                            usage=usage,
+                            mode=mode,
+                            deadline=deadline,
+                        )
+                except REQUEST_ENDING_ERRORS:
+                    # With a deadline, the request ends with the best story
+                    # so far rather than with an error.
+                    if deadline is None or not (best_story or deadline.expired):
+                        raise
+                    return _deadline_reached(best_story, logger, request_id, attempt + 1, usage, deadline)
+
+                if story and error_message != "pre_judge_check_failed":
+                    best_story = story
+                if error_message == "judge_skipped":
+                    return _deadline_reached(best_story, logger, request_id, attempt + 1, usage, deadline)
+
+                if not story:
+                    log_event(
+                        logger,
+                        "generate_story",
+                        request_id=request_id,
+                        status="retry",
+                        attempt=attempt + 1,
+                    )
+                    continue
+
+                if not judge_result:
+                    log_event(
+                        logger,
+                        "judge_story",
+                        request_id=request_id,
+                        status="retry",
+                        attempt=attempt + 1,
+                    )
+                    continue
+
+                if not error_message:
+                    log_event(
+                        logger,
+                        "validate_final_story",
+                        request_id=request_id,
+                        status="success",
+                    )
+                    STORY_ATTEMPTS.observe(attempt + 1)
+                    log_event(
+                        logger,
+                        "run_story_engine_end",
+                        request_id=request_id,
+                        status="success",
+                        attempts=attempt + 1,
+                        mode=mode,
+                        usage=usage.summary(),
+                    )
+                    if cache_key:
+                        story_cache.set(cache_key, story)
+                    return story
+
+                feedback = judge_result.get("improvement_feedback", "")
                 log_event(
                     logger,
                     "validate_final_story",
                     request_id=request_id,
-                    status="success",
-                )
-                log_event(
-                    logger,
-                    "run_story_engine_end",
-                    request_id=request_id,
-                    status="success",
+                    status="fail",
+                    error=error_message,
+                    feedback=feedback,
                 )
+                _record_validation_failure("final", error_message)
 
-                return story
-            
-            # Prepare Feedback for Next Generation
+        STORY_ATTEMPTS.observe(attempts_run)
+        log_event(
+            logger,
+            "run_story_engine_end",
+            request_id=request_id,
+            status="fail",
+            attempts=attempts_run,
+            token_ceiling_exceeded=usage.exceeded,
+            usage=usage.summary(),
+        )
+        return FAILURE_MESSAGE
+
+    except Exception as e:
+        current_span().record_error(e)
+        log_event(
+            logger or get_logger(),
+            "run_story_engine_error",
+            request_id=request_id,
+            status="fail",
+            error=str(e),
+            usage=usage.summary(),
+        )
+        return FAILURE_MESSAGE
+
+
+def _run_sync(run):
+    """
+    Runs an engine coroutine to completion for synchronous callers (the CLI
+    and the Streamlit app) on a fresh event loop, with an AsyncOpenAI
+    client of its own for that loop.
+    """
+    async def main():
+        async with scoped_async_client():
+            return await run()
+
+    return asyncio.run(main())
+
+
+@traced("story.engine")
+def run_story_engine(
+    user_input,
+    feedback=None,
+    max_retries=3,
+    logger=None,
+    request_id: str | None = None,
+    candidates: int | None = None,
+    use_cache: bool = True,
+    usage: UsageLedger | None = None,
+    mode: str | None = None,
+    deadline: Deadline | None = None,
+) -> str:
+    """
+    Blocking form of run_story_engine_async, for callers without an event
+    loop. Each call runs on its own loop, so there is no coalescing.
+    """
+    return _run_sync(
+        lambda: _run_story_engine_async(
+            user_input,
+            feedback,
+            max_retries=max_retries,
+            logger=logger,
+            request_id=request_id,
+            candidates=candidates,
+            use_cache=use_cache,
+            usage=usage,
+            mode=mode,
+            deadline=deadline,
+        )
+    )
+
+
+@traced("story.engine")
+async def stream_story_engine(
+    user_input,
+    feedback=None,
+    max_retries=3,
+    logger=None,
+    request_id: str | None = None,
+    use_cache: bool = True,
+    usage: UsageLedger | None = None,
+    deadline: Deadline | None = None,
+):
+    """
+    Streaming variant of run_story_engine.
+
+    Yields (event, data) tuples:
+    - ("token", {"attempt", "text"}) for every storyteller delta
+    - ("restart", {"attempt", "reason"}) when an attempt is discarded and a
+      new one starts; clients should clear the text they have rendered
+    - ("final", {...}) exactly once, with the outcome and request_id
+
+    A cached story is sent as a single token event followed by the final
+    event. The final event carries the request's token usage.
+    """
+
+    usage = usage if usage is not None else UsageLedger()
+    logger = logger or get_logger()
+    request_id = request_id or uuid.uuid4().hex
+    current_span().set_attribute("request_id", request_id)
+    log_event(
+        logger,
+        "run_story_engine_start",
+        request_id=request_id,
+        max_retries=max_retries,
+        stream=True,
+    )
+
+    is_valid, error_message = validate_user_input(user_input)
+    if not is_valid:
+        log_event(
+            logger,
+            "validate_input",
+            request_id=request_id,
+            status="fail",
+            error=error_message,
+        )
+        _record_validation_failure("input", error_message)
+        yield "final", {"status": "error", "error": error_message, "request_id": request_id}
+        return
+
+    log_event(
+        logger,
+        "validate_input",
+        request_id=request_id,
+        status="success",
+    )
+
+    cache_key = story_cache_key(user_input, feedback, PIPELINE_TWO_CALL) if use_cache else None
+    cached_story = _cached_story(cache_key, logger, request_id)
+    if cached_story:
+        log_event(
+            logger,
+            "run_story_engine_end",
+            request_id=request_id,
+            status="success",
+            cached=True,
+            stream=True,
+        )
+        yield "token", {"attempt": 1, "text": cached_story}
+        yield "final", {
+            "status": "success",
+            "request_id": request_id,
+            "attempts": 0,
+            "cached": True,
+            "usage": usage.summary(),
+        }
+        return
+
+    try:
+        classification = await classify_request_async(user_input, logger=logger, request_id=request_id, usage=usage, deadline=deadline)
+    except Exception as e:
+        log_event(
+            logger,
+            "run_story_engine_error",
+            request_id=request_id,
+            status="fail",
+            error=str(e),
+            usage=usage.summary(),
+        )
+        yield "final", {
+            "status": "error",
+            "error": FAILURE_MESSAGE,
+            "request_id": request_id,
+            "usage": usage.summary(),
+        }
+        return
+
+    max_attempts = max_retries + 1
+    attempts_run = max_attempts
+    for attempt in range(1, max_attempts + 1):
+        with start_span("story.attempt", attempt=attempt):
+            if _token_ceiling_reached(usage, logger, request_id, attempt):
+                attempts_run = attempt - 1
+                break
+            if not _attempt_fits_deadline(deadline, PIPELINE_TWO_CALL, attempt):
+                attempts_run = attempt - 1
+                break
 
-            feedback = judge_result.get("improvement_feedback", "")
             log_event(
                 logger,
-                "validate_final_story",
+                "generation_attempt",
                 request_id=request_id,
-                status="fail",
-                error=error_message,
-                feedback=feedback,
+                attempt=attempt,
+                max_attempts=max_attempts,
             )
-        
+
+            parts = []
+            try:
+                async for delta in generate_story_stream(
+                    user_input,
+                    classification,
+                    feedback,
+                    logger=logger,
+                    request_id=request_id,
+                    usage=usage,
+                    deadline=deadline,
+                ):
+                    parts.append(delta)
+                    yield "token", {"attempt": attempt, "text": delta}
+                story = "".join(parts).strip()
+                reason = None if story else "empty_story"
+            except Exception as e:
+                if isinstance(e, REQUEST_ENDING_ERRORS):
+                    attempts_run = attempt
+                    break
+                story = None
+                reason = "generation_failed"
+
+            judge_result = None
+            if story:
+                pre_judge_feedback = _pre_judge_gate(story, logger, request_id, attempt)
+                if pre_judge_feedback:
+                    feedback = pre_judge_feedback
+                    reason = "pre_judge_check_failed"
+                    story = None
+
+            if story and _judge_skipped_for_deadline(deadline, logger, request_id, attempt):
+                # The streamed text already passed the local checks; finish
+                # unjudged rather than run past the deadline. Not cached.
+                _deadline_reached(story, logger, request_id, attempt, usage, deadline)
+                yield "final", {
+                    "status": "success",
+                    "request_id": request_id,
+                    "attempts": attempt,
+                    "verdict": None,
+                    "scores": None,
+                    "judge_skipped": True,
+                    "usage": usage.summary(),
+                }
+                return
+
+            if story:
+                try:
+                    judge_result = await judge_story_async(story, user_input, logger=logger, request_id=request_id, usage=usage, deadline=deadline)
+                except REQUEST_ENDING_ERRORS:
+                    attempts_run = attempt
+                    break
+                if not judge_result:
+                    reason = "judge_failed"
+
+            if judge_result:
+                is_valid, error_message = validate_final_story(story, judge_result)
+                if is_valid:
+                    log_event(
+                        logger,
+                        "validate_final_story",
+                        request_id=request_id,
+                        status="success",
+                    )
+                    STORY_ATTEMPTS.observe(attempt)
+                    log_event(
+                        logger,
+                        "run_story_engine_end",
+                        request_id=request_id,
+                        status="success",
+                        attempts=attempt,
+                        stream=True,
+                        usage=usage.summary(),
+                    )
+                    if cache_key:
+                        story_cache.set(cache_key, story)
+                    yield "final", {
+                        "status": "success",
+                        "request_id": request_id,
+                        "attempts": attempt,
+                        "verdict": judge_result.get("verdict"),
+                        "scores": judge_result.get("scores"),
+                        "usage": usage.summary(),
+                    }
+                    return
+
+                feedback = judge_result.get("improvement_feedback", "")
+                reason = error_message
+                log_event(
+                    logger,
+                    "validate_final_story",
+                    request_id=request_id,
+                    status="fail",
+                    error=error_message,
+                    feedback=feedback,
+                )
+                _record_validation_failure("final", error_message)
+
+            if attempt < max_attempts and not usage.exceeded:
+                yield "restart", {"attempt": attempt + 1, "reason": reason}
+
+    deadline_reached = deadline is not None and not _attempt_fits_deadline(deadline, PIPELINE_TWO_CALL, attempts_run + 1)
+    if deadline_reached:
+        STORY_DEADLINE_OUTCOMES.inc(outcome="exceeded")
+    STORY_ATTEMPTS.observe(attempts_run)
+    log_event(
+        logger,
+        "run_story_engine_end",
+        request_id=request_id,
+        status="fail",
+        attempts=attempts_run,
+        token_ceiling_exceeded=usage.exceeded,
+        deadline_reached=deadline_reached or None,
+        stream=True,
+        usage=usage.summary(),
+    )
+    yield "final", {
+        "status": "error",
+        "error": FAILURE_MESSAGE,
+        "request_id": request_id,
+        "usage": usage.summary(),
+    }
+
+
+# Revision mode. Instead of regenerating from the original request, the
+# previous story and the feedback go to an edit prompt: there is no input
+# re-validation of the original request and no classification call. Revised
+# stories still pass the pre-judge gate, the judge and validate_final_story.
+
+def lookup_classification(user_input) -> dict | None:
+    """
+    Returns the cached classification of a request, if there is one.
+    """
+    cached = classification_cache.get(_classification_cache_key(user_input))
+    return dict(cached) if cached is not None else None
+
+
+@traced("story.revise")
+async def revise_story_async(story, feedback, classification=None, logger=None, request_id: str | None = None, usage: UsageLedger | None = None, deadline: Deadline | None = None) -> str:
+    """
+    Edits an existing story according to the feedback.
+    """
+
+    prompt = build_revision_prompt(story, feedback, classification)
+    logger = logger or get_logger()
+    started_at = time.monotonic()
+
+    try:
+        revised = await call_model_async(
+            user_prompt=prompt,
+            system_prompt=STORYTELLER_SYSTEM_PROMPT,
+            logger=logger,
+            request_id=request_id,
+            stage="revise",
+            usage=usage,
+            deadline=deadline,
+        )
+        cleaned_story = revised.strip()
         log_event(
             logger,
-            "run_story_engine_end",
+            "revise_story",
+            request_id=request_id,
+            status="success",
+            latency_ms=int((time.monotonic() - started_at) * 1000),
+            word_count=len(cleaned_story.split()),
+        )
+        return cleaned_story
+
+    except Exception as e:
+        current_span().record_error(e)
+        log_event(
+            logger,
+            "revise_story",
             request_id=request_id,
             status="fail",
+            error=str(e),
+            latency_ms=int((time.monotonic() - started_at) * 1000),
         )
-        return (
-        "Sorry, I couldn’t create a suitable bedtime story this time. "
-        "Please try rephrasing your request."
+        if isinstance(e, REQUEST_ENDING_ERRORS):
+            raise
+        return None
+
+
+def _validate_revision_request(user_input, feedback, logger, request_id: str | None) -> str | None:
+    """
+    The original request and the feedback both go into the judge and edit
+    prompts, so both get the checks of a new request; the request is
+    checked again because the caller may hand in one that was rejected.
+    Returns the error message when either fails.
+    """
+    is_valid, error_message = validate_user_input(user_input or "")
+    if is_valid:
+        is_valid, error_message = validate_user_input(feedback or "")
+    if is_valid:
+        return None
+    log_event(
+        logger,
+        "validate_input",
+        request_id=request_id,
+        status="fail",
+        error=error_message,
+        revision=True,
     )
-    
+    _record_validation_failure("input", error_message)
+    STORY_REVISIONS.inc(status="invalid_input")
+    return error_message
+
+
+def _finish_revision(story, judge_result, feedback, logger, request_id: str | None, attempt: int, usage: UsageLedger):
+    """
+    Validates a judged revision. Returns (passed, next_feedback).
+    """
+    is_valid, error_message = validate_final_story(story, judge_result)
+    if is_valid:
+        STORY_REVISIONS.inc(status="success")
+        log_event(
+            logger,
+            "run_revision_engine_end",
+            request_id=request_id,
+            status="success",
+            attempts=attempt,
+            usage=usage.summary(),
+        )
+        return True, feedback
+
+    judge_feedback = judge_result.get("improvement_feedback", "")
+    log_event(
+        logger,
+        "validate_final_story",
+        request_id=request_id,
+        status="fail",
+        error=error_message,
+        feedback=judge_feedback,
+        revision=True,
+    )
+    _record_validation_failure("final", error_message)
+    return False, f"{feedback} {judge_feedback}".strip()
+
+
+def _revision_failed(logger, request_id: str | None, attempts: int, usage: UsageLedger) -> str:
+    STORY_REVISIONS.inc(status="fail")
+    log_event(
+        logger,
+        "run_revision_engine_end",
+        request_id=request_id,
+        status="fail",
+        attempts=attempts,
+        token_ceiling_exceeded=usage.exceeded,
+        usage=usage.summary(),
+    )
+    return FAILURE_MESSAGE
+
+
+def _revision_fits_deadline(deadline: Deadline | None, attempt: int) -> bool:
+    """
+    Same rule as _attempt_fits_deadline, for a revise -> judge attempt.
+    """
+    if deadline is None:
+        return True
+    if attempt == 1:
+        return not deadline.expired
+    return deadline.allows("revise", "judge")
+
+
+def _revision_deadline_reached(best_revision: str | None, logger, request_id: str | None, attempts: int, usage: UsageLedger, deadline: Deadline) -> str:
+    """
+    Ends a revision that ran out of time with its latest revision that
+    passed the local checks, or the failure message when there is none.
+    """
+    STORY_DEADLINE_OUTCOMES.inc(outcome="best_effort" if best_revision else "exceeded")
+    STORY_REVISIONS.inc(status="success" if best_revision else "fail")
+    log_event(
+        logger,
+        "run_revision_engine_end",
+        request_id=request_id,
+        status="success" if best_revision else "fail",
+        attempts=attempts,
+        deadline_reached=True,
+        deadline_seconds=deadline.budget_seconds,
+        best_effort=bool(best_revision),
+        usage=usage.summary(),
+    )
+    return best_revision or FAILURE_MESSAGE
+
+
+@traced("story.revision")
+async def run_revision_engine_async(
+    story,
+    feedback,
+    user_input,
+    classification=None,
+    max_retries=1,
+    logger=None,
+    request_id: str | None = None,
+    usage: UsageLedger | None = None,
+    deadline: Deadline | None = None,
+) -> str:
+    """
+    Revises `story` (generated for `user_input`) according to `feedback`.
+
+    A revision that fails the pre-judge gate or the judge is edited again
+    with the extra feedback, up to `max_retries` more times. A `deadline`
+    bounds it like run_story_engine_async: once time runs out, the latest
+    revision that passed the local checks is returned unjudged.
+    """
+
+    usage = usage if usage is not None else UsageLedger()
+    try:
+        logger = logger or get_logger()
+        request_id = request_id or uuid.uuid4().hex
+        current_span().set_attribute("request_id", request_id)
+        log_event(
+            logger,
+            "run_revision_engine_start",
+            request_id=request_id,
+            max_retries=max_retries,
+        )
+        error_message = _validate_revision_request(user_input, feedback, logger, request_id)
+        if error_message:
+            return error_message
+
+        classification = classification or lookup_classification(user_input)
+        attempts_run = max_retries + 1
+        best_revision = None
+
+        for attempt in range(1, max_retries + 2):
+            with start_span("story.attempt", attempt=attempt):
+                if _token_ceiling_reached(usage, logger, request_id, attempt):
+                    attempts_run = attempt - 1
+                    break
+                if not _revision_fits_deadline(deadline, attempt):
+                    return _revision_deadline_reached(best_revision, logger, request_id, attempt - 1, usage, deadline)
+
+                try:
+                    revised = await revise_story_async(
+                        story, feedback, classification, logger=logger, request_id=request_id, usage=usage, deadline=deadline
+                    )
+                    if not revised:
+                        continue
+
+                    # Later attempts edit the rejected revision rather than start over.
+                    story = revised
+                    pre_judge_feedback = _pre_judge_gate(revised, logger, request_id, attempt)
+                    if pre_judge_feedback:
+                        feedback = f"{feedback} {pre_judge_feedback}"
+                        continue
+
+                    best_revision = revised
+                    if _judge_skipped_for_deadline(deadline, logger, request_id, attempt):
+                        return _revision_deadline_reached(best_revision, logger, request_id, attempt, usage, deadline)
+                    judge_result = await judge_story_async(
+                        revised, user_input, logger=logger, request_id=request_id, usage=usage, deadline=deadline
+                    )
+                except REQUEST_ENDING_ERRORS:
+                    if deadline is None or not (best_revision or deadline.expired):
+                        raise
+                    return _revision_deadline_reached(best_revision, logger, request_id, attempt, usage, deadline)
+                if not judge_result:
+                    continue
+
+                passed, feedback = _finish_revision(revised, judge_result, feedback, logger, request_id, attempt, usage)
+                if passed:
+                    return revised
+
+        return _revision_failed(logger, request_id, attempts_run, usage)
+
     except Exception as e:
+        current_span().record_error(e)
+        STORY_REVISIONS.inc(status="error")
         log_event(
             logger or get_logger(),
-            "run_story_engine_error",
+            "run_revision_engine_error",
             request_id=request_id,
             status="fail",
             error=str(e),
+            usage=usage.summary(),
+        )
+        return FAILURE_MESSAGE
+
+
+def run_revision_engine(
+    story,
+    feedback,
+    user_input,
+    classification=None,
+    max_retries=1,
+    logger=None,
+    request_id: str | None = None,
+    usage: UsageLedger | None = None,
+    deadline: Deadline | None = None,
+) -> str:
+    """
+    Blocking form of run_revision_engine_async.
+    """
+    return _run_sync(
+        lambda: run_revision_engine_async(
+            story,
+            feedback,
+            user_input,
+            classification=classification,
+            max_retries=max_retries,
+            logger=logger,
+            request_id=request_id,
+            usage=usage,
+            deadline=deadline,
         )
-        return (
-        "Sorry, I couldn’t create a suitable bedtime story this time. "
-        "Please try rephrasing your request."
-    )
\ No newline at end of file
+    )
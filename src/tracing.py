@@ -0,0 +1,448 @@
+"""
+Lightweight request tracing.
+
+Spans form a tree per request through a context variable, so they follow
+the request across awaits, asyncio tasks and FastAPI's threadpool. Finished
+spans are exported in the OTLP/JSON trace format, either appended to a
+JSONL file (one ExportTraceServiceRequest per line, the same layout as the
+OpenTelemetry Collector file exporter) or posted to a collector's
+/v1/traces endpoint.
+
+Tracing is off unless TRACE_EXPORT_PATH or TRACE_OTLP_ENDPOINT is set; when
+off, or when a trace is not sampled, spans are no-ops.
+"""
+
+import asyncio
+import atexit
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import re
+import secrets
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import aclosing, contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Iterator, Protocol
+
+from src.config import settings
+
+_TRACEPARENT_RE = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_span_id",
+        "start_time_ns",
+        "end_time_ns",
+        "attributes",
+        "status_code",
+        "status_message",
+    )
+
+    sampled = True
+
+    def __init__(self, name: str, trace_id: str, parent_span_id: str | None, attributes: dict[str, Any]) -> None:
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: int | None = None
+        self.attributes = {key: value for key, value in attributes.items() if value is not None}
+        self.status_code = STATUS_UNSET
+        self.status_message: str | None = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        for key, value in attributes.items():
+            self.set_attribute(key, value)
+
+    def record_error(self, error: BaseException | str) -> None:
+        self.status_code = STATUS_ERROR
+        self.status_message = str(error) or type(error).__name__
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_time_ns or time.time_ns()
+        return (end - self.start_time_ns) / 1e6
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_time_ns),
+            "endTimeUnixNano": str(self.end_time_ns or self.start_time_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+            "status": {"code": self.status_code},
+        }
+        if self.parent_span_id:
+            span["parentSpanId"] = self.parent_span_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        return span
+
+
+class _NoopSpan:
+    """
+    Stands in for a span when tracing is off or the trace is not sampled.
+    """
+
+    sampled = False
+    trace_id = None
+    span_id = None
+    traceparent = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes: Any) -> None:
+        pass
+
+    def record_error(self, error: BaseException | str) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _otlp_attribute(key: str, value: Any) -> dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+def export_request(spans: list[Span], service_name: str) -> dict[str, Any]:
+    """
+    Wraps spans in an OTLP ExportTraceServiceRequest.
+    """
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [_otlp_attribute("service.name", service_name)]},
+                "scopeSpans": [
+                    {
+                        "scope": {"name": "story_pipeline"},
+                        "spans": [span.to_otlp() for span in spans],
+                    }
+                ],
+            }
+        ]
+    }
+
+
+class SpanExporter(Protocol):
+    def export(self, spans: list[Span]) -> None:
+        ...
+
+
+class JsonlSpanExporter:
+    def __init__(self, path: str, service_name: str) -> None:
+        self.path = path
+        self.service_name = service_name
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[Span]) -> None:
+        line = json.dumps(export_request(spans, self.service_name), separators=(",", ":"))
+        with self._lock, open(self.path, "a", encoding="utf-8") as trace_file:
+            trace_file.write(line + "\n")
+
+
+class OtlpHttpSpanExporter:
+    """
+    Posts OTLP/JSON to a collector, e.g. http://otel-collector:4318.
+    """
+
+    def __init__(self, endpoint: str, service_name: str, timeout_seconds: float = 5) -> None:
+        endpoint = endpoint.rstrip("/")
+        self.url = endpoint if endpoint.endswith("/v1/traces") else f"{endpoint}/v1/traces"
+        self.service_name = service_name
+        self.timeout_seconds = timeout_seconds
+        self.failures = 0
+
+    def export(self, spans: list[Span]) -> None:
+        body = json.dumps(export_request(spans, self.service_name)).encode("utf-8")
+        request = urllib.request.Request(
+            self.url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout_seconds):
+                pass
+        except (urllib.error.URLError, TimeoutError, OSError):
+            self.failures += 1
+
+
+class InMemorySpanExporter:
+    def __init__(self) -> None:
+        self.spans: list[Span] = []
+
+    def export(self, spans: list[Span]) -> None:
+        self.spans.extend(spans)
+
+    def by_name(self, name: str) -> list[Span]:
+        return [span for span in self.spans if span.name == name]
+
+
+class SimpleSpanProcessor:
+    """
+    Exports each span as it ends, on the caller's thread.
+    """
+
+    def __init__(self, exporter: SpanExporter) -> None:
+        self.exporter = exporter
+
+    def on_end(self, span: Span) -> None:
+        self.exporter.export([span])
+
+    def shutdown(self) -> None:
+        pass
+
+
+_STOP = object()
+
+
+class BatchSpanProcessor:
+    """
+    Queues finished spans and exports them in batches from a background
+    thread, so requests never wait on file or network I/O. Spans beyond
+    `max_queue_size` are dropped and counted.
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        max_queue_size: int = 10000,
+        batch_size: int = 512,
+        flush_interval_seconds: float = 1.0,
+    ) -> None:
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval_seconds = flush_interval_seconds
+        self.queue: "queue.Queue[Any]" = queue.Queue(maxsize=max_queue_size)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._drain, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def on_end(self, span: Span) -> None:
+        try:
+            self.queue.put_nowait(span)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval_seconds)
+            except queue.Empty:
+                continue
+            if item is _STOP:
+                return
+
+            batch = [item]
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            try:
+                self.exporter.export(batch)
+            except Exception:
+                self.dropped += len(batch)
+            if stop:
+                return
+
+    def shutdown(self) -> None:
+        try:
+            self.queue.put(_STOP, timeout=1)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=5)
+
+
+_current_span: ContextVar[Span | None] = ContextVar("current_span", default=None)
+
+
+def parse_traceparent(header: str | None) -> tuple[str, str, bool] | None:
+    """
+    Parses a W3C traceparent header into (trace_id, parent_span_id, sampled).
+    """
+    match = _TRACEPARENT_RE.match((header or "").strip().lower())
+    if not match or match.group(1) == "0" * 32 or match.group(2) == "0" * 16:
+        return None
+    return match.group(1), match.group(2), bool(int(match.group(3), 16) & 1)
+
+
+class Tracer:
+    def __init__(
+        self,
+        processor: SimpleSpanProcessor | BatchSpanProcessor | None,
+        sample_rate: float = 1.0,
+        rng: Callable[[], float] = random.random,
+    ) -> None:
+        self.processor = processor
+        self.sample_rate = sample_rate
+        self._rng = rng
+        # Set while inside a trace that was sampled out, so its children
+        # are skipped too instead of starting new root traces.
+        self._unsampled: ContextVar[bool] = ContextVar("trace_unsampled", default=False)
+
+    @contextmanager
+    def span(self, name: str, traceparent: str | None = None, **attributes: Any) -> Iterator[Span | _NoopSpan]:
+        """
+        Starts a child of the current span, or a new trace (joining the
+        remote parent in `traceparent` if given) when there is none.
+        """
+        if self.processor is None or self._unsampled.get():
+            yield NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        if parent is not None:
+            span = Span(name, parent.trace_id, parent.span_id, attributes)
+        else:
+            remote = parse_traceparent(traceparent)
+            sampled = remote[2] if remote else self._rng() < self.sample_rate
+            if not sampled:
+                unsampled_token = self._unsampled.set(True)
+                try:
+                    yield NOOP_SPAN
+                finally:
+                    _reset(self._unsampled, unsampled_token)
+                return
+            if remote:
+                span = Span(name, remote[0], remote[1], attributes)
+            else:
+                span = Span(name, secrets.token_hex(16), None, attributes)
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            if not isinstance(e, (GeneratorExit, asyncio.CancelledError)):
+                span.record_error(e)
+            else:
+                span.set_attribute("cancelled", True)
+            raise
+        finally:
+            _reset(_current_span, token)
+            span.end_time_ns = time.time_ns()
+            if span.status_code == STATUS_UNSET:
+                span.status_code = STATUS_OK
+            self.processor.on_end(span)
+
+    def shutdown(self) -> None:
+        if self.processor is not None:
+            self.processor.shutdown()
+
+
+def _reset(var: ContextVar, token) -> None:
+    # An async generator closed from another task (e.g. on client
+    # disconnect) runs its cleanup in a different context.
+    try:
+        var.reset(token)
+    except ValueError:
+        pass
+
+
+def _build_tracer() -> Tracer:
+    exporter: SpanExporter | None = None
+    if settings.trace_otlp_endpoint:
+        exporter = OtlpHttpSpanExporter(settings.trace_otlp_endpoint, settings.trace_service_name)
+    elif settings.trace_export_path:
+        exporter = JsonlSpanExporter(settings.trace_export_path, settings.trace_service_name)
+    if exporter is None:
+        return Tracer(None)
+
+    processor = BatchSpanProcessor(exporter, max_queue_size=settings.trace_queue_max_size)
+    atexit.register(processor.shutdown)
+    return Tracer(processor, sample_rate=settings.trace_sample_rate)
+
+
+_tracer = _build_tracer()
+
+
+def start_span(name: str, traceparent: str | None = None, **attributes: Any):
+    """
+    Context manager for a span named `name`, e.g.
+
+        with start_span("story.judge", attempt=2) as span:
+            span.set_attribute("verdict", "PASS")
+    """
+    return _tracer.span(name, traceparent=traceparent, **attributes)
+
+
+def current_span() -> Span | _NoopSpan:
+    return _current_span.get() or NOOP_SPAN
+
+
+def traced(name: str, **attributes: Any):
+    """
+    Decorator that runs a function, coroutine function or async generator
+    inside a span. For async generators the span covers the whole iteration.
+    """
+
+    def decorator(fn):
+        if inspect.isasyncgenfunction(fn):
+
+            @functools.wraps(fn)
+            async def async_gen_wrapper(*args, **kwargs):
+                with start_span(name, **attributes):
+                    async with aclosing(fn(*args, **kwargs)) as items:
+                        async for item in items:
+                            yield item
+
+            return async_gen_wrapper
+
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                with start_span(name, **attributes):
+                    return await fn(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with start_span(name, **attributes):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
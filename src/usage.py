@@ -0,0 +1,150 @@
+"""
+Token usage and cost accounting for LLM calls.
+
+call_model_async records the `usage` block of every response into the
+request's UsageLedger, which rolls it up by pipeline stage and model.
+UserUsageTotals keeps running totals per authenticated user.
+"""
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any
+
+from src.config import settings
+
+
+@dataclass
+class TokenCounts:
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    calls: int = 0
+    cost_usd: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, other: "TokenCounts") -> None:
+        self.prompt_tokens += other.prompt_tokens
+        self.completion_tokens += other.completion_tokens
+        self.calls += other.calls
+        self.cost_usd += other.cost_usd
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "calls": self.calls,
+            "cost_usd": round(self.cost_usd, 6),
+        }
+
+
+def parse_token_prices(raw: str) -> dict[str, tuple[float, float]]:
+    """
+    Parses "MODEL=PROMPT/COMPLETION" pairs separated by commas, with prices
+    in USD per million tokens, e.g. "gpt-4o-mini=0.15/0.6".
+    """
+    prices = {}
+    for item in raw.split(","):
+        if not item.strip():
+            continue
+        model, _, price = item.partition("=")
+        prompt_price, _, completion_price = price.partition("/")
+        prices[model.strip()] = (float(prompt_price), float(completion_price or prompt_price))
+    return prices
+
+
+_token_prices = parse_token_prices(settings.token_prices_raw)
+
+
+def _usage_counts(model: str, usage: Any, prices: dict[str, tuple[float, float]]) -> TokenCounts:
+    prompt_tokens = int(getattr(usage, "prompt_tokens", 0) or 0)
+    completion_tokens = int(getattr(usage, "completion_tokens", 0) or 0)
+    prompt_price, completion_price = prices.get(model, (0.0, 0.0))
+    return TokenCounts(
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        calls=1,
+        cost_usd=(prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000,
+    )
+
+
+@dataclass
+class UsageLedger:
+    """
+    Token usage of one story request. `max_total_tokens` of 0 means no
+    ceiling; otherwise `exceeded` turns true once the request has used more
+    than that many tokens, and the engine stops retrying.
+    """
+
+    max_total_tokens: int = field(default_factory=lambda: settings.max_tokens_per_request)
+    prices: dict[str, tuple[float, float]] = field(default_factory=lambda: _token_prices)
+    total: TokenCounts = field(default_factory=TokenCounts)
+    by_stage: dict[str, TokenCounts] = field(default_factory=dict)
+    by_model: dict[str, TokenCounts] = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, model: str, usage: Any) -> TokenCounts:
+        """
+        Adds one response's usage (an OpenAI `CompletionUsage` or anything
+        with prompt_tokens/completion_tokens) and returns its counts.
+        """
+        counts = _usage_counts(model, usage, self.prices)
+        with self._lock:
+            self.total.add(counts)
+            self.by_stage.setdefault(stage, TokenCounts()).add(counts)
+            self.by_model.setdefault(model, TokenCounts()).add(counts)
+        return counts
+
+    @property
+    def exceeded(self) -> bool:
+        return self.max_total_tokens > 0 and self.total.total_tokens > self.max_total_tokens
+
+    def summary(self) -> dict[str, Any]:
+        with self._lock:
+            summary = self.total.as_dict()
+            summary["by_stage"] = {stage: counts.as_dict() for stage, counts in self.by_stage.items()}
+            summary["by_model"] = {model: counts.as_dict() for model, counts in self.by_model.items()}
+        return summary
+
+
+class UserUsageTotals:
+    """
+    Running usage per user id, in an LRU-ordered dict capped at `max_users`.
+    """
+
+    def __init__(self, max_users: int = 10000) -> None:
+        self.max_users = max_users
+        self._totals: "OrderedDict[str, TokenCounts]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, user_id: str, ledger: UsageLedger) -> TokenCounts:
+        """
+        Adds a finished request's usage and returns the user's new totals.
+        """
+        with self._lock:
+            totals = self._totals.setdefault(user_id, TokenCounts())
+            totals.add(ledger.total)
+            self._totals.move_to_end(user_id)
+            while len(self._totals) > self.max_users:
+                self._totals.popitem(last=False)
+            return TokenCounts(**vars(totals))
+
+    def get(self, user_id: str) -> TokenCounts:
+        with self._lock:
+            totals = self._totals.get(user_id)
+            return TokenCounts(**vars(totals)) if totals else TokenCounts()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._totals.clear()
+
+    def __len__(self) -> int:
+        return len(self._totals)
+
+
+user_usage = UserUsageTotals(max_users=settings.usage_max_tracked_users)
@@ -1,58 +1,535 @@
+import asyncio
 import time
-from typing import Optional
+from contextlib import aclosing, asynccontextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Awaitable, Callable, Optional
 
-from openai import OpenAI
+import httpx
+from openai import AsyncOpenAI
 
 from src.config import settings
+from src.deadlines import Deadline
+from src.hedging import hedge_policy
 from src.logging_utils import get_logger, log_event
+from src.metrics import (
+    LLM_CALL_ERRORS,
+    LLM_CALL_LATENCY,
+    LLM_CIRCUIT_REJECTIONS,
+    LLM_FALLBACKS,
+    LLM_HEDGES,
+    LLM_TOKENS,
+    LLM_TRUNCATIONS,
+)
+from src.profiles import get_stage_profile, output_token_tuner, resolve_max_tokens
+from src.resilience import (
+    CircuitBreaker,
+    CircuitOpenError,
+    call_with_retries_async,
+    circuit_breakers,
+    record_retry,
+    retry_policy,
+)
+from src.tracing import current_span, start_span
+from src.usage import UsageLedger
 
-DEFAULT_MODEL = settings.openai_model
-DEFAULT_TIMEOUT_SECONDS = settings.openai_timeout_seconds
+_async_client: AsyncOpenAI | None = None
+# Set by scoped_async_client(); holds the scope's client once it is created.
+_scoped_async_client: ContextVar[dict | None] = ContextVar("scoped_async_client", default=None)
 
-def call_model(
+
+def _http_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=settings.openai_max_connections,
+        max_keepalive_connections=settings.openai_max_keepalive_connections,
+    )
+
+
+def _new_async_client() -> AsyncOpenAI:
+    return AsyncOpenAI(
+        api_key=settings.openai_api_key,
+        base_url=settings.openai_base_url,
+        http_client=httpx.AsyncClient(limits=_http_limits()),
+        max_retries=0,
+    )
+
+
+def get_async_client() -> AsyncOpenAI:
+    """
+    Returns the process-wide AsyncOpenAI client, creating it on first use.
+    All coroutines share its connection pool. Inside scoped_async_client()
+    the scope's own client is returned instead.
+    """
+    global _async_client
+    scope = _scoped_async_client.get()
+    if scope is not None:
+        if "client" not in scope:
+            scope["client"] = _new_async_client()
+        return scope["client"]
+    if _async_client is None:
+        _async_client = _new_async_client()
+    return _async_client
+
+
+@asynccontextmanager
+async def scoped_async_client():
+    """
+    Gives the calls made in this context (and the tasks it starts) their own
+    AsyncOpenAI client, closed on exit. For code that runs its own event
+    loop with asyncio.run: the pooled connections of a client belong to the
+    loop that opened them, so the process-wide client cannot follow.
+    """
+    scope = {}
+    token = _scoped_async_client.set(scope)
+    try:
+        yield
+    finally:
+        _scoped_async_client.reset(token)
+        if "client" in scope:
+            await scope["client"].close()
+
+
+async def close_clients() -> None:
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+
+def _build_messages(user_prompt: str, system_prompt: str | None) -> list[dict[str, str]]:
+    messages = []
+    if system_prompt:
+        messages.append({"role": "system", "content": system_prompt})
+    messages.append({"role": "user", "content": user_prompt})
+    return messages
+
+
+def _record_usage(usage: UsageLedger | None, model: str, stage: str, resp_usage) -> dict[str, int]:
+    """
+    Counts a response's token usage in the metrics and the request's ledger.
+    Returns the fields to add to the llm_call_end event.
+    """
+    if resp_usage is None:
+        return {}
+    prompt_tokens = getattr(resp_usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(resp_usage, "completion_tokens", 0) or 0
+    LLM_TOKENS.inc(prompt_tokens, model=model, stage=stage, kind="prompt")
+    LLM_TOKENS.inc(completion_tokens, model=model, stage=stage, kind="completion")
+    # Prompt tokens the provider served from its prefix cache.
+    cached_tokens = getattr(getattr(resp_usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+    if cached_tokens:
+        LLM_TOKENS.inc(cached_tokens, model=model, stage=stage, kind="cached_prompt")
+    if usage is not None:
+        usage.record(stage, model, resp_usage)
+    current_span().set_attributes(**{
+        "llm.prompt_tokens": prompt_tokens,
+        "llm.completion_tokens": completion_tokens,
+        "llm.cached_prompt_tokens": cached_tokens,
+    })
+    fields = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+    if cached_tokens:
+        fields["cached_prompt_tokens"] = cached_tokens
+    return fields
+
+
+def _resolve_call_options(
+    stage: str,
+    model: str | None,
+    max_tokens: int | None,
+    temperature: float | None,
+    timeout_seconds: float | None,
+    stop: list[str] | None,
+) -> tuple[str, int, float, float, list[str] | None]:
+    """
+    Fills in whatever the caller did not pass from the stage's profile.
+    """
+    profile = get_stage_profile(stage)
+    return (
+        model or profile.model,
+        max_tokens if max_tokens is not None else resolve_max_tokens(stage, profile),
+        temperature if temperature is not None else profile.temperature,
+        timeout_seconds if timeout_seconds is not None else profile.timeout_seconds,
+        stop if stop is not None else (list(profile.stop) or None),
+    )
+
+
+def _record_finish(model: str, stage: str, finish_reason: str | None, token_fields: dict[str, int]) -> None:
+    """
+    Feeds the output size to the max_tokens tuner and counts truncations.
+    """
+    truncated = finish_reason == "length"
+    if truncated:
+        LLM_TRUNCATIONS.inc(model=model, stage=stage)
+        current_span().set_attribute("llm.truncated", True)
+    output_token_tuner.observe(stage, token_fields.get("completion_tokens", 0), truncated=truncated)
+
+
+def _candidate_models(stage: str, model: str) -> list[str]:
+    """
+    The model to call first followed by the stage's fallback models.
+    """
+    return [model] + [fallback for fallback in get_stage_profile(stage).fallback_models if fallback != model]
+
+
+def _record_fallback(logger, request_id: str | None, stage: str, failed_model: str, next_model: str, error: Exception) -> None:
+    LLM_FALLBACKS.inc(stage=stage, model=next_model)
+    log_event(
+        logger,
+        "llm_fallback",
+        request_id=request_id,
+        stage=stage,
+        model=failed_model,
+        fallback_model=next_model,
+        error=str(error),
+    )
+
+
+def _check_circuit(model: str, stage: str) -> tuple[CircuitBreaker, object | None]:
+    """
+    Returns the model's circuit breaker and the call's trial token (see
+    CircuitBreaker), or raises CircuitOpenError without calling the
+    upstream when the circuit is open.
+    """
+    breaker = circuit_breakers.get(model)
+    try:
+        trial = breaker.before_call()
+    except CircuitOpenError:
+        LLM_CIRCUIT_REJECTIONS.inc(stage=stage, model=model)
+        raise
+    return breaker, trial
+
+
+def _log_retry(logger, request_id: str | None, stage: str, model: str):
+    def on_retry(retry: int, delay: float, error: Exception) -> None:
+        log_event(
+            logger,
+            "llm_retry",
+            request_id=request_id,
+            stage=stage,
+            model=model,
+            retry=retry,
+            delay_ms=int(delay * 1000),
+            error=str(error),
+        )
+
+    return on_retry
+
+
+async def _call_model_once_async(
+    model: str,
     user_prompt: str,
-    system_prompt: str | None = None,
-    max_tokens: int = 3000,
-    temperature: float = 0.1,
-    logger=None,
-    request_id: Optional[str] = None,
-    model: str = DEFAULT_MODEL,
-    timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+    system_prompt: str | None,
+    max_tokens: int,
+    temperature: float,
+    timeout_seconds: float,
+    stop: list[str] | None,
+    logger,
+    request_id: str | None,
+    stage: str,
+    usage: UsageLedger | None,
+    deadline: Deadline | None = None,
+    hedge: bool = False,
 ) -> str:
-    client = OpenAI(api_key=settings.openai_api_key)
-
-    logger = logger or get_logger()
+    if deadline is not None:
+        timeout_seconds = deadline.timeout_for(stage, timeout_seconds)
+    breaker, trial = _check_circuit(model, stage)
+    client = get_async_client()
     started_at = time.monotonic()
+    token_fields = {}
     log_event(
         logger,
         "llm_call_start",
         request_id=request_id,
         model=model,
+        stage=stage,
         max_tokens=max_tokens,
         temperature=temperature,
         timeout_seconds=timeout_seconds,
+        hedge=hedge or None,
     )
 
-    messages = []
-    if system_prompt:
-        messages.append({"role": "system", "content": system_prompt})
-    messages.append({"role": "user", "content": user_prompt})
+    with start_span(
+        "llm.call", **{"llm.model": model, "llm.stage": stage, "llm.max_tokens": max_tokens, "llm.hedge": hedge or None}
+    ):
+        try:
+            resp = await client.chat.completions.create(
+                model=model,
+                messages=_build_messages(user_prompt, system_prompt),
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout_seconds,
+                **({"stop": stop} if stop else {}),
+            )
+            token_fields = _record_usage(usage, model, stage, getattr(resp, "usage", None))
+            _record_finish(model, stage, getattr(resp.choices[0], "finish_reason", None), token_fields)
+            hedge_policy.tracker.observe(stage, time.monotonic() - started_at)
+            breaker.record_success()
+            return resp.choices[0].message.content
+        except Exception as e:
+            LLM_CALL_ERRORS.inc(model=model, stage=stage)
+            breaker.record_failure(e, trial)
+            raise
+        except asyncio.CancelledError as e:
+            # A cancelled hedge must not leave a half-open trial pending.
+            breaker.record_failure(e, trial)
+            raise
+        finally:
+            duration_seconds = time.monotonic() - started_at
+            LLM_CALL_LATENCY.observe(duration_seconds, model=model, stage=stage)
+            log_event(
+                logger,
+                "llm_call_end",
+                request_id=request_id,
+                model=model,
+                stage=stage,
+                latency_ms=int(duration_seconds * 1000),
+                hedge=hedge or None,
+                **token_fields,
+            )
+
 
+async def _call_hedged_async(
+    attempt: Callable[[str, bool], Awaitable[str]],
+    model: str,
+    stage: str,
+    timeout_seconds: float,
+    logger,
+    request_id: str | None,
+) -> str:
+    """
+    Runs `attempt(model, hedge=False)`; if it is still running after the
+    hedge delay and the hedge budget allows, starts `attempt(hedge_model,
+    hedge=True)` as well and returns whichever succeeds first, cancelling
+    the other.
+    """
+    hedge_policy.budget.record_call()
+    delay = hedge_policy.delay(stage, timeout_seconds)
+    primary = asyncio.ensure_future(attempt(model, False))
+    tasks = [primary]
     try:
-        resp = client.chat.completions.create(
-            model=model,
-            messages=messages,
-            max_tokens=max_tokens,
-            temperature=temperature,
-            timeout=timeout_seconds,
-        )
-        return resp.choices[0].message.content
-    finally:
-        duration_ms = int((time.monotonic() - started_at) * 1000)
+        if delay is None:
+            return await primary
+
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            return primary.result()
+        if not hedge_policy.budget.try_acquire():
+            LLM_HEDGES.inc(stage=stage, outcome="budget_exhausted")
+            return await primary
+
+        hedge_model = settings.llm_hedge_model or model
         log_event(
             logger,
-            "llm_call_end",
+            "llm_hedge",
             request_id=request_id,
+            stage=stage,
             model=model,
-            latency_ms=duration_ms,
+            hedge_model=hedge_model,
+            delay_ms=int(delay * 1000),
         )
+        hedge = asyncio.ensure_future(attempt(hedge_model, True))
+        tasks.append(hedge)
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    LLM_HEDGES.inc(stage=stage, outcome="hedge_won" if task is hedge else "primary_won")
+                    return task.result()
+
+        LLM_HEDGES.inc(stage=stage, outcome="both_failed")
+        return primary.result()
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+async def call_model_async(
+    user_prompt: str,
+    system_prompt: str | None = None,
+    max_tokens: int | None = None,
+    temperature: float | None = None,
+    logger=None,
+    request_id: Optional[str] = None,
+    model: str | None = None,
+    timeout_seconds: float | None = None,
+    stage: str = "unknown",
+    usage: UsageLedger | None = None,
+    stop: list[str] | None = None,
+    deadline: Deadline | None = None,
+) -> str:
+    """
+    Calls the stage's model, retrying transient errors with backoff (see
+    src/resilience.py) and moving on to its fallback models in order when a
+    model still fails or its circuit is open. The error of the last model
+    is raised. With a `deadline`, each call's timeout shrinks to the time
+    left and DeadlineExceeded is raised once none is. Each model in the
+    fallback chain is called through the hedging layer (see src/hedging.py).
+    """
+    model, max_tokens, temperature, timeout_seconds, stop = _resolve_call_options(
+        stage, model, max_tokens, temperature, timeout_seconds, stop
+    )
+    logger = logger or get_logger()
+
+    def attempt(candidate: str, hedge: bool) -> Awaitable[str]:
+        return _call_model_once_async(
+            candidate, user_prompt, system_prompt, max_tokens, temperature, timeout_seconds, stop,
+            logger, request_id, stage, usage, deadline, hedge=hedge,
+        )
+
+    models = _candidate_models(stage, model)
+    for index, candidate in enumerate(models):
+        try:
+            return await call_with_retries_async(
+                lambda: _call_hedged_async(attempt, candidate, stage, timeout_seconds, logger, request_id),
+                retry_policy,
+                stage,
+                candidate,
+                on_retry=_log_retry(logger, request_id, stage, candidate),
+                deadline=deadline,
+            )
+        except Exception as e:
+            if index == len(models) - 1 or (deadline is not None and deadline.expired):
+                raise
+            _record_fallback(logger, request_id, stage, candidate, models[index + 1], e)
+
+
+async def _stream_model_once_async(
+    model: str,
+    user_prompt: str,
+    system_prompt: str | None,
+    max_tokens: int,
+    temperature: float,
+    timeout_seconds: float,
+    stop: list[str] | None,
+    logger,
+    request_id: str | None,
+    stage: str,
+    usage: UsageLedger | None,
+    deadline: Deadline | None = None,
+) -> AsyncIterator[str]:
+    if deadline is not None:
+        timeout_seconds = deadline.timeout_for(stage, timeout_seconds)
+    breaker, trial = _check_circuit(model, stage)
+    client = get_async_client()
+    started_at = time.monotonic()
+    first_token_ms = None
+    finish_reason = None
+    token_fields = {}
+    log_event(
+        logger,
+        "llm_call_start",
+        request_id=request_id,
+        model=model,
+        stage=stage,
+        max_tokens=max_tokens,
+        temperature=temperature,
+        timeout_seconds=timeout_seconds,
+        stream=True,
+    )
+
+    with start_span(
+        "llm.call", **{"llm.model": model, "llm.stage": stage, "llm.max_tokens": max_tokens, "llm.stream": True}
+    ):
+        try:
+            stream = await client.chat.completions.create(
+                model=model,
+                messages=_build_messages(user_prompt, system_prompt),
+                max_tokens=max_tokens,
+                temperature=temperature,
+                timeout=timeout_seconds,
+                stream=True,
+                stream_options={"include_usage": True},
+                **({"stop": stop} if stop else {}),
+            )
+            async with stream:
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None) is not None:
+                        token_fields = _record_usage(usage, model, stage, chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    finish_reason = chunk.choices[0].finish_reason or finish_reason
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if first_token_ms is None:
+                        first_token_ms = int((time.monotonic() - started_at) * 1000)
+                    yield delta
+            _record_finish(model, stage, finish_reason, token_fields)
+            breaker.record_success()
+        except Exception as e:
+            LLM_CALL_ERRORS.inc(model=model, stage=stage)
+            breaker.record_failure(e, trial)
+            raise
+        except (asyncio.CancelledError, GeneratorExit) as e:
+            breaker.record_failure(e, trial)
+            raise
+        finally:
+            duration_seconds = time.monotonic() - started_at
+            LLM_CALL_LATENCY.observe(duration_seconds, model=model, stage=stage)
+            log_event(
+                logger,
+                "llm_call_end",
+                request_id=request_id,
+                model=model,
+                stage=stage,
+                latency_ms=int(duration_seconds * 1000),
+                first_token_ms=first_token_ms,
+                stream=True,
+                **token_fields,
+            )
+
+
+async def stream_model_async(
+    user_prompt: str,
+    system_prompt: str | None = None,
+    max_tokens: int | None = None,
+    temperature: float | None = None,
+    logger=None,
+    request_id: Optional[str] = None,
+    model: str | None = None,
+    timeout_seconds: float | None = None,
+    stage: str = "unknown",
+    usage: UsageLedger | None = None,
+    stop: list[str] | None = None,
+    deadline: Deadline | None = None,
+) -> AsyncIterator[str]:
+    """
+    Streams a chat completion, yielding content deltas as they arrive. Usage
+    is requested with the stream and arrives on the final chunk. A model
+    that fails before its first delta is replaced by the next fallback
+    model; once text has been yielded, errors are raised to the caller.
+    Streams are not hedged.
+    """
+    model, max_tokens, temperature, timeout_seconds, stop = _resolve_call_options(
+        stage, model, max_tokens, temperature, timeout_seconds, stop
+    )
+    logger = logger or get_logger()
+    models = _candidate_models(stage, model)
+    for index, candidate in enumerate(models):
+        on_retry = _log_retry(logger, request_id, stage, candidate)
+        retry = 0
+        while True:
+            yielded = False
+            try:
+                async with aclosing(_stream_model_once_async(
+                    candidate, user_prompt, system_prompt, max_tokens, temperature, timeout_seconds, stop,
+                    logger, request_id, stage, usage, deadline,
+                )) as deltas:
+                    async for delta in deltas:
+                        yielded = True
+                        yield delta
+                return
+            except Exception as e:
+                if yielded:
+                    raise
+                delay = retry_policy.delay(retry, e)
+                if delay is None or (deadline is not None and delay >= deadline.remaining()):
+                    if index == len(models) - 1 or (deadline is not None and deadline.expired):
+                        raise
+                    _record_fallback(logger, request_id, stage, candidate, models[index + 1], e)
+                    break
+                record_retry(stage, candidate, e)
+                retry += 1
+                on_retry(retry, delay, e)
+                await asyncio.sleep(delay)
@@ -2,10 +2,16 @@
 VALIDATORS FOR THE AI AGENT DEPLOYMENT ENGINEER TAKEHOME
 """
 
-from typing import Tuple
+import re
+from typing import Callable, Iterable, List, Optional, Tuple
+
+from src.config import settings
+from src.tracing import traced
 
 # Pre-Generation Validators
-# This can be set in a config but simplifying for now
+# Default blocklist; BANNED_WORDS_PATH replaces it with a file of terms.
+# Entries are stems that match any word starting with them ("suicid" covers
+# "suicide" and "suicidal").
 BANNED_WORDS = {
     "kill",
     "murder",
@@ -13,10 +19,112 @@ BANNED_WORDS = {
     "gun",
     "weapon",
     "sex",
-    "drugs",
-    "suicide"
+    "drug",
+    "suicid"
+}
+
+EMPTY_INPUT_ERROR = "Story request cannot be empty."
+INAPPROPRIATE_INPUT_ERROR = (
+    "This story request includes themes that are not appropriate "
+    "for a children's bedtime story. Please rephrase."
+)
+STORY_LENGTH_ERROR = "Story length is outside the acceptable range."
+JUDGE_VERDICT_ERROR = "Story did not meet quality requirements."
+POSITIVE_ENDING_ERROR = "Story does not appear to have a clear, positive ending."
+
+# Short, stable reason codes for metrics.
+VALIDATION_FAILURE_REASONS = {
+    EMPTY_INPUT_ERROR: "empty_input",
+    INAPPROPRIATE_INPUT_ERROR: "banned_terms",
+    STORY_LENGTH_ERROR: "story_length",
+    JUDGE_VERDICT_ERROR: "judge_verdict",
+    POSITIVE_ENDING_ERROR: "positive_ending",
 }
 
+
+class BannedTermMatcher:
+    """
+    Matches a blocklist of words and phrases in a single pass over the text.
+
+    The terms are merged into a character trie and compiled once into one
+    word-boundary regex, so shared prefixes are only tried once and the cost
+    of a scan barely grows with the size of the blocklist. Multi-word phrases
+    match across any run of whitespace.
+
+    Terms are stems: they must start a word but may be followed by any
+    letters, so derived and compound forms ("sexual", "murderous", "gunfire",
+    "bloodthirsty") are caught while words that merely contain a term
+    ("skill", "begun") are not.
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms = sorted({" ".join(term.lower().split()) for term in terms if term.strip()})
+        self._pattern = None
+        if self.terms:
+            self._pattern = re.compile(
+                rf"\b(?:{self._trie_pattern(self._build_trie(self.terms))})\w*",
+                re.IGNORECASE,
+            )
+
+    @staticmethod
+    def _build_trie(terms: List[str]) -> dict:
+        trie: dict = {}
+        for term in terms:
+            node = trie
+            for char in term:
+                node = node.setdefault(char, {})
+            node[""] = {}
+        return trie
+
+    @classmethod
+    def _trie_pattern(cls, node: dict) -> str:
+        alternatives = [
+            (r"\s+" if char == " " else re.escape(char)) + cls._trie_pattern(child)
+            for char, child in sorted(node.items())
+            if char
+        ]
+        if not alternatives:
+            return ""
+
+        pattern = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        if "" in node:
+            pattern = f"(?:{pattern})?"
+        return pattern
+
+    @classmethod
+    def from_file(cls, path: str) -> "BannedTermMatcher":
+        """
+        Loads one term or phrase per line; blank lines and # comments are skipped.
+        """
+        with open(path, encoding="utf-8") as handle:
+            terms = [line.split("#", 1)[0].strip() for line in handle]
+        return cls(term for term in terms if term)
+
+    def search(self, text: str) -> Optional[str]:
+        """
+        Returns the first banned term found in the text, or None.
+        """
+        if self._pattern is None or not text:
+            return None
+        match = self._pattern.search(text)
+        return match.group(0).lower() if match else None
+
+    def find_all(self, text: str) -> List[str]:
+        if self._pattern is None or not text:
+            return []
+        return sorted({match.group(0).lower() for match in self._pattern.finditer(text)})
+
+
+def load_banned_term_matcher(path: Optional[str] = None) -> BannedTermMatcher:
+    path = settings.banned_words_path if path is None else path
+    if path:
+        return BannedTermMatcher.from_file(path)
+    return BannedTermMatcher(BANNED_WORDS)
+
+
+banned_term_matcher = load_banned_term_matcher()
+
+@traced("validate.input")
 def validate_user_input(user_input: str) -> Tuple[bool, str]:
     """
     Validates the user's input before story generation.
@@ -25,17 +133,11 @@ def validate_user_input(user_input: str) -> Tuple[bool, str]:
     """
 
     if not user_input or not user_input.strip():
-        return False, "Story request cannot be empty."
+        return False, EMPTY_INPUT_ERROR
 
-    lowered = user_input.lower().strip()
+    if banned_term_matcher.search(user_input):
+        return False, INAPPROPRIATE_INPUT_ERROR
 
-    for word in BANNED_WORDS:
-        if word in lowered:
-            return False, (
-                "This story request includes themes that are not appropriate "
-                "for a children's bedtime story. Please rephrase."
-            )
-    
     return True, ""
 
 # Post-Generation Validators
@@ -69,19 +171,84 @@ def validate_judge_result(judge_result: dict) -> bool:
     return judge_result.get("verdict") == "PASS"
 
 
+@traced("validate.final_story")
 def validate_final_story(story: str, judge_result: dict) -> Tuple[bool, str]:
     """
     Final validation before returning the story to the user.
     """
 
     if not validate_story_length(story):
-        return False, "Story length is outside the acceptable range."
+        return False, STORY_LENGTH_ERROR
 
     if not validate_judge_result(judge_result):
-        return False, "Story did not meet quality requirements."
+        return False, JUDGE_VERDICT_ERROR
 
     if not has_positive_ending(story):
-        return False, "Story does not appear to have a clear, positive ending."
+        return False, POSITIVE_ENDING_ERROR
 
     return True, ""
 
+
+# Pre-Judge Checks
+# Deterministic rules that run before the LLM judge. A rule returns None when
+# the story passes, or feedback for the storyteller when it does not, so a
+# story that would be rejected locally never costs a judge call.
+
+PreJudgeRule = Callable[[str], Optional[str]]
+
+
+def check_banned_terms(story: str) -> Optional[str]:
+    found = banned_term_matcher.find_all(story)
+    if not found:
+        return None
+    return (
+        "Remove these words, which are not appropriate for young children: "
+        + ", ".join(found)
+        + "."
+    )
+
+
+def check_story_length(story: str) -> Optional[str]:
+    word_count = len(story.split())
+    if word_count < MIN_WORDS:
+        return (
+            f"The story is too short by {MIN_WORDS - word_count} words. "
+            f"Expand it to between {MIN_WORDS} and {MAX_WORDS} words."
+        )
+    if word_count > MAX_WORDS:
+        return (
+            f"The story is too long by {word_count - MAX_WORDS} words. "
+            f"Shorten it to between {MIN_WORDS} and {MAX_WORDS} words."
+        )
+    return None
+
+
+def check_positive_ending(story: str) -> Optional[str]:
+    if has_positive_ending(story):
+        return None
+    return "End the story with a clearly happy, peaceful final paragraph."
+
+
+PRE_JUDGE_RULES: List[Tuple[str, PreJudgeRule]] = [
+    ("banned_terms", check_banned_terms),
+    ("story_length", check_story_length),
+    ("positive_ending", check_positive_ending),
+]
+
+
+def run_pre_judge_checks(
+    story: str,
+    rules: Optional[List[Tuple[str, PreJudgeRule]]] = None,
+) -> Tuple[bool, str, str]:
+    """
+    Runs the pre-judge rules in order and stops at the first failure.
+
+    Returns (passed, failed_rule, feedback)
+    """
+
+    for name, rule in PRE_JUDGE_RULES if rules is None else rules:
+        feedback = rule(story)
+        if feedback:
+            return False, name, feedback
+
+    return True, "", ""
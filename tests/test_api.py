@@ -1,7 +1,12 @@
+import asyncio
+import json
+
 from fastapi.testclient import TestClient
 
 import src.api as api
 from src.auth import get_current_user
+from src.quotas import UserQuotas
+from src.validators import INAPPROPRIATE_INPUT_ERROR
 
 FAKE_USER = {"sub": "test-user-123"}
 
@@ -22,14 +27,13 @@ def test_health_check():
 
 
 def test_story_success(monkeypatch):
-    api._rate_limit_state.clear()
-    api.RATE_LIMIT_MAX_REQUESTS = 1000
+    api._rate_limiter.reset()
     _override_auth()
     try:
-        def fake_run_story_engine(user_input, feedback=None, request_id=None, **kwargs):
+        async def fake_run_story_engine(user_input, feedback=None, request_id=None, **kwargs):
             return "A calm story with a happy ending."
 
-        monkeypatch.setattr(api, "run_story_engine", fake_run_story_engine)
+        monkeypatch.setattr(api, "run_story_engine_async", fake_run_story_engine)
         client = TestClient(api.app)
 
         response = client.post("/story", json={"user_input": "A story about kindness"})
@@ -40,19 +44,19 @@ def test_story_success(monkeypatch):
         assert payload["story"]
         assert payload["request_id"]
         assert response.headers.get("X-Request-Id") == payload["request_id"]
+        assert payload["usage"]["total_tokens"] == 0
     finally:
         _clear_auth()
 
 
 def test_story_validation_error(monkeypatch):
-    api._rate_limit_state.clear()
-    api.RATE_LIMIT_MAX_REQUESTS = 1000
+    api._rate_limiter.reset()
     _override_auth()
     try:
-        def fake_run_story_engine(user_input, feedback=None, request_id=None, **kwargs):
+        async def fake_run_story_engine(user_input, feedback=None, request_id=None, **kwargs):
             return "Story request cannot be empty."
 
-        monkeypatch.setattr(api, "run_story_engine", fake_run_story_engine)
+        monkeypatch.setattr(api, "run_story_engine_async", fake_run_story_engine)
         client = TestClient(api.app)
 
         response = client.post("/story", json={"user_input": "   "})
@@ -63,3 +67,111 @@ def test_story_validation_error(monkeypatch):
         assert "cannot be empty" in payload["error"].lower()
     finally:
         _clear_auth()
+
+
+def test_story_stream_emits_sse_events(monkeypatch):
+    _override_auth()
+    try:
+        async def fake_stream_story_engine(user_input, feedback=None, request_id=None, **kwargs):
+            yield "token", {"attempt": 1, "text": "Once "}
+            yield "token", {"attempt": 1, "text": "upon a time."}
+            yield "final", {"status": "success", "request_id": request_id}
+
+        monkeypatch.setattr(api, "stream_story_engine", fake_stream_story_engine)
+        client = TestClient(api.app)
+
+        response = client.post("/story/stream", json={"user_input": "A story about kindness"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        blocks = [block for block in response.text.split("\n\n") if block]
+        assert blocks[0] == 'event: token\ndata: {"attempt": 1, "text": "Once "}'
+        assert blocks[-1].startswith("event: final")
+        assert response.headers["X-Request-Id"] in blocks[-1]
+    finally:
+        _clear_auth()
+
+
+def test_story_revision_edits_stored_story(monkeypatch):
+    api._rate_limiter.reset()
+    _override_auth()
+    calls = []
+    try:
+        async def fake_run_story_engine(user_input, feedback=None, request_id=None, **kwargs):
+            return "A calm story with a happy ending."
+
+        async def fake_run_revision_engine(story, feedback, user_input, **kwargs):
+            calls.append((story, feedback, user_input))
+            return "A shorter calm story with a happy ending."
+
+        monkeypatch.setattr(api, "run_story_engine_async", fake_run_story_engine)
+        monkeypatch.setattr(api, "run_revision_engine_async", fake_run_revision_engine)
+        client = TestClient(api.app)
+
+        story_id = client.post("/story", json={"user_input": "A story about kindness"}).json()["story_id"]
+        assert story_id
+
+        first = client.post(f"/story/{story_id}/revisions", json={"feedback": "Make it shorter"})
+        second = client.post(f"/story/{story_id}/revisions", json={"feedback": "Add a cat"})
+
+        assert first.status_code == 200
+        assert first.json()["story"] == "A shorter calm story with a happy ending."
+        assert first.json()["story_id"] == story_id
+        assert calls[0] == ("A calm story with a happy ending.", "Make it shorter", "A story about kindness")
+        assert calls[1][0] == "A shorter calm story with a happy ending."
+        assert second.status_code == 200
+
+        api.app.dependency_overrides[get_current_user] = lambda: {"sub": "someone-else"}
+        other = client.post(f"/story/{story_id}/revisions", json={"feedback": "Make it shorter"})
+        assert other.status_code == 404
+        assert len(calls) == 2
+    finally:
+        _clear_auth()
+
+
+def test_story_batch_streams_ndjson_results_by_index(monkeypatch):
+    api._rate_limiter.reset()
+    monkeypatch.setattr(api, "_user_quotas", UserQuotas(max_concurrent=2, request_quota=100))
+    _override_auth()
+    state = {"running": 0, "max_running": 0, "deadlines": []}
+    try:
+        async def fake_run_story_engine(user_input, feedback=None, request_id=None, **kwargs):
+            state["deadlines"].append(kwargs["deadline"])
+            state["running"] += 1
+            state["max_running"] = max(state["max_running"], state["running"])
+            try:
+                await asyncio.sleep(0.01)
+                if user_input == "boom":
+                    raise RuntimeError("upstream down")
+                if user_input == "scary":
+                    return INAPPROPRIATE_INPUT_ERROR
+                return f"A calm story about {user_input}."
+            finally:
+                state["running"] -= 1
+
+        monkeypatch.setattr(api, "run_story_engine_async", fake_run_story_engine)
+        monkeypatch.setattr(api.settings, "story_batch_concurrency", 2)
+        monkeypatch.setattr(api.settings, "story_deadline_seconds", 30.0)
+        client = TestClient(api.app)
+        inputs = ["owls", "boom", "scary", "otters", "   "]
+
+        response = client.post("/stories/batch", json={"items": [{"user_input": text} for text in inputs]})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        results = {line["index"]: line for line in map(json.loads, response.text.splitlines())}
+        assert sorted(results) == [0, 1, 2, 3, 4]
+        assert results[0]["status"] == "success" and results[0]["story"] == "A calm story about owls."
+        assert results[3]["status"] == "success"
+        assert results[1]["error"] == "Internal server error."
+        assert "not appropriate" in results[2]["error"]
+        assert "cannot be empty" in results[4]["error"]
+        assert results[0]["request_id"] == f"{response.headers['X-Request-Id']}-0"
+        assert state["max_running"] == 2
+        # Queued items share the batch's deadline rather than starting their own.
+        first_deadline = state["deadlines"][0]
+        assert first_deadline is not None
+        assert len(state["deadlines"]) == 4 and all(d is first_deadline for d in state["deadlines"])
+        assert api._user_quotas.usage("user:test-user-123") == {"in_flight": 0, "requests": 4, "tokens": 0}
+    finally:
+        _clear_auth()
@@ -19,10 +19,10 @@ def test_story_requires_authentication():
 def test_story_accepts_authenticated_user(monkeypatch):
     api.app.dependency_overrides[get_current_user] = lambda: {"sub": "user-123"}
 
-    def fake_run_story_engine(user_input, feedback=None, request_id=None, **kwargs):
+    async def fake_run_story_engine(user_input, feedback=None, request_id=None, **kwargs):
         return "A calm bedtime story with a happy ending."
 
-    monkeypatch.setattr(api, "run_story_engine", fake_run_story_engine)
+    monkeypatch.setattr(api, "run_story_engine_async", fake_run_story_engine)
     client = TestClient(api.app)
     response = client.post(
         "/story",
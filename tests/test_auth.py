@@ -1,7 +1,43 @@
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
 from fastapi import HTTPException
+from jose import jwk, jwt
 
 import src.auth as auth
 
+_PRIVATE_KEY_PEM = rsa.generate_private_key(public_exponent=65537, key_size=2048).private_bytes(
+    serialization.Encoding.PEM,
+    serialization.PrivateFormat.PKCS8,
+    serialization.NoEncryption(),
+)
+_PUBLIC_JWK = {**jwk.construct(_PRIVATE_KEY_PEM, "RS256").public_key().to_dict(), "kid": "k1"}
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _make_token(expires_in: int = 3600) -> str:
+    claims = {"sub": "user-123", "aud": "authenticated", "exp": int(time.time()) + expires_in}
+    return jwt.encode(claims, _PRIVATE_KEY_PEM, algorithm="RS256", headers={"kid": "k1"})
+
+
+@pytest.fixture(autouse=True)
+def _fresh_auth_caches(monkeypatch):
+    monkeypatch.setattr(
+        auth,
+        "_jwks_store",
+        auth.JwksKeyStore(ttl_seconds=600, refresh_ahead_seconds=60, min_refresh_interval_seconds=30),
+    )
+    auth._verified_token_cache.clear()
+
 
 def test_get_current_user_missing_credentials():
     try:
@@ -23,13 +59,101 @@ def test_verify_supabase_jwt_rejects_missing_kid(monkeypatch):
 
 
 def test_verify_supabase_jwt_success(monkeypatch):
-    monkeypatch.setattr(auth.jwt, "get_unverified_header", lambda _token: {"kid": "k1", "alg": "RS256"})
-    monkeypatch.setattr(auth, "_fetch_jwks", lambda: {"keys": [{"kid": "k1", "kty": "RSA"}]})
-    monkeypatch.setattr(
-        auth.jwt,
-        "decode",
-        lambda token, key, algorithms, audience, issuer: {"sub": "user-123", "role": "authenticated"},
-    )
+    monkeypatch.setattr(auth, "_fetch_jwks", lambda: {"keys": [_PUBLIC_JWK]})
 
-    payload = auth._verify_supabase_jwt("valid-token")
+    payload = auth._verify_supabase_jwt(_make_token())
     assert payload["sub"] == "user-123"
+
+
+def test_verify_supabase_jwt_caches_verified_tokens(monkeypatch):
+    monkeypatch.setattr(auth, "_fetch_jwks", lambda: {"keys": [_PUBLIC_JWK]})
+    token = _make_token()
+    assert auth._verify_supabase_jwt(token)["sub"] == "user-123"
+
+    def fail_decode(*args, **kwargs):
+        raise AssertionError("cached tokens must not be re-verified")
+
+    monkeypatch.setattr(auth.jwt, "decode", fail_decode)
+    assert auth._verify_supabase_jwt(token)["sub"] == "user-123"
+
+
+def test_verify_supabase_jwt_does_not_cache_expired_tokens(monkeypatch):
+    monkeypatch.setattr(auth, "_fetch_jwks", lambda: {"keys": [_PUBLIC_JWK]})
+    try:
+        auth._verify_supabase_jwt(_make_token(expires_in=-10))
+        assert False, "Expected HTTPException for expired token"
+    except HTTPException as exc:
+        assert exc.status_code == 401
+    assert len(auth._verified_token_cache) == 0
+
+
+def test_jwks_store_refreshes_once_for_unknown_kid(monkeypatch):
+    calls = {"count": 0}
+
+    def fake_fetch_jwks():
+        calls["count"] += 1
+        return {"keys": [_PUBLIC_JWK]}
+
+    monkeypatch.setattr(auth, "_fetch_jwks", fake_fetch_jwks)
+    clock = FakeClock()
+    store = auth.JwksKeyStore(ttl_seconds=600, refresh_ahead_seconds=60, min_refresh_interval_seconds=30, clock=clock)
+
+    assert store.get_key("k1")[0] == "RS256"
+    assert store.get_key("rotated") is None
+    assert calls["count"] == 1
+
+    clock.now = 31
+    assert store.get_key("rotated") is None
+    assert calls["count"] == 2
+
+
+def test_jwks_store_serves_stale_keys_when_refresh_fails(monkeypatch):
+    monkeypatch.setattr(auth, "_fetch_jwks", lambda: {"keys": [_PUBLIC_JWK]})
+    clock = FakeClock()
+    store = auth.JwksKeyStore(ttl_seconds=600, refresh_ahead_seconds=60, min_refresh_interval_seconds=30, clock=clock)
+    assert store.get_key("k1") is not None
+
+    def failing_fetch_jwks():
+        raise HTTPException(status_code=503, detail="Unable to verify authentication at this time.")
+
+    monkeypatch.setattr(auth, "_fetch_jwks", failing_fetch_jwks)
+    clock.now = 1000
+    assert store.get_key("k1") is not None
+    store._background_refresh.join(timeout=5)
+    assert store.get_key("k1") is not None
+
+
+def test_jwks_store_backs_off_after_failed_refresh_and_fails_closed_when_too_stale(monkeypatch):
+    monkeypatch.setattr(auth, "_fetch_jwks", lambda: {"keys": [_PUBLIC_JWK]})
+    clock = FakeClock()
+    store = auth.JwksKeyStore(
+        ttl_seconds=600, refresh_ahead_seconds=60, min_refresh_interval_seconds=30, max_stale_seconds=3600, clock=clock
+    )
+    assert store.get_key("k1") is not None
+    calls = {"count": 0}
+
+    def failing_fetch_jwks():
+        calls["count"] += 1
+        raise HTTPException(status_code=503, detail="Unable to verify authentication at this time.")
+
+    monkeypatch.setattr(auth, "_fetch_jwks", failing_fetch_jwks)
+    clock.now = 1000
+    assert store.get_key("k1") is not None
+    store._background_refresh.join(timeout=5)
+    assert calls["count"] == 1
+
+    clock.now = 1020
+    assert store.get_key("k1") is not None
+    assert not store._background_refresh.is_alive()
+    assert calls["count"] == 1
+
+    clock.now = 1031
+    assert store.get_key("k1") is not None
+    store._background_refresh.join(timeout=5)
+    assert calls["count"] == 2
+
+    clock.now = 3600
+    with pytest.raises(HTTPException) as exc_info:
+        store.get_key("k1")
+    assert exc_info.value.status_code == 503
+    assert calls["count"] == 3
@@ -0,0 +1,58 @@
+import json
+import random
+
+from fastapi.testclient import TestClient
+
+from benchmarks.fake_llm import FakeLLMConfig, LatencyModel, build_story, create_app
+from benchmarks.load_test import percentile
+from src.prompts import FUSED_SYSTEM_PROMPT, JUDGE_SYSTEM_PROMPT, STORYTELLER_SYSTEM_PROMPT
+from src.validators import run_pre_judge_checks, validate_final_story
+
+
+def _complete(client, system_prompt=None, **extra):
+    messages = [{"role": "user", "content": "A story about an owl"}]
+    if system_prompt:
+        messages.insert(0, {"role": "system", "content": system_prompt})
+    return client.post("/v1/chat/completions", json={"model": "fake", "messages": messages, **extra})
+
+
+def test_fake_story_passes_local_validation():
+    story = build_story(450, random.Random(1))
+    assert run_pre_judge_checks(story)[0]
+    assert validate_final_story(story, {"verdict": "PASS"}) == (True, "")
+
+
+def test_fake_backend_answers_each_stage():
+    client = TestClient(create_app(FakeLLMConfig(pass_ratio=0.0, seed=1)))
+
+    story = _complete(client, STORYTELLER_SYSTEM_PROMPT).json()
+    verdict = _complete(client, JUDGE_SYSTEM_PROMPT).json()
+    classification = _complete(client).json()
+
+    assert len(story["choices"][0]["message"]["content"].split()) == 450
+    assert story["usage"]["total_tokens"] > 0
+    assert json.loads(verdict["choices"][0]["message"]["content"])["verdict"] == "FAIL"
+    assert "theme" in json.loads(classification["choices"][0]["message"]["content"])
+
+    fused = json.loads(_complete(client, FUSED_SYSTEM_PROMPT).json()["choices"][0]["message"]["content"])
+    assert len(fused["story"].split()) == 450 and fused["verdict"] == "FAIL"
+
+
+def test_fake_backend_streams_usage_and_injects_failures():
+    client = TestClient(create_app(FakeLLMConfig(seed=1)))
+    streamed = _complete(client, STORYTELLER_SYSTEM_PROMPT, stream=True, stream_options={"include_usage": True})
+    events = [line[6:] for line in streamed.text.splitlines() if line.startswith("data: ")]
+    assert events[-1] == "[DONE]"
+    assert json.loads(events[-2])["usage"]["completion_tokens"] > 0
+
+    failing = TestClient(create_app(FakeLLMConfig(failure_rate=1.0, failure_status=429)))
+    assert _complete(failing).status_code == 429
+
+
+def test_latency_model_and_percentile():
+    assert LatencyModel.parse("uniform:0.1:0.2") == LatencyModel("uniform", 0.1, 0.2)
+    assert LatencyModel.parse("fixed:0.3").sample(random.Random(1)) == 0.3
+    values = sorted(float(value) for value in range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 95) is None
@@ -0,0 +1,80 @@
+from src.cache import SQLiteCache, TieredCache, TTLCache, normalize_text
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, ttl_seconds=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats() == {"size": 2, "hits": 3, "misses": 1, "evictions": 1, "expirations": 0}
+
+
+def test_ttl_cache_expires_entries():
+    clock = FakeClock()
+    cache = TTLCache(max_entries=10, ttl_seconds=5, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2, ttl_seconds=20)
+
+    clock.now = 10
+
+    assert cache.get("a") is None
+    assert cache.get("b") == 2
+    assert cache.expirations == 1
+
+
+def test_ttl_cache_disabled_when_max_entries_is_zero():
+    cache = TTLCache(max_entries=0, ttl_seconds=60)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_normalize_text():
+    assert normalize_text("  A Story\nabout  Dragons ") == "a story about dragons"
+
+
+def test_sqlite_cache_survives_reopen(tmp_path):
+    path = str(tmp_path / "stories.sqlite3")
+    cache = SQLiteCache(path, ttl_seconds=60)
+    cache.set("key", {"story": "Once upon a time."})
+    cache.close()
+
+    reopened = SQLiteCache(path, ttl_seconds=60)
+    assert reopened.get("key") == {"story": "Once upon a time."}
+    assert reopened.get("missing") is None
+
+
+def test_sqlite_cache_expires_entries(tmp_path):
+    clock = FakeClock()
+    cache = SQLiteCache(str(tmp_path / "stories.sqlite3"), ttl_seconds=5, clock=clock)
+    cache.set("key", "value")
+
+    clock.now = 10
+
+    assert cache.get("key") is None
+    assert cache.purge_expired() == 0
+
+
+def test_tiered_cache_promotes_persistent_hits(tmp_path):
+    persistent = SQLiteCache(str(tmp_path / "stories.sqlite3"), ttl_seconds=60)
+    persistent.set("key", "value")
+    cache = TieredCache(TTLCache(max_entries=10, ttl_seconds=60), persistent)
+
+    assert cache.get("key") == "value"
+    assert cache.get("key") == "value"
+    assert cache.stats()["memory_hits"] == 1
+    assert cache.stats()["persistent_hits"] == 1
@@ -0,0 +1,192 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import src.deadlines as deadlines
+import src.story_engine as story_engine
+import src.utils as utils
+from src.deadlines import Deadline, DeadlineExceeded, parse_deadline_header, request_deadline
+from src.metrics import STORY_DEADLINE_OUTCOMES, STORY_JUDGE_SKIPPED
+from src.prompts import JUDGE_SYSTEM_PROMPT, STORYTELLER_SYSTEM_PROMPT
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    story_engine.classification_cache.clear()
+    story_engine.story_cache.clear()
+
+
+def test_timeout_for_reserves_downstream_stages():
+    clock = FakeClock()
+    deadline = Deadline(20.0, clock=clock, estimate=lambda stage: 4.0)
+
+    # 20s left: classify keeps back generate + judge (8s).
+    assert deadline.timeout_for("classify", 30.0) == 12.0
+    assert deadline.timeout_for("judge", 30.0) == 20.0
+    assert deadline.timeout_for("judge", 5.0) == 5.0
+
+    # 10s left: reserving 8s would leave generate less than its own 4s.
+    clock.now = 10.0
+    assert deadline.timeout_for("generate", 30.0) == 6.0
+    assert deadline.timeout_for("classify", 30.0) == 10.0
+    assert deadline.allows("generate", "judge")
+    assert not deadline.allows("generate", "judge", "judge")
+
+    clock.now = 20.0
+    assert deadline.expired
+    with pytest.raises(DeadlineExceeded):
+        deadline.timeout_for("judge", 30.0)
+
+
+def test_request_deadline_takes_the_shorter_budget(monkeypatch):
+    monkeypatch.setattr(deadlines.settings, "story_deadline_seconds", 0.0)
+    assert request_deadline() is None
+    assert request_deadline("5").budget_seconds == 5.0
+
+    monkeypatch.setattr(deadlines.settings, "story_deadline_seconds", 10.0)
+    assert request_deadline().budget_seconds == 10.0
+    assert request_deadline("5").budget_seconds == 5.0
+    assert request_deadline("60").budget_seconds == 10.0
+    assert request_deadline("soon").budget_seconds == 10.0
+
+    assert parse_deadline_header("2.5") == 2.5
+    assert parse_deadline_header("0") is None
+    assert parse_deadline_header("-1") is None
+    assert parse_deadline_header(None) is None
+
+
+def test_call_model_timeout_is_capped_by_deadline(monkeypatch):
+    requests = []
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="Once upon a time"), finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+    )
+
+    async def create(**kwargs):
+        requests.append(kwargs)
+        return response
+
+    monkeypatch.setattr(utils, "get_async_client", lambda: SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+    clock = FakeClock()
+    deadline = Deadline(3.0, clock=clock, estimate=lambda stage: 1.0)
+
+    asyncio.run(utils.call_model_async("Judge this", stage="judge", timeout_seconds=30.0, deadline=deadline))
+    assert requests[0]["timeout"] == 3.0
+
+    clock.now = 3.0
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(utils.call_model_async("Judge this", stage="judge", deadline=deadline))
+    assert len(requests) == 1
+
+
+def test_run_story_engine_returns_unjudged_story_when_judge_does_not_fit(monkeypatch):
+    story = ("word " * 399) + "happy"
+    stages = []
+
+    def fake_call_model(user_prompt, system_prompt=None, stage=None, **kwargs):
+        stages.append(stage)
+        if system_prompt == STORYTELLER_SYSTEM_PROMPT:
+            return story
+        if system_prompt == JUDGE_SYSTEM_PROMPT:
+            return json.dumps({"scores": {}, "verdict": "PASS", "improvement_feedback": ""})
+        return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+    async def fake_call_model_async(*args, **kwargs):
+        return fake_call_model(*args, **kwargs)
+
+    monkeypatch.setattr(story_engine, "call_model_async", fake_call_model_async)
+    deadline = Deadline(5.0, clock=FakeClock(), estimate=lambda stage: 10.0 if stage == "judge" else 1.0)
+    skipped_before = STORY_JUDGE_SKIPPED.value()
+    best_effort_before = STORY_DEADLINE_OUTCOMES.value(outcome="best_effort")
+
+    result = story_engine.run_story_engine("A gentle story about a dragon", deadline=deadline)
+
+    assert result == story
+    assert stages == ["classify", "generate"]
+    assert STORY_JUDGE_SKIPPED.value() == skipped_before + 1
+    assert STORY_DEADLINE_OUTCOMES.value(outcome="best_effort") == best_effort_before + 1
+    # An unjudged story is never cached.
+    assert story_engine.story_cache.get(story_engine.story_cache_key("A gentle story about a dragon", None)) is None
+
+
+def test_run_story_engine_fails_fast_once_deadline_has_passed(monkeypatch):
+    calls = []
+
+    async def fake_call_model_async(*args, **kwargs):
+        calls.append(kwargs.get("stage"))
+
+    monkeypatch.setattr(story_engine, "call_model_async", fake_call_model_async)
+    clock = FakeClock()
+    deadline = Deadline(1.0, clock=clock, estimate=lambda stage: 1.0)
+    clock.now = 2.0
+
+    result = story_engine.run_story_engine("A gentle story about a dragon", deadline=deadline)
+
+    assert result == story_engine.FAILURE_MESSAGE
+    assert calls == ["classify"]
+
+
+def test_run_revision_engine_returns_unjudged_revision_when_judge_does_not_fit(monkeypatch):
+    revised = ("word " * 409) + "happy"
+    calls = []
+
+    async def fake_call_model_async(user_prompt, system_prompt=None, stage=None, deadline=None, **kwargs):
+        calls.append((stage, deadline))
+        return revised
+
+    monkeypatch.setattr(story_engine, "call_model_async", fake_call_model_async)
+    deadline = Deadline(5.0, clock=FakeClock(), estimate=lambda stage: 10.0 if stage == "judge" else 1.0)
+
+    result = story_engine.run_revision_engine(("word " * 449) + "happy", "Make it shorter", "A dragon story", deadline=deadline)
+
+    assert result == revised
+    assert calls == [("revise", deadline)]
+
+
+def test_run_revision_engine_fails_fast_once_deadline_has_passed(monkeypatch):
+    async def fake_call_model_async(*args, **kwargs):
+        raise AssertionError("no LLM call expected")
+
+    monkeypatch.setattr(story_engine, "call_model_async", fake_call_model_async)
+    clock = FakeClock()
+    deadline = Deadline(1.0, clock=clock, estimate=lambda stage: 1.0)
+    clock.now = 2.0
+
+    result = story_engine.run_revision_engine(("word " * 449) + "happy", "Make it shorter", "A dragon story", deadline=deadline)
+    assert result == story_engine.FAILURE_MESSAGE
+
+
+def test_stream_story_engine_skips_judge_when_it_does_not_fit(monkeypatch):
+    story = ("word " * 399) + "happy"
+
+    async def fake_stream_model_async(user_prompt, system_prompt=None, **kwargs):
+        for word in story.split(" "):
+            yield word + " "
+
+    async def fake_call_model_async(user_prompt, system_prompt=None, **kwargs):
+        assert system_prompt != JUDGE_SYSTEM_PROMPT
+        return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+    monkeypatch.setattr(story_engine, "stream_model_async", fake_stream_model_async)
+    monkeypatch.setattr(story_engine, "call_model_async", fake_call_model_async)
+    deadline = Deadline(5.0, clock=FakeClock(), estimate=lambda stage: 10.0 if stage == "judge" else 1.0)
+
+    async def collect():
+        return [event async for event in story_engine.stream_story_engine("A gentle story", deadline=deadline)]
+
+    name, final = asyncio.run(collect())[-1]
+
+    assert name == "final"
+    assert final["status"] == "success"
+    assert final["judge_skipped"] is True
+    assert final["verdict"] is None
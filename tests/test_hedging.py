@@ -0,0 +1,122 @@
+import asyncio
+from dataclasses import replace
+from types import SimpleNamespace
+
+import pytest
+
+import src.profiles as profiles
+import src.utils as utils
+from src.hedging import HedgeBudget, HedgePolicy, LatencyTracker
+from src.metrics import LLM_FALLBACKS, LLM_HEDGES
+
+
+def _response(content):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+    )
+
+
+def _async_client(create):
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def _hedging_policy(max_rate=1.0):
+    tracker = LatencyTracker(min_samples=1)
+    tracker.observe("judge", 0.01)
+    return HedgePolicy(enabled=True, min_delay_seconds=0.01, tracker=tracker, budget=HedgeBudget(max_rate=max_rate))
+
+
+def test_latency_tracker_quantile_and_budget():
+    tracker = LatencyTracker(min_samples=3)
+    tracker.observe("judge", 1.0)
+    assert tracker.quantile("judge", 0.95) is None
+    for seconds in (2.0, 3.0, 4.0):
+        tracker.observe("judge", seconds)
+    assert tracker.quantile("judge", 0.5) == 2.0
+    assert tracker.quantile("judge", 0.95) == 4.0
+
+    budget = HedgeBudget(max_rate=0.5, burst=1)
+    budget.record_call()
+    assert budget.try_acquire() is False
+    budget.record_call()
+    budget.record_call()
+    assert budget.try_acquire() is True
+    assert budget.try_acquire() is False
+
+    policy = HedgePolicy(enabled=True, min_delay_seconds=2.5, tracker=tracker)
+    assert policy.delay("judge", timeout_seconds=30) == 4.0
+    assert policy.delay("judge", timeout_seconds=3) is None
+    assert policy.delay("classify", timeout_seconds=30) is None
+    assert HedgePolicy(enabled=False, tracker=tracker).delay("judge", 30) is None
+
+
+def test_slow_call_is_hedged_and_loser_cancelled(monkeypatch):
+    cancelled = []
+
+    async def create(model, **kwargs):
+        if model == "slow-model":
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(model)
+                raise
+        return _response(f"answer from {model}")
+
+    monkeypatch.setattr(utils, "get_async_client", lambda: _async_client(create))
+    monkeypatch.setattr(utils, "hedge_policy", _hedging_policy())
+    monkeypatch.setattr(utils.settings, "llm_hedge_model", "fast-model")
+    before = LLM_HEDGES.value(stage="judge", outcome="hedge_won")
+
+    async def main():
+        content = await utils.call_model_async("Judge this", model="slow-model", stage="judge")
+        await asyncio.sleep(0)
+        return content
+
+    assert asyncio.run(main()) == "answer from fast-model"
+    assert cancelled == ["slow-model"]
+    assert LLM_HEDGES.value(stage="judge", outcome="hedge_won") == before + 1
+
+
+def test_hedge_budget_caps_hedging(monkeypatch):
+    models = []
+
+    async def create(model, **kwargs):
+        models.append(model)
+        await asyncio.sleep(0.05)
+        return _response("slow but fine")
+
+    monkeypatch.setattr(utils, "get_async_client", lambda: _async_client(create))
+    monkeypatch.setattr(utils, "hedge_policy", _hedging_policy(max_rate=0.0))
+    before = LLM_HEDGES.value(stage="judge", outcome="budget_exhausted")
+
+    assert asyncio.run(utils.call_model_async("Judge this", model="m", stage="judge")) == "slow but fine"
+    assert models == ["m"]
+    assert LLM_HEDGES.value(stage="judge", outcome="budget_exhausted") == before + 1
+
+
+def test_failed_model_falls_back_in_order(monkeypatch):
+    models = []
+
+    async def create(model, **kwargs):
+        models.append(model)
+        if model != "backup-2":
+            raise RuntimeError(f"{model} is down")
+        return _response("rescued")
+
+    profile = profiles.get_stage_profile("classify")
+    monkeypatch.setitem(
+        profiles.stage_profiles, "classify", replace(profile, fallback_models=("backup-1", "backup-2"))
+    )
+    monkeypatch.setattr(utils, "get_async_client", lambda: _async_client(create))
+    before = LLM_FALLBACKS.value(stage="classify", model="backup-2")
+
+    assert asyncio.run(utils.call_model_async("Classify", model="primary", stage="classify")) == "rescued"
+    assert models == ["primary", "backup-1", "backup-2"]
+    assert LLM_FALLBACKS.value(stage="classify", model="backup-2") == before + 1
+
+    models.clear()
+    monkeypatch.setitem(profiles.stage_profiles, "classify", replace(profile, fallback_models=("backup-1",)))
+    with pytest.raises(RuntimeError, match="backup-1 is down"):
+        asyncio.run(utils.call_model_async("Classify", model="primary", stage="classify"))
+    assert models == ["primary", "backup-1"]
@@ -0,0 +1,174 @@
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api as api
+from src.auth import get_current_user
+from src.jobs import (
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_SUCCEEDED,
+    InMemoryJobStore,
+    JobQueueFull,
+    JobWorkerPool,
+    SQLiteJobStore,
+    StoryJob,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _job(job_id="job-1"):
+    return StoryJob(job_id=job_id, subject="user:a", payload={"user_input": "A story"})
+
+
+def test_in_memory_store_expires_finished_jobs():
+    clock = FakeClock()
+    store = InMemoryJobStore(result_ttl_seconds=60, clock=clock)
+    job = _job()
+    store.save(job)
+    job.status = JOB_SUCCEEDED
+    job.finished_at = clock.now
+
+    clock.now += 59
+    assert store.get("job-1") is job
+    clock.now += 1
+    assert store.get("job-1") is None
+
+
+def test_sqlite_store_round_trip_and_marks_interrupted_jobs_failed(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = SQLiteJobStore(path, owner_id="worker-1")
+    store.save(_job("queued-job"))
+    done = _job("done-job")
+    done.status = JOB_SUCCEEDED
+    done.finished_at = time.time()
+    done.result = {"status": "success", "story": "Once upon a time"}
+    store.save(done)
+    store.close()
+
+    # The same instance restarting knows its old jobs are gone.
+    reopened = SQLiteJobStore(path, owner_id="worker-1")
+    assert reopened.get("done-job").result["story"] == "Once upon a time"
+    interrupted = reopened.get("queued-job")
+    assert interrupted.status == JOB_FAILED
+    assert "interrupted" in interrupted.result["error"]
+    assert reopened.get("missing") is None
+
+
+def test_sqlite_store_leaves_other_live_workers_jobs_alone(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    clock = FakeClock()
+    first = SQLiteJobStore(path, clock=clock, lease_seconds=60)
+    job = _job("running-job")
+    job.status = JOB_RUNNING
+    job.started_at = clock.now
+    first.save(job)
+
+    second = SQLiteJobStore(path, clock=clock, lease_seconds=60)
+    assert second.get("running-job").status == JOB_RUNNING
+
+    clock.now += 50
+    first.heartbeat()
+    clock.now += 50
+    second.heartbeat()
+    assert second.get("running-job").status == JOB_RUNNING
+
+    # The first worker dies; once its lease runs out the job is failed.
+    clock.now += 61
+    second.heartbeat()
+    abandoned = second.get("running-job")
+    assert abandoned.status == JOB_FAILED
+    assert "interrupted" in abandoned.result["error"]
+
+
+def test_pool_runs_jobs_and_rejects_overflow():
+    store = InMemoryJobStore()
+    release = asyncio.Event()
+
+    async def handler(job):
+        await release.wait()
+        return {"status": "success", "story": job.payload["user_input"]}
+
+    async def run():
+        pool = JobWorkerPool(store, handler, workers=1, max_queue_size=1)
+        pool.submit(_job("first"))
+        await asyncio.sleep(0)  # the worker picks up the first job
+        pool.submit(_job("second"))
+        with pytest.raises(JobQueueFull) as exc_info:
+            pool.submit(_job("third"))
+        assert exc_info.value.depth == 1
+        assert store.get("third") is None
+        assert store.get("second").status == JOB_QUEUED
+
+        release.set()
+        await pool._queue.join()
+        await pool.stop()
+
+    asyncio.run(run())
+    assert store.get("first").status == JOB_SUCCEEDED
+    assert store.get("second").result["story"] == "A story"
+
+
+def test_story_job_submit_and_poll(monkeypatch):
+    api._rate_limiter.reset()
+    api._user_quotas.reset()
+
+    async def fake_run_story_engine(user_input, feedback=None, request_id=None, **kwargs):
+        return "A calm story with a happy ending."
+
+    monkeypatch.setattr(api, "run_story_engine_async", fake_run_story_engine)
+    api.app.dependency_overrides[get_current_user] = lambda: {"sub": "job-user"}
+    try:
+        with TestClient(api.app) as client:
+            submitted = client.post("/story/jobs", json={"user_input": "A story about kindness"})
+            assert submitted.status_code == 202
+            job_id = submitted.json()["job_id"]
+
+            for _ in range(50):
+                polled = client.get(f"/story/jobs/{job_id}")
+                if polled.json()["status"] == JOB_SUCCEEDED:
+                    break
+                time.sleep(0.01)
+
+            api.app.dependency_overrides[get_current_user] = lambda: {"sub": "someone-else"}
+            other_user = client.get(f"/story/jobs/{job_id}")
+    finally:
+        api.app.dependency_overrides.clear()
+
+    assert polled.status_code == 200
+    assert polled.json()["status"] == JOB_SUCCEEDED
+    assert polled.json()["result"]["story"] == "A calm story with a happy ending."
+    assert other_user.status_code == 404
+    assert api._user_quotas.usage("user:job-user")["in_flight"] == 0
+
+
+def test_story_job_queue_overflow_returns_503(monkeypatch):
+    api._rate_limiter.reset()
+    api._user_quotas.reset()
+
+    async def never_finishes(job):
+        await asyncio.sleep(3600)
+
+    pool = JobWorkerPool(InMemoryJobStore(), never_finishes, workers=1, max_queue_size=1)
+    monkeypatch.setattr(api, "_job_pool", pool)
+    monkeypatch.setattr(api, "_user_quotas", api.UserQuotas())
+    api.app.dependency_overrides[get_current_user] = lambda: {"sub": "busy-user"}
+    try:
+        with TestClient(api.app) as client:
+            responses = [client.post("/story/jobs", json={"user_input": "A story"}) for _ in range(3)]
+    finally:
+        api.app.dependency_overrides.clear()
+
+    assert responses[0].status_code == 202
+    assert responses[-1].status_code == 503
+    assert responses[-1].json()["queue_depth"] == 1
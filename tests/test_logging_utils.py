@@ -1,6 +1,16 @@
+import io
 import json
+import logging
 
-from src.logging_utils import get_logger, log_event
+from src.logging_utils import (
+    BatchingQueueHandler,
+    EventSampler,
+    JsonFormatter,
+    get_logger,
+    log_event,
+    parse_sample_rates,
+)
+from src.metrics import LOG_EVENTS_SAMPLED_OUT, LOG_RECORDS_DROPPED
 
 
 def test_log_event_emits_json(capsys):
@@ -14,3 +24,44 @@ def test_log_event_emits_json(capsys):
     assert payload["request_id"] == "req-123"
     assert payload["stage"] == "test"
     assert payload["level"] == "INFO"
+
+
+def _record(event: str) -> logging.LogRecord:
+    record = logging.LogRecord("test_logger", logging.INFO, __file__, 1, event, None, None)
+    record.extra_fields = {"event": event}
+    return record
+
+
+def test_batching_queue_handler_writes_batches():
+    stream = io.StringIO()
+    handler = BatchingQueueHandler(stream=stream, batch_size=10)
+    handler.setFormatter(JsonFormatter())
+    for index in range(3):
+        handler.emit(_record(f"event_{index}"))
+
+    handler.start()
+    handler.close()
+
+    lines = stream.getvalue().splitlines()
+    assert [json.loads(line)["event"] for line in lines] == ["event_0", "event_1", "event_2"]
+
+
+def test_batching_queue_handler_drops_when_full():
+    handler = BatchingQueueHandler(stream=io.StringIO(), max_queue_size=2)
+    for index in range(5):
+        handler.emit(_record(f"event_{index}"))
+
+    assert handler.dropped == 3
+    assert LOG_RECORDS_DROPPED.value() >= 3
+    assert handler.queue.qsize() == 2
+
+
+def test_event_sampler_keeps_fraction_of_sampled_events():
+    values = iter([0.05, 0.5])
+    sampler = EventSampler(parse_sample_rates("llm_call_start=0.1"), rng=lambda: next(values))
+
+    assert sampler.keep("http_request")
+    assert sampler.keep("llm_call_start")
+    assert not sampler.keep("llm_call_start")
+    assert sampler.sampled_out == 1
+    assert LOG_EVENTS_SAMPLED_OUT.value(event="llm_call_start") >= 1
@@ -0,0 +1,61 @@
+from fastapi.testclient import TestClient
+
+import src.api as api
+from src.auth import get_current_user
+from src.metrics import Counter, Gauge, Histogram, MetricsRegistry
+
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram("test_latency_seconds", "Test latency.", ["stage"], buckets=(0.1, 1), registry=None)
+    histogram.observe(0.05, stage="judge")
+    histogram.observe(0.5, stage="judge")
+    histogram.observe(3, stage="judge")
+
+    lines = histogram.render()
+
+    assert 'test_latency_seconds_bucket{stage="judge",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{stage="judge",le="1"} 2' in lines
+    assert 'test_latency_seconds_bucket{stage="judge",le="+Inf"} 3' in lines
+    assert 'test_latency_seconds_sum{stage="judge"} 3.55' in lines
+    assert 'test_latency_seconds_count{stage="judge"} 3' in lines
+    assert histogram.count(stage="judge") == 3
+
+
+def test_counter_and_gauge_render():
+    registry = MetricsRegistry()
+    counter = Counter("test_verdicts_total", "Test verdicts.", ["verdict"], registry=registry)
+    counter.inc(verdict="PASS")
+    counter.inc(2, verdict="FAIL")
+    gauge = Gauge("test_in_flight", "Test gauge.", registry=registry)
+    with gauge.track_in_progress():
+        assert gauge.value() == 1
+    assert gauge.value() == 0
+
+    text = registry.render()
+
+    assert "# TYPE test_verdicts_total counter" in text
+    assert 'test_verdicts_total{verdict="FAIL"} 2' in text
+    assert "# TYPE test_in_flight gauge" in text
+    assert "test_in_flight 0" in text
+
+
+def test_metrics_endpoint_reports_story_latency(monkeypatch):
+    api._rate_limiter.reset()
+
+    async def fake_run_story_engine(user_input, feedback=None, request_id=None, **kwargs):
+        return "A calm story with a happy ending."
+
+    monkeypatch.setattr(api, "run_story_engine_async", fake_run_story_engine)
+    api.app.dependency_overrides[get_current_user] = lambda: {"sub": "metrics-user"}
+    try:
+        client = TestClient(api.app)
+        client.post("/story", json={"user_input": "A story about kindness"})
+        response = client.get("/metrics")
+    finally:
+        api.app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'story_request_duration_seconds_count{route="/story",status="success"}' in response.text
+    assert 'story_requests_in_flight{route="/story"} 0' in response.text
+    assert "# TYPE story_llm_call_duration_seconds histogram" in response.text
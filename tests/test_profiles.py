@@ -0,0 +1,44 @@
+import pytest
+
+from src.profiles import DEFAULT_STAGE_PROFILES, OutputTokenTuner, get_stage_profile, parse_stage_profile
+
+
+def test_parse_stage_profile_overrides_defaults():
+    base = DEFAULT_STAGE_PROFILES["classify"]
+    profile = parse_stage_profile("model=gpt-4o-mini, max_tokens=64,temperature=0.2,timeout=5,stop=END|###", base)
+
+    assert profile.model == "gpt-4o-mini"
+    assert profile.max_tokens == 64
+    assert profile.temperature == 0.2
+    assert profile.timeout_seconds == 5
+    assert profile.stop == ("END", "###")
+    assert parse_stage_profile("", base) == base
+    assert parse_stage_profile("fallback=gpt-4o|gpt-4o-mini", base).fallback_models == ("gpt-4o", "gpt-4o-mini")
+
+    with pytest.raises(ValueError):
+        parse_stage_profile("colour=blue", base)
+
+
+def test_stages_have_their_own_profiles():
+    assert get_stage_profile("classify").max_tokens < get_stage_profile("generate").max_tokens
+    assert get_stage_profile("generate").temperature > get_stage_profile("judge").temperature
+    assert get_stage_profile("unknown").max_tokens == 3000
+
+
+def test_output_token_tuner_caps_to_observed_sizes():
+    tuner = OutputTokenTuner(window=10, min_samples=3, headroom=1.5, floor=32)
+    assert tuner.cap("classify", 150) == 150
+
+    for tokens in (40, 50, 60):
+        tuner.observe("classify", tokens)
+    assert tuner.cap("classify", 150) == 90
+    assert tuner.cap("classify", 80) == 80
+
+    tuner.observe("classify", 90, truncated=True)
+    assert tuner.cap("classify", 150) == 150
+
+
+def test_output_token_tuner_respects_floor():
+    tuner = OutputTokenTuner(min_samples=1, floor=32)
+    tuner.observe("judge", 4)
+    assert tuner.cap("judge", 600) == 32
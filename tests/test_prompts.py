@@ -0,0 +1,48 @@
+import src.prompts as prompts
+from src.metrics import PROMPT_CHARS
+
+
+def test_static_instructions_live_in_the_system_prompt():
+    user_prompt = prompts.build_storyteller_prompt(
+        "A dragon who bakes bread",
+        {"theme": "kindness", "tone": "calm"},
+        "Make the ending warmer.",
+    )
+
+    assert "STORY REQUIREMENTS" in prompts.STORYTELLER_SYSTEM_PROMPT
+    assert "STORY REQUIREMENTS" not in user_prompt
+    assert "A dragon who bakes bread" in user_prompt
+    assert "- Theme: kindness" in user_prompt and "- Genre: not specified" in user_prompt
+    assert user_prompt.index("A dragon") < user_prompt.index("Make the ending warmer.")
+
+    judge_prompt = prompts.build_judge_prompt("Once upon a time", "A dragon who bakes bread")
+    assert "SCORING GUIDE" in prompts.JUDGE_SYSTEM_PROMPT and "SCORING GUIDE" not in judge_prompt
+    assert judge_prompt.index("A dragon who bakes bread") < judge_prompt.index("Once upon a time")
+    assert "The user asked for" not in prompts.build_judge_prompt("Once upon a time")
+
+
+def test_fused_prompt_shares_the_storyteller_user_message():
+    assert prompts.FUSED_SYSTEM_PROMPT.startswith(prompts.STORYTELLER_SYSTEM_PROMPT)
+    assert '"story": "<the full story>"' in prompts.FUSED_SYSTEM_PROMPT
+    assert prompts.build_fused_prompt("A sleepy owl", None, "Shorter.") == prompts.build_storyteller_prompt(
+        "A sleepy owl", None, "Shorter."
+    )
+
+
+def test_user_content_is_not_treated_as_a_template():
+    prompt = prompts.build_revision_prompt("The {story} had {braces}.", "Keep {this}.", {"theme": "calm"})
+    assert "The {story} had {braces}." in prompt and "Keep {this}." in prompt
+    assert prompt.index("EDITING RULES") < prompt.index("Keep the story's theme (calm)") < prompt.index("STORY:")
+
+
+def test_registry_versions_and_size_metrics():
+    assert set(prompts.PROMPT_TEMPLATES) == {"classify", "generate", "judge", "revise", "fused"}
+    versions = {template.version for template in prompts.PROMPT_TEMPLATES.values()}
+    assert len(versions) == 5
+    assert prompts.get_template("judge").version == prompts.JUDGE_PROMPT_VERSION
+
+    template = prompts.PromptTemplate("test", "SYSTEM", "Hello {name}.", tail=" Bye.")
+    assert template.version != prompts.PromptTemplate("test", "SYSTEM", "Hi {name}.", tail=" Bye.").version
+    before = PROMPT_CHARS.count(template="test")
+    assert template.render("tail", name="Ada") == "Hello Ada. Bye."
+    assert PROMPT_CHARS.count(template="test") == before + 1
@@ -0,0 +1,136 @@
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api as api
+from src.auth import get_current_user
+from src.quotas import QuotaExceeded, UserQuotas
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_concurrency_limit_is_per_user_and_released():
+    quotas = UserQuotas(max_concurrent=2)
+    first = quotas.acquire("user:a")
+    quotas.acquire("user:a")
+
+    with pytest.raises(QuotaExceeded) as exc_info:
+        quotas.acquire("user:a")
+    assert exc_info.value.limit == "concurrency"
+    quotas.acquire("user:b")
+
+    first.release()
+    first.release()
+    assert quotas.usage("user:a")["in_flight"] == 1
+    quotas.acquire("user:a")
+
+
+def test_request_quota_rolls_over_window():
+    clock = FakeClock()
+    quotas = UserQuotas(request_quota=2, window_seconds=100, clock=clock)
+    quotas.acquire("user:a").release()
+    clock.now += 40
+    quotas.acquire("user:a").release()
+
+    with pytest.raises(QuotaExceeded) as exc_info:
+        quotas.acquire("user:a")
+    assert exc_info.value.limit == "requests"
+    assert exc_info.value.retry_after_seconds == pytest.approx(60)
+
+    clock.now += 61
+    quotas.acquire("user:a")
+
+
+
+def test_batch_slot_counts_items_with_admit():
+    quotas = UserQuotas(max_concurrent=1, request_quota=2)
+    lease = quotas.acquire("user:a", count_request=False)
+    assert quotas.usage("user:a") == {"in_flight": 1, "requests": 0, "tokens": 0}
+
+    quotas.admit("user:a")
+    quotas.admit("user:a")
+    with pytest.raises(QuotaExceeded) as exc_info:
+        quotas.admit("user:a")
+    assert exc_info.value.limit == "requests"
+
+    lease.release()
+    assert quotas.usage("user:a") == {"in_flight": 0, "requests": 2, "tokens": 0}
+
+def test_token_quota_retry_after_waits_for_enough_spend_to_expire():
+    clock = FakeClock()
+    quotas = UserQuotas(token_quota=1000, window_seconds=100, clock=clock)
+    quotas.record_tokens("user:a", 300)
+    clock.now += 10
+    quotas.record_tokens("user:a", 800)
+
+    with pytest.raises(QuotaExceeded) as exc_info:
+        quotas.acquire("user:a")
+    assert exc_info.value.limit == "tokens"
+    # Dropping the first 300 tokens is enough; that happens 90s from now.
+    assert exc_info.value.retry_after_seconds == pytest.approx(90)
+
+    clock.now += 91
+    quotas.acquire("user:a")
+    assert quotas.usage("user:a")["tokens"] == 800
+
+
+def test_disabled_quotas_keep_no_history():
+    quotas = UserQuotas(max_concurrent=1)
+    quotas.acquire("user:a").release()
+    quotas.admit("user:a")
+    quotas.record_tokens("user:a", 500)
+    assert quotas.usage("user:a") == {"in_flight": 0, "requests": 0, "tokens": 0}
+
+
+def test_idle_users_are_evicted_but_busy_ones_are_kept():
+    quotas = UserQuotas(max_concurrent=1, max_users=1)
+    quotas.acquire("user:a")
+    quotas.acquire("user:b").release()
+
+    with pytest.raises(QuotaExceeded):
+        quotas.acquire("user:a")
+
+
+def test_users_are_only_evicted_once_their_window_has_expired():
+    clock = FakeClock()
+    quotas = UserQuotas(request_quota=1, window_seconds=60, max_users=1, clock=clock)
+    quotas.acquire("user:a").release()
+
+    # Crowding user:a out must not hand them a fresh quota.
+    quotas.acquire("user:b").release()
+    with pytest.raises(QuotaExceeded):
+        quotas.acquire("user:a")
+    assert len(quotas) == 2
+
+    clock.now += 61
+    quotas.acquire("user:c").release()
+    assert len(quotas) == 1
+    assert quotas.usage("user:a") == {"in_flight": 0, "requests": 0, "tokens": 0}
+
+
+def test_story_returns_429_when_request_quota_is_exhausted(monkeypatch):
+    api._rate_limiter.reset()
+    monkeypatch.setattr(api, "_user_quotas", UserQuotas(max_concurrent=2, request_quota=1))
+
+    async def fake_run_story_engine(user_input, feedback=None, request_id=None, **kwargs):
+        return "A calm story with a happy ending."
+
+    monkeypatch.setattr(api, "run_story_engine_async", fake_run_story_engine)
+    client = TestClient(api.app)
+    api.app.dependency_overrides[get_current_user] = lambda: {"sub": "quota-user"}
+    try:
+        assert client.post("/story", json={"user_input": "A story"}).status_code == 200
+        limited = client.post("/story", json={"user_input": "A story"})
+    finally:
+        api.app.dependency_overrides.clear()
+
+    assert limited.status_code == 429
+    assert limited.json()["limit"] == "requests"
+    assert "quota" in limited.json()["error"].lower()
+    assert int(limited.headers["Retry-After"]) >= 1
+    assert api._user_quotas.usage("user:quota-user")["in_flight"] == 0
@@ -0,0 +1,222 @@
+import asyncio
+import math
+import threading
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import src.api as api
+from src.auth import get_current_user
+from src.rate_limit import (
+    InMemoryTokenBucketBackend,
+    RateLimitDecision,
+    RateLimiter,
+    RedisTokenBucketBackend,
+    RateLimitRule,
+    parse_route_rules,
+    retry_after_header,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """
+    In-process stand-in for the parts of redis.Redis the backend uses. The
+    registered script runs a Python port of the Lua token bucket, with TIME
+    read from `clock`, and replies with bytes like the real client.
+    """
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.hashes = {}
+        self.expiry_ms = {}
+        self.scripts = []
+
+    def register_script(self, script):
+        self.scripts.append(script)
+
+        def run(keys, args):
+            capacity, refill, cost = (float(value) for value in args)
+            now = self.clock()
+            state = self.hashes.get(keys[0], {})
+            tokens = float(state.get("tokens", capacity))
+            ts = float(state.get("ts", now))
+            tokens = min(capacity, tokens + max(0.0, now - ts) * refill)
+            allowed = 0
+            if tokens >= cost:
+                tokens -= cost
+                allowed = 1
+            self.hashes[keys[0]] = {"tokens": tokens, "ts": now}
+            self.expiry_ms[keys[0]] = math.ceil(capacity / refill * 1000)
+            return [allowed, str(tokens).encode()]
+
+        return run
+
+    def scan_iter(self, match):
+        prefix = match.rstrip("*")
+        return [key for key in list(self.hashes) if key.startswith(prefix)]
+
+    def delete(self, key):
+        self.hashes.pop(key, None)
+
+
+def test_redis_backend_allows_denies_and_refills():
+    clock = FakeClock()
+    fake = FakeRedis(clock)
+    backend = RedisTokenBucketBackend(client=fake)
+    rule = RateLimitRule.per_window(2, 10)
+
+    assert "redis.call('TIME')" in fake.scripts[0]
+    assert backend.consume("k", rule) == RateLimitDecision(allowed=True, remaining=1)
+    assert backend.consume("k", rule).allowed
+    denied = backend.consume("k", rule)
+    assert not denied.allowed
+    assert denied.retry_after_seconds == 5
+    assert fake.expiry_ms["ratelimit:k"] == 10000
+
+    clock.now = 5
+    assert backend.consume("k", rule).allowed
+    assert not backend.consume("k", rule).allowed
+
+
+def test_redis_backend_reset_only_clears_its_prefix():
+    fake = FakeRedis(FakeClock())
+    backend = RedisTokenBucketBackend(key_prefix="rl:", client=fake)
+    fake.hashes["other:k"] = {"tokens": 1.0, "ts": 0.0}
+    backend.consume("k", RateLimitRule.per_window(1, 60))
+
+    backend.reset()
+    assert list(fake.hashes) == ["other:k"]
+
+
+def test_check_async_keeps_blocking_backends_off_the_event_loop():
+    threads = []
+
+    class RecordingBackend(InMemoryTokenBucketBackend):
+        blocking = True
+
+        def consume(self, key, rule, cost=1):
+            threads.append(threading.current_thread())
+            return super().consume(key, rule, cost)
+
+    limiter = RateLimiter(backend=RecordingBackend(), default_rule=RateLimitRule.per_window(1, 60), exempt_paths={"/health"})
+
+    async def run():
+        return (
+            await limiter.check_async("ip:1", "/story"),
+            await limiter.check_async("ip:1", "/story"),
+            await limiter.check_async("ip:1", "/health"),
+        )
+
+    allowed, denied, exempt = asyncio.run(run())
+    assert allowed.allowed and not denied.allowed and exempt is None
+    assert len(threads) == 2
+    assert threading.main_thread() not in threads
+
+
+def test_token_bucket_refills_over_time():
+    clock = FakeClock()
+    backend = InMemoryTokenBucketBackend(clock=clock)
+    rule = RateLimitRule.per_window(2, 10)
+
+    assert backend.consume("k", rule).allowed
+    assert backend.consume("k", rule).allowed
+    denied = backend.consume("k", rule)
+    assert not denied.allowed
+    assert denied.retry_after_seconds == 5
+    assert retry_after_header(denied) == "5"
+
+    clock.now = 5
+    assert backend.consume("k", rule).allowed
+
+
+def test_in_memory_backend_is_bounded():
+    backend = InMemoryTokenBucketBackend(max_keys=3)
+    rule = RateLimitRule.per_window(1, 60)
+    for index in range(10):
+        backend.consume(f"ip:{index}", rule)
+
+    assert len(backend) == 3
+    assert backend.evictions == 7
+
+
+def test_rate_limiter_route_rules_and_exemptions():
+    limiter = RateLimiter(
+        backend=InMemoryTokenBucketBackend(),
+        default_rule=RateLimitRule.per_window(5, 60),
+        route_rules=parse_route_rules("/story/stream=1/60, /stories/batch=2/30"),
+        exempt_paths={"/health"},
+    )
+
+    assert limiter.rule_for("/stories/batch") == RateLimitRule(capacity=2, refill_per_second=2 / 30)
+    assert limiter.check("user:a", "/health") is None
+    assert limiter.check("user:a", "/story/stream").allowed
+    assert not limiter.check("user:a", "/story/stream").allowed
+    assert limiter.check("user:b", "/story/stream").allowed
+    assert limiter.check("user:a", "/story").allowed
+
+
+def test_story_rate_limit_is_keyed_by_user(monkeypatch):
+    limiter = RateLimiter(
+        backend=InMemoryTokenBucketBackend(),
+        default_rule=RateLimitRule.per_window(1, 60),
+    )
+    monkeypatch.setattr(api, "_rate_limiter", limiter)
+
+    async def fake_run_story_engine(user_input, feedback=None, request_id=None, **kwargs):
+        return "A calm story with a happy ending."
+
+    monkeypatch.setattr(api, "run_story_engine_async", fake_run_story_engine)
+    client = TestClient(api.app)
+    try:
+        api.app.dependency_overrides[get_current_user] = lambda: {"sub": "user-a"}
+        assert client.post("/story", json={"user_input": "A story"}).status_code == 200
+        limited = client.post("/story", json={"user_input": "A story"})
+
+        api.app.dependency_overrides[get_current_user] = lambda: {"sub": "user-b"}
+        other_user = client.post("/story", json={"user_input": "A story"})
+    finally:
+        api.app.dependency_overrides.clear()
+
+    assert limited.status_code == 429
+    assert limited.json()["error"] == "Rate limit exceeded."
+    assert limited.json()["request_id"] == limited.headers["X-Request-Id"]
+    assert int(limited.headers["Retry-After"]) >= 1
+    assert other_user.status_code == 200
+    assert client.get("/health").status_code == 200
+
+
+def test_unauthenticated_requests_are_limited_by_ip_before_auth(monkeypatch):
+    backend = InMemoryTokenBucketBackend()
+    monkeypatch.setattr(
+        api,
+        "_ip_rate_limiter",
+        RateLimiter(backend=backend, default_rule=RateLimitRule.per_window(2, 60), exempt_paths={"/health"}),
+    )
+    auth_calls = []
+
+    def failing_auth():
+        auth_calls.append(1)
+        raise HTTPException(status_code=401, detail="Invalid token")
+
+    api.app.dependency_overrides[get_current_user] = failing_auth
+    client = TestClient(api.app)
+    try:
+        statuses = [client.post("/story", json={"user_input": "A story"}).status_code for _ in range(3)]
+        metrics = client.get("/metrics")
+        health = client.get("/health")
+    finally:
+        api.app.dependency_overrides.clear()
+
+    assert statuses == [401, 401, 429]
+    assert len(auth_calls) == 2
+    # One bucket per IP across routes, so /metrics is limited too.
+    assert metrics.status_code == 429
+    assert health.status_code == 200
@@ -0,0 +1,146 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import openai
+import pytest
+
+import src.utils as utils
+from src.resilience import (
+    STATE_CLOSED,
+    STATE_HALF_OPEN,
+    STATE_OPEN,
+    CircuitBreaker,
+    CircuitBreakerRegistry,
+    CircuitOpenError,
+    RetryPolicy,
+    is_retryable,
+    retry_after_seconds,
+)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _status_error(status_code: int, headers: dict | None = None) -> openai.APIStatusError:
+    request = httpx.Request("POST", "https://api.example.test/v1/chat/completions")
+    response = httpx.Response(status_code, headers=headers, request=request)
+    return openai.APIStatusError(f"status {status_code}", response=response, body=None)
+
+
+def _response(content):
+    return SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=content), finish_reason="stop")],
+        usage=SimpleNamespace(prompt_tokens=10, completion_tokens=5),
+    )
+
+
+def test_errors_are_classified():
+    request = httpx.Request("POST", "https://api.example.test")
+    assert is_retryable(_status_error(429))
+    assert is_retryable(_status_error(503))
+    assert is_retryable(openai.APITimeoutError(request=request))
+    assert is_retryable(openai.APIConnectionError(request=request))
+    assert not is_retryable(_status_error(400))
+    assert not is_retryable(_status_error(401))
+    assert not is_retryable(ValueError("bad json"))
+    assert not is_retryable(CircuitOpenError("m", 1.0))
+
+
+def test_retry_after_headers():
+    assert retry_after_seconds(_status_error(429, {"retry-after": "3"})) == 3.0
+    assert retry_after_seconds(_status_error(429, {"retry-after-ms": "250"})) == 0.25
+    assert retry_after_seconds(_status_error(429, {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert retry_after_seconds(_status_error(429)) is None
+    assert retry_after_seconds(RuntimeError("no response")) is None
+
+
+def test_backoff_is_jittered_capped_and_honors_retry_after():
+    policy = RetryPolicy(max_retries=3, base_delay_seconds=1.0, max_delay_seconds=3.0, rng=lambda: 1.0)
+    error = _status_error(503)
+    assert [policy.delay(retry, error) for retry in range(4)] == [1.0, 2.0, 3.0, None]
+    assert RetryPolicy(rng=lambda: 0.5, base_delay_seconds=1.0).delay(0, error) == 0.5
+
+    assert policy.delay(0, _status_error(429, {"retry-after": "2.5"})) == 2.5
+    assert policy.delay(0, _status_error(429, {"retry-after": "60"})) is None
+    assert policy.delay(0, _status_error(400)) is None
+
+
+def test_circuit_breaker_opens_fails_fast_and_recovers():
+    clock = FakeClock()
+    breaker = CircuitBreaker("m", failure_threshold=2, recovery_seconds=10, clock=clock)
+
+    breaker.record_failure(_status_error(400))
+    breaker.record_failure(_status_error(503))
+    assert breaker.state == STATE_CLOSED
+    breaker.record_failure(_status_error(503))
+    assert breaker.state == STATE_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now = 10
+    trial = breaker.before_call()
+    assert trial is not None
+    assert breaker.state == STATE_HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_failure(_status_error(502), trial)
+    assert breaker.state == STATE_OPEN
+
+    clock.now = 20
+    breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == STATE_CLOSED
+    assert breaker.before_call() is None
+
+
+def test_only_the_trial_call_ends_the_half_open_trial():
+    clock = FakeClock()
+    breaker = CircuitBreaker("m", failure_threshold=1, recovery_seconds=10, clock=clock)
+    breaker.record_failure(_status_error(503))
+    clock.now = 10
+    trial = breaker.before_call()
+
+    # A call from before the circuit opened fails late, and a cancelled
+    # hedge reports in: neither releases or decides the trial.
+    breaker.record_failure(_status_error(503))
+    breaker.record_failure(asyncio.CancelledError())
+    assert breaker.state == STATE_HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_failure(asyncio.CancelledError(), trial)
+    assert breaker.before_call() is not None
+
+
+def test_call_model_retries_then_trips_circuit(monkeypatch):
+    calls = []
+    outcomes = [_status_error(503), _status_error(503), "recovered"]
+
+    async def create(**kwargs):
+        calls.append(kwargs["model"])
+        outcome = outcomes.pop(0) if outcomes else _status_error(503)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return _response(outcome)
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(utils, "get_async_client", lambda: fake_client)
+    monkeypatch.setattr(utils, "retry_policy", RetryPolicy(max_retries=2, base_delay_seconds=0))
+    monkeypatch.setattr(utils, "circuit_breakers", CircuitBreakerRegistry(failure_threshold=3, recovery_seconds=60))
+
+    assert asyncio.run(utils.call_model_async("Hi", model="m", stage="judge")) == "recovered"
+    assert len(calls) == 3
+
+    calls.clear()
+    with pytest.raises(openai.APIStatusError):
+        asyncio.run(utils.call_model_async("Hi", model="m", stage="judge"))
+    assert len(calls) == 3
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(utils.call_model_async("Hi", model="m", stage="judge"))
+    assert len(calls) == 3
@@ -0,0 +1,47 @@
+from src.sessions import StorySessionStore
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_sessions_are_scoped_to_their_subject():
+    store = StorySessionStore(max_entries=10, ttl_seconds=60)
+    session = store.create("user:a", "A dragon story", "Once upon a time.", {"theme": "kindness"})
+
+    assert store.get(session.story_id, "user:a") == session
+    assert store.get(session.story_id, "user:b") is None
+    assert store.get("unknown", "user:a") is None
+
+
+def test_revise_keeps_id_and_refreshes_ttl():
+    clock = FakeClock()
+    store = StorySessionStore(max_entries=10, ttl_seconds=60, clock=clock)
+    session = store.create("user:a", "A dragon story", "Once upon a time.")
+
+    clock.now = 50
+    revised = store.revise(session, "A shorter tale.")
+    clock.now = 100
+
+    current = store.get(session.story_id, "user:a")
+    assert current == revised
+    assert current.story == "A shorter tale."
+    assert current.revisions == 1
+
+    clock.now = 111
+    assert store.get(session.story_id, "user:a") is None
+
+
+def test_store_is_bounded():
+    store = StorySessionStore(max_entries=2, ttl_seconds=60)
+    first = store.create("user:a", "one", "story one")
+    store.create("user:a", "two", "story two")
+    store.create("user:a", "three", "story three")
+
+    assert len(store) == 2
+    assert store.get(first.story_id, "user:a") is None
+    assert not StorySessionStore(max_entries=0).enabled
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from src.singleflight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flights = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "story"
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", work) for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert [result for result, _ in results] == ["story"] * 3
+    assert [shared for _, shared in results] == [False, True, True]
+    assert len(calls) == 1
+    assert flights.coalesced == 2
+    assert len(flights) == 0
+
+
+def test_errors_reach_every_waiter():
+    flights = SingleFlight()
+
+    async def work():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream failed")
+
+    async def run():
+        return await asyncio.gather(*(flights.do("key", work) for _ in range(2)), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_work_survives_until_last_waiter_leaves():
+    flights = SingleFlight()
+    state = {"cancelled": False}
+
+    async def work():
+        try:
+            await asyncio.sleep(0.05)
+            return "story"
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def run():
+        first = asyncio.create_task(flights.do("key", work))
+        second = asyncio.create_task(flights.do("key", work))
+        await asyncio.sleep(0)
+        first.cancel()
+        result = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return result
+
+    assert asyncio.run(run()) == ("story", True)
+    assert not state["cancelled"]
+
+
+def test_work_is_cancelled_when_every_waiter_leaves():
+    flights = SingleFlight()
+    state = {"cancelled": False}
+
+    async def work():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def run():
+        waiter = asyncio.create_task(flights.do("key", work))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert state["cancelled"]
+    assert len(flights) == 0
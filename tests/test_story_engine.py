@@ -1,22 +1,88 @@
+import asyncio
 import json
+from dataclasses import replace
+from types import SimpleNamespace
 
+import pytest
+
+import src.profiles as profiles
 import src.story_engine as story_engine
+from src.deadlines import Deadline
 from src.prompts import JUDGE_SYSTEM_PROMPT, STORYTELLER_SYSTEM_PROMPT
+from src.resilience import CircuitOpenError
+from src.usage import UsageLedger
+
+
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    story_engine.classification_cache.clear()
+    story_engine.story_cache.clear()
 
 
 def _make_story(word_count=400):
     return ("word " * (word_count - 1)) + "happy"
 
 
+def _patch_call_model(monkeypatch, fake_call_model):
+    async def fake_call_model_async(*args, **kwargs):
+        return fake_call_model(*args, **kwargs)
+
+    monkeypatch.setattr(story_engine, "call_model_async", fake_call_model_async)
+
+
 def test_classify_request_invalid_json(monkeypatch):
     def fake_call_model(*args, **kwargs):
         return "not-json"
 
-    monkeypatch.setattr(story_engine, "call_model", fake_call_model)
-    result = story_engine.classify_request("A story about kindness")
+    _patch_call_model(monkeypatch, fake_call_model)
+    result = asyncio.run(story_engine.classify_request_async("A story about kindness"))
     assert result is None
 
 
+def test_classify_request_upstream_error_degrades(monkeypatch):
+    def fake_call_model(*args, **kwargs):
+        raise ConnectionError("upstream down")
+
+    _patch_call_model(monkeypatch, fake_call_model)
+    assert asyncio.run(story_engine.classify_request_async("A story about kindness")) is None
+
+
+def test_upstream_failure_costs_one_attempt(monkeypatch):
+    stages = []
+
+    def fake_call_model(user_prompt, system_prompt=None, stage=None, **kwargs):
+        stages.append(stage)
+        if stage == "classify":
+            return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+        if stages.count("generate") == 1:
+            raise RuntimeError("upstream unavailable")
+        if stage == "generate":
+            return _make_story(400)
+        return json.dumps({"scores": {}, "verdict": "PASS", "improvement_feedback": ""})
+
+    _patch_call_model(monkeypatch, fake_call_model)
+
+    result = story_engine.run_story_engine("A gentle story about a dragon", max_retries=3)
+    assert result == _make_story(400)
+    assert stages == ["classify", "generate", "generate", "judge"]
+
+
+def test_open_circuit_ends_request_without_burning_attempts(monkeypatch):
+    stages = []
+
+    def fake_call_model(user_prompt, system_prompt=None, stage=None, **kwargs):
+        stages.append(stage)
+        if stage == "classify":
+            return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+        raise CircuitOpenError("test-model", 30.0)
+
+    _patch_call_model(monkeypatch, fake_call_model)
+
+    result = story_engine.run_story_engine("A gentle story about a dragon", max_retries=3)
+    assert result == story_engine.FAILURE_MESSAGE
+    assert stages == ["classify", "generate"]
+
+
 def test_run_story_engine_success(monkeypatch):
     story = _make_story(400)
     judge_payload = {
@@ -32,7 +98,7 @@ def test_run_story_engine_success(monkeypatch):
             return json.dumps(judge_payload)
         return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
 
-    monkeypatch.setattr(story_engine, "call_model", fake_call_model)
+    _patch_call_model(monkeypatch, fake_call_model)
 
     result = story_engine.run_story_engine("A gentle story about a dragon")
     assert "happy" in result
@@ -57,7 +123,7 @@ def test_run_story_engine_retries_on_judge_failure(monkeypatch):
             return json.dumps(judge_payload)
         return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
 
-    monkeypatch.setattr(story_engine, "call_model", fake_call_model)
+    _patch_call_model(monkeypatch, fake_call_model)
 
     result = story_engine.run_story_engine("A gentle story about a dragon", max_retries=1)
     assert "happy" in result
@@ -67,3 +133,364 @@ def test_run_story_engine_retries_on_judge_failure(monkeypatch):
 def test_run_story_engine_rejects_invalid_input():
     result = story_engine.run_story_engine("A story with murder")
     assert "not appropriate" in result.lower()
+
+
+def test_run_story_engine_async_success(monkeypatch):
+    story = _make_story(400)
+    judge_payload = {
+        "scores": {},
+        "verdict": "PASS",
+        "improvement_feedback": "",
+    }
+
+    async def fake_call_model_async(user_prompt, system_prompt=None, **kwargs):
+        if system_prompt == STORYTELLER_SYSTEM_PROMPT:
+            return story
+        if system_prompt == JUDGE_SYSTEM_PROMPT:
+            return json.dumps(judge_payload)
+        return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+    monkeypatch.setattr(story_engine, "call_model_async", fake_call_model_async)
+
+    result = asyncio.run(story_engine.run_story_engine_async("A gentle story about a dragon"))
+    assert "happy" in result
+
+
+def test_stream_story_engine_restarts_then_succeeds(monkeypatch):
+    story = _make_story(400)
+    verdicts = iter(["FAIL", "PASS"])
+
+    async def fake_stream_model_async(user_prompt, system_prompt=None, **kwargs):
+        for word in story.split(" "):
+            yield word + " "
+
+    async def fake_call_model_async(user_prompt, system_prompt=None, **kwargs):
+        if system_prompt == JUDGE_SYSTEM_PROMPT:
+            return json.dumps({"scores": {}, "verdict": next(verdicts), "improvement_feedback": "More gentle."})
+        return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+    monkeypatch.setattr(story_engine, "stream_model_async", fake_stream_model_async)
+    monkeypatch.setattr(story_engine, "call_model_async", fake_call_model_async)
+
+    async def collect():
+        return [event async for event in story_engine.stream_story_engine("A gentle story", max_retries=1)]
+
+    events = asyncio.run(collect())
+    names = [name for name, _ in events]
+
+    assert names[0] == "token"
+    assert names.count("restart") == 1
+    assert names[-1] == "final"
+    assert events[-1][1]["status"] == "success"
+    assert events[-1][1]["attempts"] == 2
+    streamed = "".join(data["text"] for name, data in events if name == "token" and data["attempt"] == 2)
+    assert streamed.strip() == story
+
+
+def test_run_story_engine_async_speculative_returns_first_passing(monkeypatch):
+    stories = iter([_make_story(400), _make_story(401), _make_story(402)])
+    state = {"judged": [], "straggler_cancelled": False}
+
+    async def fake_call_model_async(user_prompt, system_prompt=None, **kwargs):
+        if system_prompt == STORYTELLER_SYSTEM_PROMPT:
+            story = next(stories)
+            if len(story.split()) == 402:
+                # The third candidate is a straggler that should be cancelled.
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    await asyncio.sleep(0.05)  # slow cleanup
+                    state["straggler_cancelled"] = True
+                    raise
+            return story
+        if system_prompt == JUDGE_SYSTEM_PROMPT:
+            verdict = "PASS" if state["judged"] else "FAIL"
+            state["judged"].append(verdict)
+            return json.dumps({"scores": {}, "verdict": verdict, "improvement_feedback": ""})
+        return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+    monkeypatch.setattr(story_engine, "call_model_async", fake_call_model_async)
+
+    async def run():
+        started_at = asyncio.get_running_loop().time()
+        result = await story_engine.run_story_engine_async("A gentle story", max_retries=0, candidates=3)
+        # The straggler has already unwound, not just been asked to.
+        assert state["straggler_cancelled"]
+        return result, asyncio.get_running_loop().time() - started_at
+
+    result, elapsed = asyncio.run(run())
+    assert "happy" in result
+    assert state["judged"] == ["FAIL", "PASS"]
+    assert elapsed < 1
+
+
+def test_classify_request_uses_cache(monkeypatch):
+    state = {"calls": 0}
+
+    def fake_call_model(*args, **kwargs):
+        state["calls"] += 1
+        return json.dumps({"theme": "kindness", "tone": "calm", "genre": "animals"})
+
+    _patch_call_model(monkeypatch, fake_call_model)
+
+    first = asyncio.run(story_engine.classify_request_async("A story about a kind fox"))
+    second = asyncio.run(story_engine.classify_request_async("  a STORY about a kind fox "))
+
+    assert first == second == {"theme": "kindness", "tone": "calm", "genre": "animals"}
+    assert state["calls"] == 1
+    assert story_engine.classification_cache.hits == 1
+
+
+def _counting_call_model(story, state):
+    def fake_call_model(user_prompt, system_prompt=None, **kwargs):
+        state["calls"] += 1
+        if system_prompt == STORYTELLER_SYSTEM_PROMPT:
+            return story
+        if system_prompt == JUDGE_SYSTEM_PROMPT:
+            return json.dumps({"scores": {}, "verdict": "PASS", "improvement_feedback": ""})
+        return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+    return fake_call_model
+
+
+def test_run_story_engine_serves_repeat_requests_from_cache(monkeypatch):
+    story = _make_story(400)
+    state = {"calls": 0}
+    _patch_call_model(monkeypatch, _counting_call_model(story, state))
+
+    first = story_engine.run_story_engine("A gentle story about a dragon")
+    calls_after_first = state["calls"]
+    second = story_engine.run_story_engine("a gentle story  about a DRAGON")
+
+    assert first == second == story
+    assert calls_after_first == 3
+    assert state["calls"] == calls_after_first
+
+    story_engine.run_story_engine("A gentle story about a dragon", feedback="Make it funnier.")
+    assert state["calls"] > calls_after_first
+
+
+def test_run_story_engine_cache_opt_out(monkeypatch):
+    story = _make_story(400)
+    state = {"calls": 0}
+    _patch_call_model(monkeypatch, _counting_call_model(story, state))
+
+    story_engine.run_story_engine("A gentle story about a dragon", use_cache=False)
+    story_engine.run_story_engine("A gentle story about a dragon", use_cache=False)
+
+    # The classification is still reused; generation and judging are not.
+    assert state["calls"] == 5
+    assert len(story_engine.story_cache.memory) == 0
+
+
+def test_run_story_engine_does_not_cache_failed_stories(monkeypatch):
+    state = {"calls": 0}
+    _patch_call_model(monkeypatch, _counting_call_model("too short", state))
+
+    story_engine.run_story_engine("A gentle story about a dragon", max_retries=0)
+
+    assert len(story_engine.story_cache.memory) == 0
+
+
+def test_run_story_engine_skips_judge_when_pre_judge_check_fails(monkeypatch):
+    stories = iter([_make_story(720), _make_story(450)])
+    state = {"judge_calls": 0, "prompts": []}
+
+    def fake_call_model(user_prompt, system_prompt=None, **kwargs):
+        if system_prompt == STORYTELLER_SYSTEM_PROMPT:
+            state["prompts"].append(user_prompt)
+            return next(stories)
+        if system_prompt == JUDGE_SYSTEM_PROMPT:
+            state["judge_calls"] += 1
+            return json.dumps({"scores": {}, "verdict": "PASS", "improvement_feedback": ""})
+        return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+    _patch_call_model(monkeypatch, fake_call_model)
+    avoided_before = story_engine.JUDGE_CALLS_AVOIDED.value(rule="story_length")
+
+    result = story_engine.run_story_engine("A gentle story about a dragon", max_retries=1)
+
+    assert len(result.split()) == 450
+    assert state["judge_calls"] == 1
+    assert "too long by 120 words" in state["prompts"][1]
+    assert story_engine.JUDGE_CALLS_AVOIDED.value(rule="story_length") == avoided_before + 1
+
+
+def test_run_story_engine_stops_retrying_past_token_ceiling(monkeypatch):
+    state = {"generate_calls": 0}
+
+    def fake_call_model(user_prompt, system_prompt=None, usage=None, stage="unknown", **kwargs):
+        usage.record(stage, "test-model", SimpleNamespace(prompt_tokens=300, completion_tokens=400))
+        if system_prompt == STORYTELLER_SYSTEM_PROMPT:
+            state["generate_calls"] += 1
+            return _make_story(400)
+        if system_prompt == JUDGE_SYSTEM_PROMPT:
+            return json.dumps({"scores": {}, "verdict": "FAIL", "improvement_feedback": "More gentle."})
+        return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+    _patch_call_model(monkeypatch, fake_call_model)
+    ledger = UsageLedger(max_total_tokens=2000, prices={})
+
+    result = story_engine.run_story_engine("A gentle story about a dragon", max_retries=5, usage=ledger)
+
+    assert result == story_engine.FAILURE_MESSAGE
+    # classify + (generate + judge) pushes the total to 2100 after one attempt.
+    assert state["generate_calls"] == 1
+    assert ledger.by_stage["generate"].calls == 1
+    assert ledger.exceeded
+
+
+def test_run_story_engine_async_coalesces_identical_requests(monkeypatch):
+    story = _make_story(400)
+    state = {"calls": 0}
+
+    async def fake_call_model_async(user_prompt, system_prompt=None, **kwargs):
+        state["calls"] += 1
+        await asyncio.sleep(0.01)
+        if system_prompt == STORYTELLER_SYSTEM_PROMPT:
+            return story
+        if system_prompt == JUDGE_SYSTEM_PROMPT:
+            return json.dumps({"scores": {}, "verdict": "PASS", "improvement_feedback": ""})
+        return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+    monkeypatch.setattr(story_engine, "call_model_async", fake_call_model_async)
+    coalesced_before = story_engine.STORY_REQUESTS_COALESCED.value()
+
+    async def run():
+        return await asyncio.gather(
+            story_engine.run_story_engine_async("A gentle story about a dragon"),
+            story_engine.run_story_engine_async("a gentle story about a DRAGON"),
+            story_engine.run_story_engine_async("A gentle story about a dragon", use_cache=False),
+        )
+
+    results = asyncio.run(run())
+    assert results == [story, story, story]
+    # One shared run plus the opted-out one, three LLM calls each.
+    assert state["calls"] == 6
+    assert story_engine.STORY_REQUESTS_COALESCED.value() == coalesced_before + 1
+
+
+
+def test_coalescing_only_joins_requests_with_compatible_options(monkeypatch):
+    story = _make_story(400)
+    state = {"calls": 0}
+
+    async def fake_call_model_async(user_prompt, system_prompt=None, **kwargs):
+        state["calls"] += 1
+        await asyncio.sleep(0.01)
+        if system_prompt == JUDGE_SYSTEM_PROMPT:
+            return json.dumps({"scores": {}, "verdict": "PASS", "improvement_feedback": ""})
+        if system_prompt == STORYTELLER_SYSTEM_PROMPT:
+            return story
+        return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+    monkeypatch.setattr(story_engine, "call_model_async", fake_call_model_async)
+    coalesced_before = story_engine.STORY_REQUESTS_COALESCED.value()
+    short, long = Deadline(10.0), Deadline(60.0)
+
+    async def run():
+        return await asyncio.gather(
+            story_engine.run_story_engine_async("A gentle story about a dragon", deadline=short),
+            story_engine.run_story_engine_async("A gentle story about a dragon", deadline=long),
+            story_engine.run_story_engine_async("A gentle story about a dragon", candidates=2),
+        )
+
+    asyncio.run(run())
+    assert story_engine.STORY_REQUESTS_COALESCED.value() == coalesced_before
+
+def test_run_revision_engine_edits_previous_story(monkeypatch):
+    previous = _make_story(450)
+    revised = _make_story(410)
+    prompts = []
+
+    def fake_call_model(user_prompt, system_prompt=None, stage=None, **kwargs):
+        prompts.append((stage, user_prompt))
+        if stage == "revise":
+            return revised
+        if system_prompt == JUDGE_SYSTEM_PROMPT:
+            return json.dumps({"scores": {}, "verdict": "PASS", "improvement_feedback": ""})
+        raise AssertionError(f"unexpected {stage} call")
+
+    _patch_call_model(monkeypatch, fake_call_model)
+    usage = UsageLedger()
+
+    result = story_engine.run_revision_engine(
+        previous,
+        "Make it shorter",
+        "A gentle story about a dragon",
+        classification={"theme": "friendship", "tone": "calm"},
+        usage=usage,
+    )
+
+    assert result == revised
+    assert [stage for stage, _ in prompts] == ["revise", "judge"]
+    assert previous in prompts[0][1] and "Make it shorter" in prompts[0][1]
+
+
+def test_run_revision_engine_rejects_unsafe_feedback(monkeypatch):
+    def fake_call_model(*args, **kwargs):
+        raise AssertionError("no LLM call expected")
+
+    _patch_call_model(monkeypatch, fake_call_model)
+    result = story_engine.run_revision_engine(_make_story(450), "Add a murder", "A dragon story")
+    assert "not appropriate" in result.lower()
+
+
+def test_run_revision_engine_rechecks_original_request(monkeypatch):
+    def fake_call_model(*args, **kwargs):
+        raise AssertionError("no LLM call expected")
+
+    _patch_call_model(monkeypatch, fake_call_model)
+    rejected = story_engine.run_story_engine("A story with murder")
+
+    assert story_engine.is_error_story(rejected)
+    assert story_engine.run_revision_engine(rejected, "Make it shorter", "A story with murder") == rejected
+    assert not story_engine.is_error_story(_make_story(450))
+
+
+def test_fused_mode_makes_one_call_per_attempt(monkeypatch):
+    stages = []
+    responses = iter([
+        json.dumps({"story": _make_story(400), "verdict": "FAIL", "improvement_feedback": "Add a cat."}),
+        json.dumps({"story": _make_story(420), "scores": {}, "verdict": "PASS", "improvement_feedback": ""}),
+    ])
+
+    def fake_call_model(user_prompt, system_prompt=None, stage=None, **kwargs):
+        stages.append(stage)
+        if stage == "fused":
+            assert system_prompt == story_engine.FUSED_SYSTEM_PROMPT
+            if len(stages) == 3:
+                assert "Add a cat." in user_prompt
+            return next(responses)
+        return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+    _patch_call_model(monkeypatch, fake_call_model)
+
+    result = story_engine.run_story_engine("A gentle story about a dragon", mode="fused")
+    assert result == _make_story(420)
+    assert stages == ["classify", "fused", "fused"]
+
+
+def test_fused_mode_treats_malformed_output_as_failed_attempt(monkeypatch):
+    def fake_call_model(user_prompt, system_prompt=None, stage=None, **kwargs):
+        if stage == "fused":
+            return "not-json"
+        return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+    _patch_call_model(monkeypatch, fake_call_model)
+    assert story_engine._parse_fused_response(json.dumps({"story": "Once."})) == ("Once.", None)
+
+    result = asyncio.run(
+        story_engine.run_story_engine_async("A gentle story about a dragon", max_retries=1, use_cache=False, mode="fused")
+    )
+    assert result == story_engine.FAILURE_MESSAGE
+
+
+def test_story_cache_key_depends_on_mode_and_models(monkeypatch):
+    two_call = story_engine.story_cache_key("A story", None, "two_call")
+    fused = story_engine.story_cache_key("A story", None, "fused")
+    assert two_call != fused
+
+    monkeypatch.setitem(profiles.stage_profiles, "fused", replace(profiles.get_stage_profile("fused"), model="other-model"))
+    assert story_engine.story_cache_key("A story", None, "fused") != fused
+    assert story_engine.story_cache_key("A story", None, "two_call") == two_call
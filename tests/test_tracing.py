@@ -0,0 +1,170 @@
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import src.api as api
+import src.story_engine as story_engine
+import src.tracing as tracing
+from src.prompts import JUDGE_SYSTEM_PROMPT, STORYTELLER_SYSTEM_PROMPT
+
+
+@pytest.fixture
+def exporter(monkeypatch):
+    exporter = tracing.InMemorySpanExporter()
+    monkeypatch.setattr(tracing, "_tracer", tracing.Tracer(tracing.SimpleSpanProcessor(exporter)))
+    story_engine.classification_cache.clear()
+    story_engine.story_cache.clear()
+    return exporter
+
+
+async def _fake_call_model_async(user_prompt, system_prompt=None, **kwargs):
+    if system_prompt == STORYTELLER_SYSTEM_PROMPT:
+        return ("word " * 399) + "happy"
+    if system_prompt == JUDGE_SYSTEM_PROMPT:
+        return json.dumps({"scores": {}, "verdict": "PASS", "improvement_feedback": ""})
+    return json.dumps({"theme": "friendship", "tone": "calm", "genre": "fantasy"})
+
+
+def test_spans_nest_and_record_errors(exporter):
+    with pytest.raises(ValueError):
+        with tracing.start_span("root", request_id="r1") as root:
+            with tracing.start_span("child", attempt=2) as child:
+                child.set_attribute("model", "m")
+            raise ValueError("boom")
+
+    assert child.trace_id == root.trace_id
+    assert child.parent_span_id == root.span_id
+    assert root.parent_span_id is None
+    assert child.attributes == {"attempt": 2, "model": "m"}
+    assert child.status_code == tracing.STATUS_OK
+    assert root.status_code == tracing.STATUS_ERROR
+    assert root.status_message == "boom"
+    assert [span.name for span in exporter.spans] == ["child", "root"]
+    assert tracing.current_span() is tracing.NOOP_SPAN
+
+
+def test_spans_follow_asyncio_tasks(exporter):
+    @tracing.traced("leaf")
+    async def leaf():
+        await asyncio.sleep(0)
+
+    async def main():
+        with tracing.start_span("root") as root:
+            await asyncio.gather(asyncio.create_task(leaf()), asyncio.create_task(leaf()))
+        return root
+
+    root = asyncio.run(main())
+    leaves = exporter.by_name("leaf")
+    assert len(leaves) == 2
+    assert all(span.parent_span_id == root.span_id for span in leaves)
+
+
+def test_unsampled_trace_records_nothing(monkeypatch):
+    exporter = tracing.InMemorySpanExporter()
+    monkeypatch.setattr(
+        tracing, "_tracer", tracing.Tracer(tracing.SimpleSpanProcessor(exporter), sample_rate=0.5, rng=lambda: 0.9)
+    )
+    with tracing.start_span("root") as root:
+        with tracing.start_span("child") as child:
+            child.set_attribute("ignored", True)
+
+    assert root is tracing.NOOP_SPAN and child is tracing.NOOP_SPAN
+    assert exporter.spans == []
+
+
+def test_traceparent_joins_remote_trace(exporter):
+    header = "00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01"
+    with tracing.start_span("root", traceparent=header) as root:
+        pass
+    assert root.trace_id == "0af7651916cd43dd8448eb211c80319c"
+    assert root.parent_span_id == "b7ad6b7169203331"
+    assert tracing.parse_traceparent("garbage") is None
+    assert tracing.parse_traceparent(header.replace("-01", "-00"))[2] is False
+
+
+def test_jsonl_exporter_writes_otlp_lines(tmp_path, monkeypatch):
+    path = tmp_path / "traces" / "spans.jsonl"
+    exporter = tracing.JsonlSpanExporter(str(path), "test-service")
+    processor = tracing.BatchSpanProcessor(exporter, flush_interval_seconds=0.01)
+    monkeypatch.setattr(tracing, "_tracer", tracing.Tracer(processor))
+
+    with tracing.start_span("root", attempt=1, ok=True, score=0.5):
+        with tracing.start_span("child"):
+            pass
+    processor.shutdown()
+
+    spans = [
+        span
+        for line in path.read_text().splitlines()
+        for resource in json.loads(line)["resourceSpans"]
+        for scope in resource["scopeSpans"]
+        for span in scope["spans"]
+    ]
+    by_name = {span["name"]: span for span in spans}
+    assert by_name["child"]["parentSpanId"] == by_name["root"]["spanId"]
+    assert by_name["root"]["traceId"] == by_name["child"]["traceId"]
+    assert {"key": "attempt", "value": {"intValue": "1"}} in by_name["root"]["attributes"]
+    assert {"key": "ok", "value": {"boolValue": True}} in by_name["root"]["attributes"]
+    assert int(by_name["root"]["endTimeUnixNano"]) >= int(by_name["root"]["startTimeUnixNano"])
+
+
+def test_story_engine_spans(exporter, monkeypatch):
+    monkeypatch.setattr(story_engine, "call_model_async", _fake_call_model_async)
+
+    result = story_engine.run_story_engine("A gentle story about a dragon", request_id="req-1")
+    assert "happy" in result
+
+    engine = exporter.by_name("story.engine")[0]
+    attempt = exporter.by_name("story.attempt")[0]
+    assert engine.attributes["request_id"] == "req-1"
+    assert engine.attributes["cache_hit"] is False
+    assert attempt.parent_span_id == engine.span_id
+    assert attempt.attributes["attempt"] == 1
+    for name in ("story.generate", "story.judge", "validate.pre_judge", "validate.final_story"):
+        assert exporter.by_name(name)[0].parent_span_id == attempt.span_id
+    assert exporter.by_name("story.classify")[0].parent_span_id == engine.span_id
+    assert exporter.by_name("validate.input")[0].parent_span_id == engine.span_id
+    assert exporter.by_name("story.judge")[0].attributes["verdict"] == "PASS"
+
+
+def test_streamed_generation_failure_marks_span(exporter, monkeypatch):
+    async def failing_stream(**kwargs):
+        yield "Once "
+        raise RuntimeError("stream dropped")
+
+    monkeypatch.setattr(story_engine, "stream_model_async", failing_stream)
+
+    async def consume():
+        async for _ in story_engine.generate_story_stream("A story", {}):
+            pass
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(consume())
+
+    (span,) = exporter.by_name("story.generate")
+    assert span.status_code == tracing.STATUS_ERROR
+    assert span.status_message == "stream dropped"
+
+
+def test_http_request_is_root_span(exporter, monkeypatch):
+    async def fake_engine(*args, **kwargs):
+        with tracing.start_span("story.engine"):
+            return ("word " * 399) + "happy"
+
+    api.app.dependency_overrides[api.get_current_user] = lambda: {"sub": "user-1"}
+    monkeypatch.setattr(api, "run_story_engine_async", fake_engine)
+    try:
+        client = TestClient(api.app)
+        response = client.post("/story", json={"user_input": "A calm story"})
+    finally:
+        api.app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    root = exporter.by_name("HTTP POST")[0]
+    assert root.parent_span_id is None
+    assert root.attributes["http.route"] == "/story"
+    assert root.attributes["http.status_code"] == 200
+    assert response.headers["X-Trace-Id"] == root.trace_id
+    assert exporter.by_name("story.engine")[0].parent_span_id == root.span_id
@@ -0,0 +1,53 @@
+from types import SimpleNamespace
+
+from src.usage import UsageLedger, UserUsageTotals, parse_token_prices
+
+
+def _usage(prompt_tokens, completion_tokens):
+    return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def test_parse_token_prices():
+    prices = parse_token_prices("gpt-4o-mini=0.15/0.6, cheap=1")
+    assert prices == {"gpt-4o-mini": (0.15, 0.6), "cheap": (1.0, 1.0)}
+
+
+def test_ledger_rolls_up_by_stage_and_model():
+    ledger = UsageLedger(max_total_tokens=0, prices={"m": (1.0, 2.0)})
+    ledger.record("classify", "m", _usage(100, 10))
+    ledger.record("generate", "m", _usage(500, 1000))
+    ledger.record("generate", "m", _usage(500, 900))
+    ledger.record("judge", "other", None)
+
+    summary = ledger.summary()
+    assert summary["total_tokens"] == 3010
+    assert summary["calls"] == 4
+    assert summary["by_stage"]["generate"]["completion_tokens"] == 1900
+    assert summary["by_stage"]["generate"]["calls"] == 2
+    assert summary["by_model"]["m"]["cost_usd"] == round((1100 * 1.0 + 1910 * 2.0) / 1_000_000, 6)
+    assert summary["by_model"]["other"]["total_tokens"] == 0
+
+
+def test_ledger_ceiling():
+    ledger = UsageLedger(max_total_tokens=1000, prices={})
+    ledger.record("generate", "m", _usage(400, 600))
+    assert not ledger.exceeded
+    ledger.record("judge", "m", _usage(1, 0))
+    assert ledger.exceeded
+
+    assert not UsageLedger(max_total_tokens=0, prices={}).exceeded
+
+
+def test_user_totals_accumulate_and_evict():
+    totals = UserUsageTotals(max_users=2)
+    ledger = UsageLedger(max_total_tokens=0, prices={})
+    ledger.record("generate", "m", _usage(10, 20))
+
+    totals.record("a", ledger)
+    assert totals.record("a", ledger).total_tokens == 60
+    totals.record("b", ledger)
+    totals.record("c", ledger)
+
+    assert len(totals) == 2
+    assert totals.get("a").total_tokens == 0
+    assert totals.get("c").total_tokens == 30
@@ -0,0 +1,90 @@
+import asyncio
+from types import SimpleNamespace
+
+import src.utils as utils
+from src.usage import UsageLedger
+
+
+def test_async_client_is_shared(monkeypatch):
+    monkeypatch.setattr(utils.settings, "openai_api_key", "test-key")
+    monkeypatch.setattr(utils, "_async_client", None)
+    first = utils.get_async_client()
+    second = utils.get_async_client()
+    assert first is second
+
+    asyncio.run(utils.close_clients())
+    assert utils._async_client is None
+
+
+def test_scoped_async_client_is_closed_with_its_loop(monkeypatch):
+    monkeypatch.setattr(utils.settings, "openai_api_key", "test-key")
+    monkeypatch.setattr(utils, "_async_client", None)
+
+    async def client_in_task():
+        return utils.get_async_client()
+
+    async def run():
+        async with utils.scoped_async_client():
+            client = utils.get_async_client()
+            inner = await asyncio.create_task(client_in_task())
+        return client, inner
+
+    first, inner = asyncio.run(run())
+    second, _ = asyncio.run(run())
+    assert first is inner
+    assert first is not second
+    assert first.is_closed()
+    assert utils._async_client is None
+
+
+def test_call_model_records_usage(monkeypatch):
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="Once upon a time"))],
+        usage=SimpleNamespace(
+            prompt_tokens=120,
+            completion_tokens=30,
+            prompt_tokens_details=SimpleNamespace(cached_tokens=100),
+        ),
+    )
+
+    async def create(**kwargs):
+        return response
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(utils, "get_async_client", lambda: fake_client)
+    ledger = UsageLedger(max_total_tokens=0, prices={})
+
+    content = asyncio.run(utils.call_model_async("Tell me a story", model="test-model", stage="generate", usage=ledger))
+
+    assert content == "Once upon a time"
+    assert ledger.by_stage["generate"].total_tokens == 150
+    assert utils.LLM_TOKENS.value(model="test-model", stage="generate", kind="prompt") >= 120
+    assert utils.LLM_TOKENS.value(model="test-model", stage="generate", kind="cached_prompt") >= 100
+
+
+def test_call_model_uses_stage_profile(monkeypatch):
+    requests = []
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content="{}"), finish_reason="length")],
+        usage=SimpleNamespace(prompt_tokens=40, completion_tokens=150),
+    )
+
+    async def create(**kwargs):
+        requests.append(kwargs)
+        return response
+
+    fake_client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(utils, "get_async_client", lambda: fake_client)
+    profile = utils.get_stage_profile("classify")
+    observed = []
+    monkeypatch.setattr(utils.output_token_tuner, "observe", lambda *args, **kwargs: observed.append((args, kwargs)))
+
+    asyncio.run(utils.call_model_async("Classify this", stage="classify"))
+    asyncio.run(utils.call_model_async("Classify this", stage="classify", max_tokens=20, temperature=0.5, stop=["END"]))
+
+    assert requests[0]["model"] == profile.model
+    assert requests[0]["max_tokens"] == profile.max_tokens
+    assert requests[0]["temperature"] == profile.temperature
+    assert "stop" not in requests[0]
+    assert (requests[1]["max_tokens"], requests[1]["temperature"], requests[1]["stop"]) == (20, 0.5, ["END"])
+    assert observed[0] == (("classify", 150), {"truncated": True})
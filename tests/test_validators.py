@@ -1,3 +1,5 @@
+import pytest
+
 from src.validators import (
     MIN_WORDS,
     MAX_WORDS,
@@ -5,6 +7,10 @@ from src.validators import (
     validate_story_length,
     has_positive_ending,
     validate_final_story,
+    check_story_length,
+    run_pre_judge_checks,
+    check_banned_terms,
+    BannedTermMatcher,
 )
 
 
@@ -45,3 +51,50 @@ def test_validate_final_story_passes():
     is_valid, error = validate_final_story(story, judge_result)
     assert is_valid
     assert error == ""
+
+
+def test_check_story_length_reports_word_delta():
+    assert check_story_length("word " * MIN_WORDS) is None
+    assert "too short by 10 words" in check_story_length("word " * (MIN_WORDS - 10))
+    assert "too long by 120 words" in check_story_length("word " * (MAX_WORDS + 120))
+
+
+def test_run_pre_judge_checks_stops_at_first_failure():
+    story = ("word " * MIN_WORDS) + "\nThe end."
+    passed, rule, feedback = run_pre_judge_checks(story)
+    assert not passed
+    assert rule == "positive_ending"
+    assert feedback
+
+    custom_rules = [("always_ok", lambda _story: None)]
+    assert run_pre_judge_checks(story, rules=custom_rules) == (True, "", "")
+
+
+def test_validate_user_input_ignores_banned_substrings():
+    assert validate_user_input("A story about a skill that was begun long ago")[0]
+    assert not validate_user_input("A story about two GUNS")[0]
+    assert not validate_user_input("A story about killing time")[0]
+
+
+@pytest.mark.parametrize(
+    "text",
+    ["a sexual story", "a suicidal bunny", "a murderous fox", "gunfire at night", "bloodthirsty wolf"],
+)
+def test_validate_user_input_blocks_derived_and_compound_forms(text):
+    assert not validate_user_input(text)[0]
+
+
+def test_banned_term_matcher_from_file(tmp_path):
+    blocklist = tmp_path / "blocklist.txt"
+    blocklist.write_text("# one term per line\nscary clown\nmonster  # trailing comment\n\n")
+    matcher = BannedTermMatcher.from_file(str(blocklist))
+
+    assert matcher.terms == ["monster", "scary clown"]
+    assert matcher.search("A very Scary\n clown appears") == "scary\n clown"
+    assert matcher.find_all("monsters and a scary clown") == ["monsters", "scary clown"]
+    assert matcher.search("A friendly clown") is None
+
+
+def test_check_banned_terms_lists_found_terms():
+    assert check_banned_terms("The dragon shared a warm blanket.") is None
+    assert "blood, weapons" in check_banned_terms("There was blood and weapons.")